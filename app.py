@@ -2,6 +2,8 @@ from PyQt5.QtWidgets import QApplication
 import sys, logging
 from comic_viewer.ui.main_window import MainWindow
 from comic_viewer.config import ensure_dirs, APP_NAME
+from comic_viewer.state import flush_state
+from comic_viewer.helper_pool import HELPER_POOL
 
 def main():
     ensure_dirs()
@@ -19,7 +21,10 @@ def main():
     app.setOrganizationName(APP_NAME)
     win = MainWindow()
     win.show()
-    sys.exit(app.exec_())
+    rc = app.exec_()
+    flush_state()
+    HELPER_POOL.shutdown()
+    sys.exit(rc)
 
 if __name__ == "__main__":
     main()
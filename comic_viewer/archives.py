@@ -0,0 +1,272 @@
+import json
+import logging
+import shutil
+import subprocess
+import tempfile
+import threading
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from .config import SCRATCH_DIR, HELPER_LIST_TIMEOUT, HELPER_EXTRACT_TIMEOUT, HELPER_EXTRACT_ALL_TIMEOUT
+from .helper_pool import HELPER_POOL
+from .utils import detect_unar, detect_lsar
+
+try:  # leitor RAR em processo (opcional): pip install libarchive-c
+    import libarchive
+except Exception:  # ImportError ou a libarchive do sistema ausente
+    libarchive = None
+
+log = logging.getLogger("archives")
+
+UNAR_PATH = detect_unar()
+LSAR_PATH = detect_lsar()
+
+
+class ArchiveReader:
+    """
+    Leitura de arquivos que não são zip (.cbr e afins).
+    Entradas são dicts com 'name', 'index', 'size' e, se o backend souber,
+    'csize' e 'offset'. 'index' só tem sentido para o próprio backend.
+    """
+
+    name = "base"
+    can_list = True
+
+    def list_entries(self, archive: Path) -> List[Dict]:
+        raise NotImplementedError
+
+    def extract_entries(self, archive: Path, out_dir: Path, entries: List[Dict]) -> None:
+        """Extrai as entradas para out_dir, preservando os caminhos internos."""
+        raise NotImplementedError
+
+    def extract_all(self, archive: Path, out_dir: Path) -> None:
+        raise NotImplementedError
+
+    def extract_stream(self, archive: Path, out_dir: Path, entries: List[Dict],
+                       on_entry: Callable[[Dict], None], should_stop: Callable[[], bool] = lambda: False) -> None:
+        """
+        Extrai as entradas numa única passada pelo arquivo, chamando on_entry(entrada)
+        conforme cada uma fica completa no disco. Padrão: extrai tudo e avisa no fim.
+        """
+        self.extract_entries(archive, out_dir, entries)
+        for e in entries:
+            on_entry(e)
+
+    def read_entry(self, archive: Path, entry: Dict) -> bytes:
+        raise NotImplementedError
+
+
+# ---------- jobs do unar/lsar (rodam no HELPER_POOL) ----------
+def _run_tool(cmd: List[str], timeout: float, action: str) -> bytes:
+    try:
+        proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        raise RuntimeError(f"Tempo esgotado ({timeout:.0f}s) ao {action}: {cmd[-1]}")
+    if proc.returncode != 0:
+        raise RuntimeError(f"Falha ao {action}: {proc.stderr.decode('utf-8', errors='ignore')}")
+    return proc.stdout
+
+
+def _lsar_job(lsar: str, archive: str) -> List[Dict]:
+    out = _run_tool([lsar, "-json", archive], HELPER_LIST_TIMEOUT, "listar")
+    data = json.loads(out.decode("utf-8", errors="ignore"))
+    items = data.get("lsarContents") or data.get("files") or []
+    entries: List[Dict] = []
+    for pos, it in enumerate(items):
+        name = it.get("XADFileName") or it.get("Name") or it.get("name")
+        if not name or it.get("XADIsDirectory"):
+            continue
+        entries.append({
+            "name": name,
+            "index": int(it.get("XADIndex", pos)),
+            "size": int(it.get("XADFileSize") or 0),
+            "csize": it.get("XADCompressedSize"),
+            "offset": it.get("XADDataOffset"),
+        })
+    return entries
+
+
+def _unar_job(unar: str, archive: str, out_dir: str, indexes: List[str], timeout: float) -> None:
+    cmd = [unar, "-quiet", "-force-overwrite", "-no-directory"]
+    if indexes:
+        cmd.append("-indexes")
+    cmd += ["-output-directory", out_dir, archive] + indexes
+    _run_tool(cmd, timeout, "extrair")
+
+
+def _read_entry_job(unar: str, archive: str, entry: Dict, scratch: str) -> bytes:
+    # pasta temporária só deste job: vários workers leem em paralelo
+    Path(scratch).mkdir(parents=True, exist_ok=True)
+    tmpdir = Path(tempfile.mkdtemp(prefix="entry-", dir=scratch))
+    try:
+        _unar_job(unar, archive, str(tmpdir), [str(entry["index"])], HELPER_EXTRACT_TIMEOUT)
+        direct = tmpdir / entry["name"]
+        if direct.is_file():
+            return direct.read_bytes()
+        # o unar às vezes normaliza nomes: procura pelo basename, depois qualquer arquivo
+        matches = list(tmpdir.rglob(Path(entry["name"]).name)) or \
+            sorted((p for p in tmpdir.rglob("*") if p.is_file()), key=lambda p: p.as_posix().lower())
+        if matches:
+            return matches[0].read_bytes()
+        raise RuntimeError(f"unar não produziu '{entry['name']}'")
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+class UnarCliReader(ArchiveReader):
+    """
+    Backend CLI: 'lsar -json' para listar e 'unar' para extrair.
+    Cada chamada vira um job no HELPER_POOL, que limita quantos rodam ao mesmo tempo.
+    """
+
+    name = "unar"
+
+    def __init__(self):
+        self.can_list = bool(LSAR_PATH)
+
+    def list_entries(self, archive: Path) -> List[Dict]:
+        if not LSAR_PATH:
+            raise RuntimeError("Ferramenta 'lsar' não encontrada. Instale com: brew install unar")
+        return HELPER_POOL.run(_lsar_job, LSAR_PATH, str(archive), timeout=HELPER_LIST_TIMEOUT)
+
+    def extract_entries(self, archive: Path, out_dir: Path, entries: List[Dict]) -> None:
+        HELPER_POOL.run(_unar_job, UNAR_PATH, str(archive), str(out_dir),
+                        [str(e["index"]) for e in entries], HELPER_EXTRACT_TIMEOUT, timeout=HELPER_EXTRACT_TIMEOUT)
+
+    def extract_all(self, archive: Path, out_dir: Path) -> None:
+        HELPER_POOL.run(_unar_job, UNAR_PATH, str(archive), str(out_dir), [], HELPER_EXTRACT_ALL_TIMEOUT,
+                        timeout=HELPER_EXTRACT_ALL_TIMEOUT)
+
+    def extract_stream(self, archive: Path, out_dir: Path, entries: List[Dict],
+                       on_entry: Callable[[Dict], None], should_stop: Callable[[], bool] = lambda: False) -> None:
+        """
+        Um único 'unar -indexes' com todas as entradas (o arquivo é lido uma vez, mesmo
+        sendo sólido). Enquanto ele roda, a pasta é olhada e as entradas que já chegaram
+        com o tamanho certo são avisadas; as demais, no fim. O unar não é interrompido
+        por 'should_stop' (tem o próprio timeout); só os avisos param.
+        """
+        pending = {e["name"]: e for e in entries}
+        errors: List[Exception] = []
+
+        def job():
+            try:
+                HELPER_POOL.run(_unar_job, UNAR_PATH, str(archive), str(out_dir),
+                                [str(e["index"]) for e in entries], HELPER_EXTRACT_ALL_TIMEOUT,
+                                timeout=HELPER_EXTRACT_ALL_TIMEOUT)
+            except Exception as e:
+                errors.append(e)
+
+        def poll():
+            for name, e in list(pending.items()):
+                try:
+                    size = (out_dir / name).stat().st_size
+                except OSError:
+                    continue
+                if e["size"] and size == e["size"]:
+                    on_entry(pending.pop(name))
+
+        worker = threading.Thread(target=job, name="unar-stream", daemon=True)
+        worker.start()
+        while worker.is_alive():
+            worker.join(0.25)
+            if not should_stop():
+                poll()
+        if errors:
+            raise errors[0]
+        if not should_stop():
+            for e in pending.values():
+                on_entry(e)  # sem tamanho conhecido ou nome normalizado: quem chamou confere
+
+    def read_entry(self, archive: Path, entry: Dict) -> bytes:
+        return HELPER_POOL.run(_read_entry_job, UNAR_PATH, str(archive), entry, str(SCRATCH_DIR),
+                               timeout=HELPER_EXTRACT_TIMEOUT)
+
+
+class LibarchiveReader(ArchiveReader):
+    """Backend em processo via libarchive (RAR 4/5, 7z, tar…): sem fork/exec por chamada."""
+
+    name = "libarchive"
+
+    def list_entries(self, archive: Path) -> List[Dict]:
+        out: List[Dict] = []
+        with libarchive.file_reader(str(archive)) as arc:
+            for pos, entry in enumerate(arc):
+                if entry.isfile:
+                    out.append({"name": entry.pathname, "index": pos, "size": entry.size,
+                                "csize": None, "offset": None})
+        return out
+
+    def _iter_wanted(self, archive: Path, entries: Iterable[Dict]):
+        wanted = {e["name"] for e in entries}
+        with libarchive.file_reader(str(archive)) as arc:
+            for entry in arc:
+                if not wanted:
+                    return
+                if entry.isfile and entry.pathname in wanted:
+                    wanted.discard(entry.pathname)
+                    yield entry
+
+    def _write(self, out_dir: Path, entry) -> None:
+        dest = (out_dir / entry.pathname).resolve()
+        if out_dir.resolve() not in dest.parents:
+            log.warning(f"[ARCHIVE] ignorando caminho fora da pasta: {entry.pathname}")
+            return
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        with open(dest, "wb") as f:
+            for block in entry.get_blocks():
+                f.write(block)
+
+    def extract_entries(self, archive: Path, out_dir: Path, entries: List[Dict]) -> None:
+        for entry in self._iter_wanted(archive, entries):
+            self._write(out_dir, entry)
+
+    def extract_all(self, archive: Path, out_dir: Path) -> None:
+        with libarchive.file_reader(str(archive)) as arc:
+            for entry in arc:
+                if entry.isfile:
+                    self._write(out_dir, entry)
+
+    def extract_stream(self, archive: Path, out_dir: Path, entries: List[Dict],
+                       on_entry: Callable[[Dict], None], should_stop: Callable[[], bool] = lambda: False) -> None:
+        by_name = {e["name"]: e for e in entries}
+        with libarchive.file_reader(str(archive)) as arc:
+            for entry in arc:
+                if not by_name or should_stop():
+                    return
+                if entry.isfile and entry.pathname in by_name:
+                    self._write(out_dir, entry)
+                    on_entry(by_name.pop(entry.pathname))
+
+    def read_entry(self, archive: Path, entry: Dict) -> bytes:
+        for found in self._iter_wanted(archive, [entry]):
+            return b"".join(found.get_blocks())
+        raise RuntimeError(f"Entrada não encontrada: {entry['name']}")
+
+
+# ---------- registro ----------
+# kind -> [(prioridade, fábrica)]; a fábrica devolve None quando o backend não está disponível
+_REGISTRY: Dict[str, List[Tuple[int, Callable[[], Optional[ArchiveReader]]]]] = {}
+_CHOSEN: Dict[str, Optional[ArchiveReader]] = {}
+
+
+def register_reader(kind: str, priority: int, factory: Callable[[], Optional[ArchiveReader]]) -> None:
+    _REGISTRY.setdefault(kind, []).append((priority, factory))
+    _REGISTRY[kind].sort(key=lambda t: -t[0])
+    _CHOSEN.pop(kind, None)
+
+
+def reader_for(kind: str = "rar") -> Optional[ArchiveReader]:
+    """Backend de maior prioridade disponível para o tipo, ou None."""
+    if kind not in _CHOSEN:
+        chosen = None
+        for _, factory in _REGISTRY.get(kind, []):
+            chosen = factory()
+            if chosen is not None:
+                break
+        _CHOSEN[kind] = chosen
+        log.debug(f"[ARCHIVE] leitor para '{kind}': {chosen.name if chosen else 'nenhum'}")
+    return _CHOSEN[kind]
+
+
+register_reader("rar", 20, lambda: LibarchiveReader() if libarchive is not None else None)
+register_reader("rar", 10, lambda: UnarCliReader() if UNAR_PATH else None)
@@ -1,11 +1,61 @@
+import os
 from pathlib import Path
 
 APP_NAME = "CBRReaderPy"
 DEFAULT_LIBRARY = Path.home() / "CBRLibrary"
 APP_SUPPORT = Path.home() / "Library" / "Application Support" / APP_NAME
-STATE_FILE = APP_SUPPORT / "state.json"
+STATE_FILE = APP_SUPPORT / "state.json"  # formato antigo; migrado para STATE_DB
+STATE_DB = APP_SUPPORT / "state.db"
 MSAL_CACHE_FILE = APP_SUPPORT / "msal_cache.bin"
 
+# Leitor: teto de memória para páginas já decodificadas (prefetch)
+READER_IMAGE_CACHE_BYTES = 512 * 1024 * 1024
+# ...e para páginas já escaladas para (zoom, tamanho da janela)
+READER_SCALED_CACHE_BYTES = 128 * 1024 * 1024
+# ...e para os tiles de páginas grandes (zoom alto)
+READER_TILE_CACHE_BYTES = 96 * 1024 * 1024
+
+# Cache de extrações em disco (APP_SUPPORT/tmp); pode ser sobrescrito por 'extract_cache_max_mb' no estado
+EXTRACT_CACHE_DIR = APP_SUPPORT / "tmp"
+EXTRACT_CACHE_MAX_BYTES = 4 * 1024 * 1024 * 1024
+# pastas temporárias de uso único (extração de uma entrada, jobs de miniatura)
+SCRATCH_DIR = APP_SUPPORT / "scratch"
+
+# Jobs de lsar/unar: quantos ao mesmo tempo ('helper_workers' no estado), timeout de cada
+# job e quanto um pedido aceita esperar na fila além disso, em segundos
+HELPER_WORKERS = max(2, min(8, os.cpu_count() or 2))
+HELPER_LIST_TIMEOUT = 30
+HELPER_EXTRACT_TIMEOUT = 120
+HELPER_EXTRACT_ALL_TIMEOUT = 900
+HELPER_QUEUE_TIMEOUT = 120
+# Processos do motor de miniaturas ('thumb_workers' no estado)
+THUMB_WORKERS = os.cpu_count() or 2
+# Miniaturas empacotadas (thumbnails/thumbs.pack + index.db); 'thumb_cache_max_mb' no estado
+THUMBS_DIR = APP_SUPPORT / "thumbnails"
+THUMB_STORE_MAX_BYTES = 256 * 1024 * 1024
+# Índice da biblioteca (arquivos e pastas já varridos), carregado na abertura
+LIBRARY_DB = APP_SUPPORT / "library.db"
+# Watcher da biblioteca: espera sem eventos antes de revarrer as pastas avisadas, teto
+# dessa espera numa rajada contínua, e intervalo de revarredura em montagens de rede
+LIBRARY_WATCH_DEBOUNCE_MS = 500
+LIBRARY_WATCH_MAX_DELAY_MS = 3000
+LIBRARY_POLL_INTERVAL_MS = 30_000
+# Biblioteca: teto de memória para os ícones já montados na grade
+LIBRARY_ICON_CACHE_BYTES = 64 * 1024 * 1024
+# Busca: espera depois da última tecla antes de filtrar a lista
+SEARCH_DEBOUNCE_MS = 150
+
+# Sincronização: tamanho dos blocos gravados em disco durante um download
+DOWNLOAD_CHUNK_BYTES = 1024 * 1024
+# ...quantos downloads ao mesmo tempo ('sync_workers' no estado) e novas tentativas por arquivo,
+# com espera exponencial (segundos) entre elas quando o servidor não manda Retry-After
+SYNC_WORKERS = 4
+SYNC_MAX_ATTEMPTS = 5
+SYNC_BACKOFF_BASE = 1.0
+SYNC_BACKOFF_MAX = 60.0
+# Conexões mantidas abertas (keep-alive) por host em cada cliente de nuvem
+HTTP_POOL_SIZE = 8
+
 GDRIVE_CREDENTIALS_FILE = APP_SUPPORT / "gdrive_credentials.json"  # JSON do OAuth Client (Desktop)
 GDRIVE_TOKEN_FILE = APP_SUPPORT / "gdrive_token.json"              # token salvo após login
 GDRIVE_SCOPES = ["https://www.googleapis.com/auth/drive.readonly"] # só leitura
@@ -25,6 +75,9 @@ SCOPES = [
     "https://graph.microsoft.com/Files.Read",
 ]
 
+# Endpoint do Microsoft Graph (COMIC_VIEWER_GRAPH_BASE aponta para outro servidor, ex.: um de teste)
+GRAPH_BASE = os.environ.get("COMIC_VIEWER_GRAPH_BASE", "https://graph.microsoft.com/v1.0").rstrip("/")
+
 def ensure_dirs():
     APP_SUPPORT.mkdir(parents=True, exist_ok=True)
     DEFAULT_LIBRARY.mkdir(parents=True, exist_ok=True)
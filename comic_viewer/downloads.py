@@ -0,0 +1,113 @@
+import logging
+import os
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+import requests
+
+from .config import DOWNLOAD_CHUNK_BYTES
+
+log = logging.getLogger("downloads")
+
+# (bytes já no disco, total esperado ou 0); pode levantar DownloadCancelled para parar
+ProgressFn = Callable[[int, int], None]
+
+
+class DownloadCancelled(Exception):
+    """Download interrompido a pedido; o .part fica no disco para ser retomado."""
+
+
+def part_path(dest: Path) -> Path:
+    """Arquivo parcial de 'dest' (a biblioteca só enxerga .cbr/.cbz, então ele fica invisível)."""
+    return dest.with_name(dest.name + ".part")
+
+
+def _etag_path(dest: Path) -> Path:
+    return dest.with_name(dest.name + ".part.etag")
+
+
+def _discard_partial(dest: Path) -> None:
+    for p in (part_path(dest), _etag_path(dest)):
+        try: p.unlink()
+        except OSError: pass
+
+
+def _stored_etag(dest: Path) -> Optional[str]:
+    try:
+        return _etag_path(dest).read_text(encoding="utf-8").strip() or None
+    except OSError:
+        return None
+
+
+def stream_to_file(get: Callable[[Dict[str, str]], requests.Response], dest: Path,
+                   expected_size: Optional[int] = None, progress: Optional[ProgressFn] = None) -> Path:
+    """
+    Baixa para 'dest' em blocos, sem segurar o arquivo na memória: escreve em
+    'dest.part' e só renomeia (os.replace) no fim. Um .part de uma tentativa anterior
+    só é retomado se houver o ETag daquela resposta: pede o resto com Range e If-Range
+    (versão diferente -> o servidor manda o arquivo inteiro e recomeça do zero). Sem
+    ETag guardado, o .part é descartado. Um .part já do tamanho esperado também passa
+    pelo servidor (pede o último byte de novo) antes de virar 'dest'.
+    'get(headers)' faz a requisição com stream=True e os headers extras.
+    """
+    part = part_path(dest)
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    while True:
+        offset = part.stat().st_size if part.exists() else 0
+        etag = _stored_etag(dest) if offset else None
+        if offset and (not etag or (expected_size and offset > expected_size)):
+            log.info(f"[DL] {dest.name}: .part sem ETag válido; recomeçando do zero")
+            _discard_partial(dest)
+            offset = 0
+        # .part completo: o último byte vem de novo só para o servidor confirmar a versão
+        start = min(offset, expected_size - 1) if expected_size and offset else offset
+        headers: Dict[str, str] = {"Range": f"bytes={start}-", "If-Range": etag} if start else {}
+
+        with get(headers) as r:
+            got_etag = r.headers.get("ETag")
+            if start and r.status_code == 416:
+                # nada depois de 'start' (tamanho desconhecido): só vale se for a mesma versão
+                if got_etag == etag:
+                    break
+                log.info(f"[DL] {dest.name}: .part de outra versão; recomeçando do zero")
+                _discard_partial(dest)
+                continue
+            r.raise_for_status()
+            if start and r.status_code == 206 and got_etag and got_etag != etag:
+                log.info(f"[DL] {dest.name}: ETag mudou; recomeçando do zero")
+                _discard_partial(dest)
+                continue
+            if start and r.status_code != 206:
+                log.info(f"[DL] {dest.name}: servidor mandou o arquivo inteiro; recomeçando do zero")
+                start = 0
+            elif start:
+                log.info(f"[DL] {dest.name}: retomando em {start} bytes")
+            if not start:
+                _discard_partial(dest)
+                if got_etag:
+                    _etag_path(dest).write_text(got_etag, encoding="utf-8")
+            total = expected_size or 0
+            if not total and r.headers.get("Content-Length"):
+                total = start + int(r.headers["Content-Length"])
+            done = start
+            with open(part, "r+b" if start else "wb") as f:
+                f.truncate(start)
+                f.seek(start)
+                for chunk in r.iter_content(DOWNLOAD_CHUNK_BYTES):
+                    if not chunk:
+                        continue
+                    f.write(chunk)
+                    done += len(chunk)
+                    if progress:
+                        progress(done, total)
+        break
+
+    got = part.stat().st_size if part.exists() else 0
+    if expected_size and got != expected_size:
+        if got > expected_size:
+            _discard_partial(dest)
+        raise RuntimeError(f"Download incompleto de {dest.name}: {got} de {expected_size} bytes")
+    os.replace(part, dest)
+    try: _etag_path(dest).unlink()
+    except OSError: pass
+    return dest
@@ -0,0 +1,122 @@
+import logging
+import shutil
+import threading
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from .config import EXTRACT_CACHE_DIR, EXTRACT_CACHE_MAX_BYTES
+from .utils import archive_fingerprint
+
+log = logging.getLogger("extract_cache")
+
+COMPLETE_MARKER = ".complete"   # extração completa; guarda o total de bytes
+USED_MARKER = ".last_used"      # mtime = último uso (ordem do LRU)
+
+
+class ExtractionCache:
+    """
+    Cache em disco das extrações, uma pasta por fingerprint (caminho, mtime, tamanho).
+    Pastas em uso (contagem de referências) nunca são removidas; as demais são
+    apagadas da menos usada para a mais usada quando o total passa da cota.
+    """
+
+    def __init__(self, root: Path, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._refs: Dict[str, int] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def dir_for(self, archive: Path) -> Path:
+        return self.root / archive_fingerprint(archive)
+
+    def acquire(self, archive: Path) -> Path:
+        """Reserva (e cria, se preciso) a pasta de extração do arquivo."""
+        out_dir = self.dir_for(archive)
+        with self._lock:
+            self._refs[out_dir.name] = self._refs.get(out_dir.name, 0) + 1
+            self._locks.setdefault(out_dir.name, threading.Lock())
+        out_dir.mkdir(parents=True, exist_ok=True)
+        self._touch(out_dir)
+        return out_dir
+
+    def release(self, out_dir: Path) -> None:
+        with self._lock:
+            n = self._refs.get(out_dir.name, 0) - 1
+            if n > 0:
+                self._refs[out_dir.name] = n
+            else:
+                self._refs.pop(out_dir.name, None)
+        self._touch(out_dir)
+        self.trim()
+
+    def lock_for(self, out_dir: Path) -> threading.Lock:
+        """Lock compartilhado por todos que extraem para a mesma pasta."""
+        with self._lock:
+            return self._locks.setdefault(out_dir.name, threading.Lock())
+
+    def is_complete(self, out_dir: Path) -> bool:
+        return (out_dir / COMPLETE_MARKER).exists()
+
+    def mark_complete(self, out_dir: Path) -> None:
+        try:
+            (out_dir / COMPLETE_MARKER).write_text(str(self._walk_size(out_dir)), encoding="utf-8")
+        except Exception as e:
+            log.debug(f"[CACHE] falha ao marcar {out_dir.name} como completa: {e}")
+
+    # ---------- cota / LRU ----------
+    def _touch(self, out_dir: Path) -> None:
+        try:
+            (out_dir / USED_MARKER).touch()
+        except Exception:
+            pass
+
+    def _walk_size(self, d: Path) -> int:
+        total = 0
+        for p in d.rglob("*"):
+            try:
+                if p.is_file():
+                    total += p.stat().st_size
+            except OSError:
+                pass
+        return total
+
+    def _entry_size(self, d: Path) -> int:
+        try:
+            return int((d / COMPLETE_MARKER).read_text(encoding="utf-8"))
+        except Exception:
+            return self._walk_size(d)
+
+    def _last_used(self, d: Path) -> float:
+        try:
+            return (d / USED_MARKER).stat().st_mtime
+        except OSError:
+            return d.stat().st_mtime
+
+    def trim(self) -> None:
+        if not self.root.exists():
+            return
+        entries: List[Tuple[float, Path, int]] = []
+        for d in self.root.iterdir():
+            if d.is_dir():
+                try:
+                    entries.append((self._last_used(d), d, self._entry_size(d)))
+                except OSError:
+                    pass
+        total = sum(size for _, _, size in entries)
+        if total <= self.max_bytes:
+            return
+        entries.sort(key=lambda e: e[0])
+        with self._lock:
+            in_use = set(self._refs)
+        for _, d, size in entries:
+            if total <= self.max_bytes:
+                break
+            if d.name in in_use:
+                continue
+            shutil.rmtree(d, ignore_errors=True)
+            total -= size
+            log.info(f"[CACHE] removida extração {d.name} ({size // (1024*1024)} MB)")
+
+
+EXTRACT_CACHE = ExtractionCache(EXTRACT_CACHE_DIR, EXTRACT_CACHE_MAX_BYTES)
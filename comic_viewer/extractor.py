@@ -1,44 +1,66 @@
-import subprocess
 from pathlib import Path
-from typing import List
-from .config import APP_SUPPORT
-from .utils import detect_unar
-
-UNAR_PATH = detect_unar()
+from typing import Callable, Dict, List, Optional
+from .archives import ArchiveReader, reader_for
+from .extract_cache import EXTRACT_CACHE
 
 class CBRExtractor:
+    """Extração de .cbr e afins pelo leitor registrado em archives (libarchive ou unar/lsar)."""
+
     @staticmethod
-    def extract(archive_path: Path) -> Path:
-        if not UNAR_PATH:
+    def reader() -> ArchiveReader:
+        reader = reader_for("rar")
+        if reader is None:
             raise RuntimeError("Ferramenta 'unar' não encontrada. Instale com: brew install unar")
+        return reader
+
+    @staticmethod
+    def reader_name() -> Optional[str]:
+        reader = reader_for("rar")
+        return reader.name if reader else None
 
-        tmp_root = APP_SUPPORT / "tmp"
-        tmp_root.mkdir(parents=True, exist_ok=True)
-        out_dir = tmp_root / archive_path.stem
-
-        # limpar pasta anterior
-        if out_dir.exists():
-            for p in out_dir.rglob("*"):
-                try:
-                    p.unlink()
-                except IsADirectoryError:
-                    pass
-                except Exception:
-                    pass
-            for p in sorted(out_dir.rglob("*"), reverse=True):
-                if p.is_dir():
-                    try:
-                        p.rmdir()
-                    except Exception:
-                        pass
-        out_dir.mkdir(parents=True, exist_ok=True)
-
-        cmd = [UNAR_PATH, "-quiet", "-force-overwrite", "-output-directory", str(out_dir), str(archive_path)]
-        proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        if proc.returncode != 0:
-            raise RuntimeError(f"Falha ao extrair: {proc.stderr.decode('utf-8', errors='ignore')}")
+    @staticmethod
+    def can_list() -> bool:
+        reader = reader_for("rar")
+        return reader is not None and reader.can_list
+
+    @staticmethod
+    def extract(archive_path: Path, out_dir: Optional[Path] = None) -> Path:
+        """Extrai o arquivo inteiro para a pasta do cache (reaproveitada se já estiver completa)."""
+        reader = CBRExtractor.reader()
+        out_dir = out_dir or EXTRACT_CACHE.dir_for(archive_path)
+        with EXTRACT_CACHE.lock_for(out_dir):
+            if EXTRACT_CACHE.is_complete(out_dir):
+                return out_dir
+            out_dir.mkdir(parents=True, exist_ok=True)
+            reader.extract_all(archive_path, out_dir)
+            EXTRACT_CACHE.mark_complete(out_dir)
         return out_dir
 
+    @staticmethod
+    def list_entries(archive_path: Path) -> List[Dict]:
+        """
+        Lista as entradas do arquivo sem extrair nada.
+        Cada item traz 'name', 'index' (próprio do leitor), 'size',
+        e, quando o leitor informa, 'csize' e 'offset' dos dados dentro do arquivo.
+        """
+        return CBRExtractor.reader().list_entries(archive_path)
+
+    @staticmethod
+    def extract_entries(archive_path: Path, out_dir: Path, entries: List[Dict]) -> None:
+        """Extrai só as entradas pedidas para out_dir, preservando os caminhos internos."""
+        CBRExtractor.reader().extract_entries(archive_path, out_dir, entries)
+
+    @staticmethod
+    def extract_stream(archive_path: Path, out_dir: Path, entries: List[Dict],
+                       on_entry: Callable[[Dict], None], should_stop: Callable[[], bool] = lambda: False) -> None:
+        """Extrai as entradas numa única passada pelo arquivo, avisando cada uma que fica pronta."""
+        CBRExtractor.reader().extract_stream(archive_path, out_dir, entries, on_entry, should_stop)
+
+    @staticmethod
+    def read_entry(archive_path: Path, entry: Dict) -> bytes:
+        """Bytes de uma única entrada, sem tocar no cache de extrações."""
+        return CBRExtractor.reader().read_entry(archive_path, entry)
+
     @staticmethod
     def list_images(dir_path: Path) -> List[Path]:
         exts = {".jpg", ".jpeg", ".png", ".webp"}
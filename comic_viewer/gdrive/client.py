@@ -1,16 +1,54 @@
 from __future__ import annotations
-from typing import Dict, Iterable, Optional, List
+import logging
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, Optional, List, Tuple
+from google.auth.transport.requests import AuthorizedSession
+from google_auth_httplib2 import AuthorizedHttp
 from PyQt5.QtWidgets import QWidget
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 
 from .auth import load_credentials_silent, interactive_login, save_credentials
 from ..config import GDRIVE_SCOPES
+from ..downloads import ProgressFn, stream_to_file
+from ..http_pool import ConnectionStats, CountingHttp, pooled_session
+
+log = logging.getLogger("gdrive")
+
+FOLDER_MIME = "application/vnd.google-apps.folder"
+
+
+class ChangesExpired(RuntimeError):
+    """O pageToken guardado não vale mais: é preciso percorrer a pasta de novo."""
+
+
+def _token_rejected(e: HttpError) -> bool:
+    """
+    O erro é o cursor recusado? 404/410 sempre; 400 só quando aponta o pageToken
+    (ex.: "Invalid Value" com location=pageToken). Outros 400 são erro de verdade.
+    """
+    status = int(e.resp.status)
+    if status in (404, 410):
+        return True
+    if status != 400:
+        return False
+    details = e.error_details if isinstance(e.error_details, list) else []
+    if any(isinstance(d, dict) and d.get("location") == "pageToken" for d in details):
+        return True
+    text = f"{e.reason} {e.error_details}".lower()
+    return "pagetoken" in text or "page token" in text
 
 class GDriveClient:
     def __init__(self, state: dict):
         self.state = state
         self.creds = load_credentials_silent()
+        self.http_stats = ConnectionStats()
+        self._services: List[Tuple[object, object]] = []  # (credencial, serviço) livres para reuso
+        self._services_lock = threading.Lock()
+        self._session: Optional[AuthorizedSession] = None
+        self._session_lock = threading.Lock()
 
     def ensure_creds(self, parent: QWidget):
         if self.creds:
@@ -18,13 +56,46 @@ class GDriveClient:
         self.creds = interactive_login(parent)
         return self.creds
 
-    def _service(self):
-        return build("drive", "v3", credentials=self.creds, cache_discovery=False)
+    @contextmanager
+    def _service(self) -> Iterator:
+        """
+        Empresta um serviço do Drive do pool do cliente. Cada um tem seu httplib2 com
+        a conexão mantida aberta; o httplib2 não é thread-safe, então um serviço só
+        atende uma thread por vez e volta ao pool depois (sobrevive às threads de sync).
+        """
+        creds = self.creds
+        svc = None
+        with self._services_lock:
+            while self._services and svc is None:
+                owner, candidate = self._services.pop()
+                if owner is creds:
+                    svc = candidate  # os de credenciais antigas são descartados
+        if svc is None:
+            http = AuthorizedHttp(creds, http=CountingHttp(self.http_stats, timeout=60))
+            svc = build("drive", "v3", http=http, cache_discovery=False)
+        try:
+            yield svc
+        finally:
+            with self._services_lock:
+                if creds is self.creds:
+                    self._services.append((creds, svc))
+
+    def _authorized_session(self) -> AuthorizedSession:
+        """Sessão HTTP compartilhada pelos downloads (pool de conexões com keep-alive)."""
+        with self._session_lock:
+            if self._session is None or self._session.credentials is not self.creds:
+                if self._session is not None:
+                    self._session.close()
+                self._session = pooled_session(self.http_stats, AuthorizedSession(self.creds))
+            return self._session
+
+    def connection_stats(self) -> Dict[str, int]:
+        return self.http_stats.snapshot()
 
     def account_label(self) -> str:
         try:
-            svc = self._service()
-            about = svc.about().get(fields="user(displayName,emailAddress)").execute()
+            with self._service() as svc:
+                about = svc.about().get(fields="user(displayName,emailAddress)").execute()
             u = about.get("user", {})
             name = u.get("displayName") or ""
             email = u.get("emailAddress") or ""
@@ -34,33 +105,32 @@ class GDriveClient:
 
     # pasta raiz e filhos
     def list_children(self, folder_id: Optional[str]) -> List[Dict]:
-        svc = self._service()
         # Monta a query base
         parent = "root" if folder_id in (None, "root") else folder_id
         q = f"'{parent}' in parents and trashed=false"
         fields = "nextPageToken, files(id,name,mimeType,size,driveId)"
         page_token = None
         out: List[Dict] = []
-        while True:
-            resp = svc.files().list(
-                q=q,
-                fields=fields,
-                pageToken=page_token,
-                pageSize=200,
-                includeItemsFromAllDrives=True,  # <<< importante
-                supportsAllDrives=True  # <<< importante
-            ).execute()
-            out.extend(resp.get("files", []))
-            page_token = resp.get("nextPageToken")
-            if not page_token:
-                break
+        with self._service() as svc:
+            while True:
+                resp = svc.files().list(
+                    q=q,
+                    fields=fields,
+                    pageToken=page_token,
+                    pageSize=200,
+                    includeItemsFromAllDrives=True,  # <<< importante
+                    supportsAllDrives=True  # <<< importante
+                ).execute()
+                out.extend(resp.get("files", []))
+                page_token = resp.get("nextPageToken")
+                if not page_token:
+                    break
         # pastas primeiro, depois por nome
         out.sort(key=lambda f: (f["mimeType"] != "application/vnd.google-apps.folder", f["name"].lower()))
         return out
 
     def iter_cbr_files(self, folder_id: str, recursive: bool = True) -> Iterable[Dict]:
         stack = [folder_id or "root"]
-        svc = self._service()
         while stack:
             fid = stack.pop()
             for f in self.list_children(fid):
@@ -71,15 +141,87 @@ class GDriveClient:
                     if name.endswith(".cbr") or name.endswith(".cbz"):
                         yield f
 
-    def download_file(self, file_id: str) -> bytes:
-        svc = self._service()
-        # arquivos binários “normais” usam files().get_media; Google Docs precisam export, mas .cbr/.cbz são binários
-        from googleapiclient.http import MediaIoBaseDownload
-        import io
-        req = svc.files().get_media(fileId=file_id)
-        fh = io.BytesIO()
-        downloader = MediaIoBaseDownload(fh, req, chunksize=1024*1024)
-        done = False
-        while not done:
-            status, done = downloader.next_chunk()
-        return fh.getvalue()
+    # mudanças (changes.list)
+    def start_page_token(self) -> str:
+        """Cursor de "agora" no feed de mudanças; pegar ANTES de percorrer as pastas."""
+        with self._service() as svc:
+            resp = svc.changes().getStartPageToken(supportsAllDrives=True).execute()
+        return resp["startPageToken"]
+
+    def changes(self, page_token: str) -> Tuple[List[Dict], str]:
+        """
+        Mudanças desde 'page_token' (todas as páginas) e o cursor para a próxima vez.
+        Levanta ChangesExpired se o cursor for recusado.
+        """
+        fields = ("nextPageToken, newStartPageToken, "
+                  "changes(fileId, removed, file(id,name,mimeType,size,parents,trashed))")
+        out: List[Dict] = []
+        token = page_token
+        while True:
+            try:
+                with self._service() as svc:
+                    resp = svc.changes().list(
+                        pageToken=token, fields=fields, pageSize=1000, spaces="drive",
+                        includeItemsFromAllDrives=True, supportsAllDrives=True,
+                    ).execute()
+            except HttpError as e:
+                if _token_rejected(e):
+                    raise ChangesExpired(f"Cursor do Google Drive recusado: {e}")
+                raise
+            out.extend(resp.get("changes", []))
+            if resp.get("newStartPageToken"):
+                log.info(f"[GDRIVE] {len(out)} mudanças desde o último cursor")
+                return out, resp["newStartPageToken"]
+            token = resp.get("nextPageToken")
+            if not token:
+                raise ChangesExpired("O Google Drive não devolveu um novo cursor.")
+
+    def folder_checker(self, folder_id: str, recursive: bool = True):
+        """
+        Função parents -> bool que diz se um item com esses pais está em 'folder_id'
+        (ou, com 'recursive', em qualquer subpasta dela). Sobe pelos pais com
+        files.get, guardando cada pasta já resolvida (a maioria das mudanças cai em
+        pastas repetidas).
+        """
+        if folder_id in (None, "root"):
+            with self._service() as svc:
+                folder_id = svc.files().get(fileId="root", fields="id").execute()["id"]
+        if not recursive:
+            return lambda parents: folder_id in (parents or [])
+        inside: Dict[str, bool] = {folder_id: True}
+
+        def resolve(fid: str) -> bool:
+            chain: List[str] = []
+            found = False
+            while fid not in inside:
+                chain.append(fid)
+                try:
+                    with self._service() as svc:
+                        meta = svc.files().get(fileId=fid, fields="id,parents", supportsAllDrives=True).execute()
+                except HttpError as e:
+                    if e.resp.status != 404:
+                        raise
+                    break  # sem acesso à pasta: não está na nossa árvore
+                parents = meta.get("parents") or []
+                if not parents:
+                    break  # chegou na raiz de um drive
+                fid = parents[0]
+            else:
+                found = inside[fid]
+            for c in chain:
+                inside[c] = found
+            return found
+
+        return lambda parents: any(resolve(p) for p in parents or [])
+
+    def download_file(self, file_id: str, dest: Path, size: Optional[int] = None,
+                      progress: Optional[ProgressFn] = None) -> Path:
+        """Baixa o arquivo direto para 'dest' (via .part, retomando com Range se interrompido)."""
+        # .cbr/.cbz são binários “normais”: alt=media (Google Docs precisariam de export)
+        url = f"https://www.googleapis.com/drive/v3/files/{file_id}"
+        session = self._authorized_session()
+
+        def get(extra: Dict[str, str]):
+            return session.get(url, params={"alt": "media", "supportsAllDrives": "true"},
+                               headers=extra, timeout=(15, 120), stream=True)
+        return stream_to_file(get, dest, size, progress)
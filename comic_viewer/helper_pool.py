@@ -0,0 +1,63 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from typing import Any, Callable, Optional
+
+from .config import HELPER_QUEUE_TIMEOUT, HELPER_WORKERS
+
+log = logging.getLogger("helpers")
+
+
+class HelperPool:
+    """
+    Limite de jobs de arquivo (lsar/unar) rodando ao mesmo tempo. Os jobs entram
+    numa fila única, seja o pedido do leitor ou das miniaturas, e no máximo
+    'max_workers' threads os executam. Cada job ainda abre o próprio processo da
+    ferramenta (subprocess, com timeout); o pool só limita quantos existem de uma
+    vez. Rodando em threads, os bytes das páginas voltam sem passar por pickle.
+    """
+
+    def __init__(self, max_workers: int):
+        self.max_workers = max_workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._closed = False
+        # dentro de um processo que já é auxiliar (ex.: motor de miniaturas) os jobs rodam ali mesmo
+        self.inline = False
+
+    def _pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Pool de jobs auxiliares encerrado")
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=max(1, self.max_workers),
+                                                    thread_name_prefix="helper")
+                log.debug(f"[HELPERS] pool iniciado com {self.max_workers} workers")
+            return self._executor
+
+    def run(self, fn: Callable[..., Any], *args: Any, timeout: float) -> Any:
+        """
+        Roda fn(*args) no pool e devolve o resultado (bloqueia a thread chamadora).
+        'timeout' é o do próprio job; a espera total também cobre até
+        HELPER_QUEUE_TIMEOUT na fila, e depois disso desiste em vez de travar quem chamou.
+        """
+        if self.inline:
+            return fn(*args)
+        future = self._pool().submit(fn, *args)
+        try:
+            return future.result(timeout=timeout + HELPER_QUEUE_TIMEOUT)
+        except FutureTimeout:
+            future.cancel()  # se ainda estava na fila, nem começa
+            log.warning(f"[HELPERS] {fn.__name__} não terminou em {timeout + HELPER_QUEUE_TIMEOUT:.0f}s")
+            raise RuntimeError(f"Tempo esgotado esperando {fn.__name__}")
+
+    def shutdown(self) -> None:
+        with self._lock:
+            self._closed = True
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+HELPER_POOL = HelperPool(HELPER_WORKERS)
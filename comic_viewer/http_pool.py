@@ -0,0 +1,100 @@
+import threading
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import httplib2
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from .config import HTTP_POOL_SIZE
+
+
+class ConnectionStats:
+    """Contadores de requisições e de conexões TCP abertas para atendê-las."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.opened = 0
+        self.requests = 0
+
+    def add(self, opened: int = 0, requests: int = 0) -> None:
+        with self._lock:
+            self.opened += opened
+            self.requests += requests
+
+    def snapshot(self) -> Dict[str, int]:
+        """'opened' conexões abertas, 'reused' requisições que usaram uma já aberta."""
+        with self._lock:
+            return {"requests": self.requests, "opened": self.opened,
+                    "reused": max(0, self.requests - self.opened)}
+
+
+def _counting(base: type, stats: ConnectionStats) -> type:
+    """Subclasse da conexão 'base' que soma em 'stats' cada connect() (inclusive reconexões)."""
+
+    class Counting(base):
+        def connect(self, *args, **kwargs):
+            result = super().connect(*args, **kwargs)
+            stats.add(opened=1)
+            return result
+
+    Counting.__name__ = f"Counting{base.__name__}"
+    return Counting
+
+
+class CountingAdapter(HTTPAdapter):
+    """
+    HTTPAdapter com keep-alive (até 'HTTP_POOL_SIZE' conexões por host, uma por
+    download simultâneo) que conta em 'stats' as requisições e as conexões abertas.
+    """
+
+    def __init__(self, stats: ConnectionStats, pool_size: int = HTTP_POOL_SIZE):
+        self.stats = stats
+        super().__init__(pool_connections=pool_size, pool_maxsize=pool_size)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        http_conn = _counting(HTTPConnection, self.stats)
+        https_conn = _counting(HTTPSConnection, self.stats)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": type("CountingHTTPPool", (HTTPConnectionPool,), {"ConnectionCls": http_conn}),
+            "https": type("CountingHTTPSPool", (HTTPSConnectionPool,), {"ConnectionCls": https_conn}),
+        }
+
+    def send(self, request, **kwargs):
+        self.stats.add(requests=1)
+        return super().send(request, **kwargs)
+
+
+def pooled_session(stats: ConnectionStats, session: Optional[requests.Session] = None) -> requests.Session:
+    """'session' (ou uma nova) com o CountingAdapter em http e https."""
+    session = session if session is not None else requests.Session()
+    adapter = CountingAdapter(stats)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+class CountingHttp(httplib2.Http):
+    """
+    httplib2.Http (transporte do googleapiclient) que conta requisições e conexões
+    abertas. O httplib2 já mantém uma conexão por host; não é thread-safe: um por thread.
+    """
+
+    def __init__(self, stats: ConnectionStats, **kwargs):
+        super().__init__(**kwargs)
+        self.stats = stats
+        self._conn_types = {scheme: _counting(cls, stats) for scheme, cls in httplib2.SCHEME_TO_CONNECTION.items()}
+
+    def request(self, uri, *args, connection_type=None, **kwargs):
+        self.stats.add(requests=1)
+        if connection_type is None:
+            connection_type = self._conn_types.get(urlsplit(uri).scheme)
+        return super().request(uri, *args, connection_type=connection_type, **kwargs)
+
+
+def describe(stats: Dict[str, int]) -> str:
+    return (f"{stats['requests']} requisições, {stats['opened']} conexões abertas, "
+            f"{stats['reused']} reaproveitadas")
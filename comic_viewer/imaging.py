@@ -0,0 +1,49 @@
+from typing import Tuple
+
+from PyQt5.QtCore import QBuffer, QByteArray, QIODevice, QRect, QSize, Qt
+from PyQt5.QtGui import QImage, QImageReader
+
+
+def _reader(data: bytes) -> Tuple[QImageReader, QBuffer]:
+    buf = QBuffer()
+    buf.setData(QByteArray(data))
+    buf.open(QIODevice.ReadOnly)
+    return QImageReader(buf), buf  # o buffer precisa viver enquanto o reader lê
+
+
+def image_size(data: bytes) -> QSize:
+    """Tamanho original lido só do cabeçalho (sem decodificar os pixels)."""
+    reader, _buf = _reader(data)
+    return reader.size()
+
+
+def decode_scaled(data: bytes, box: QSize) -> Tuple[QImage, QSize]:
+    """
+    Decodifica a imagem já reduzida para caber em 'box' (mantendo a proporção).
+    O reader recebe o tamanho final antes de ler: no JPEG isso vira escala no
+    domínio DCT (1/2, 1/4, 1/8) e a imagem cheia nunca é alocada.
+    Imagens que já cabem em 'box' são decodificadas no tamanho original.
+    Retorna (imagem, tamanho original).
+    """
+    reader, _buf = _reader(data)
+    orig = reader.size()
+    if orig.isValid() and box.isValid() and (orig.width() > box.width() or orig.height() > box.height()):
+        target = orig.scaled(box, Qt.KeepAspectRatio)
+        reader.setScaledSize(QSize(max(1, target.width()), max(1, target.height())))
+    img = reader.read()
+    if not orig.isValid() and not img.isNull():
+        orig = img.size()
+    return img, orig
+
+
+def decode_region(data: bytes, rect: QRect, size: QSize) -> QImage:
+    """
+    Decodifica só o trecho 'rect' (em coordenadas da imagem original), já em 'size'.
+    Recorte e escala vão para o reader antes de ler: o JPEG aloca só o pedaço pedido.
+    Formatos sem esse suporte leem a imagem e recortam ali mesmo; a imagem inteira
+    é temporária e nunca chega a um cache.
+    """
+    reader, _buf = _reader(data)
+    reader.setClipRect(rect)
+    reader.setScaledSize(size)
+    return reader.read()
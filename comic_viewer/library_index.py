@@ -0,0 +1,248 @@
+import logging
+import os
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from PyQt5.QtCore import QThread, pyqtSignal
+
+from .config import LIBRARY_DB
+from .utils import fingerprint_of, fold_name
+
+log = logging.getLogger("library_index")
+
+ARCHIVE_EXTS = (".cbr", ".cbz")
+
+
+def _prefix_range(root: str) -> Tuple[str, str]:
+    """Intervalo de texto que cobre tudo abaixo de 'root' (consulta por faixa, usa o índice)."""
+    prefix = root if root.endswith(os.sep) else root + os.sep
+    return prefix, prefix[:-1] + chr(ord(os.sep) + 1)
+
+
+class LibraryIndex:
+    """
+    Índice em disco da biblioteca: arquivos (caminho, tamanho, mtime, fingerprint,
+    número de páginas) e pastas (mtime de cada uma). A lista sai daqui na abertura,
+    sem varrer nada; a revarredura só relista as pastas cujo mtime mudou (entrou,
+    saiu ou foi renomeado algo ali) e apenas faz stat nas outras.
+    Arquivo reescrito no lugar não muda o mtime da pasta: 'full=True' relista tudo.
+    """
+
+    def __init__(self, db_path: Path):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS files ("
+                "path TEXT PRIMARY KEY, dir TEXT NOT NULL, name TEXT NOT NULL, "
+                "size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, fingerprint TEXT NOT NULL, pages INTEGER, "
+                "folded TEXT)"
+            )
+            if "folded" not in {r[1] for r in conn.execute("PRAGMA table_info(files)")}:
+                # índices antigos: o nome normalizado para a busca é calculado uma única vez aqui
+                conn.execute("ALTER TABLE files ADD COLUMN folded TEXT")
+                conn.executemany("UPDATE files SET folded=? WHERE path=?",
+                                 [(fold_name(name), path) for path, name in conn.execute("SELECT path, name FROM files")])
+            conn.execute("CREATE INDEX IF NOT EXISTS files_dir ON files(dir)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS dirs ("
+                "path TEXT PRIMARY KEY, parent TEXT, mtime_ns INTEGER NOT NULL)"
+            )
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    # ---------- leitura ----------
+    def files(self, root: Path) -> Tuple[List[str], List[str]]:
+        """
+        Caminhos indexados abaixo de 'root', em ordem de nome (como a lista mostra),
+        e os nomes já normalizados para a busca (fold_name), na mesma ordem.
+        """
+        lo, hi = _prefix_range(str(root))
+        with self._lock:
+            rows = self._db().execute(
+                "SELECT path, name, folded FROM files WHERE path >= ? AND path < ?", (lo, hi)).fetchall()
+        rows.sort(key=lambda r: r[1].lower())
+        return [r[0] for r in rows], [r[2] for r in rows]
+
+    def info(self, path: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._db().execute(
+                "SELECT size, mtime_ns, fingerprint, pages FROM files WHERE path=?", (path,)).fetchone()
+        if row is None:
+            return None
+        return {"size": row[0], "mtime_ns": row[1], "fingerprint": row[2], "pages": row[3]}
+
+    def fingerprints(self) -> Set[str]:
+        """Fingerprints de todos os arquivos indexados (qualquer biblioteca), para a limpeza dos caches."""
+        with self._lock:
+            return {r[0] for r in self._db().execute("SELECT fingerprint FROM files")}
+
+    def set_pages(self, path: str, pages: int) -> None:
+        with self._lock:
+            conn = self._db()
+            with conn:
+                conn.execute("UPDATE files SET pages=? WHERE path=?", (int(pages), path))
+
+    def dirs(self, root: Path) -> List[str]:
+        """Pastas indexadas de 'root' (inclusive), para o watcher."""
+        root_s = str(root)
+        lo, hi = _prefix_range(root_s)
+        with self._lock:
+            return [r[0] for r in self._db().execute(
+                "SELECT path FROM dirs WHERE path = ? OR (path >= ? AND path < ?)", (root_s, lo, hi))]
+
+    # ---------- varredura ----------
+    def rescan(self, root: Path, full: bool = False, only: Optional[List[str]] = None,
+               should_stop: Callable[[], bool] = lambda: False) -> Optional[Dict[str, List[str]]]:
+        """
+        Atualiza o índice de 'root' e devolve o que mudou: 'added', 'removed' e 'changed'
+        (arquivos), 'dirs_added' e 'dirs_removed' (pastas). Com 'only', parte só dessas
+        pastas (avisadas pelo watcher), que são relistadas mesmo sem mudança de mtime.
+        Devolve None se interrompida. Roda fora da GUI; o SQLite só é tocado no começo e no fim.
+        """
+        root_s = str(root)
+        lo, hi = _prefix_range(root_s)
+        with self._lock:
+            known = {path: (parent, mtime) for path, parent, mtime in self._db().execute(
+                "SELECT path, parent, mtime_ns FROM dirs WHERE path = ? OR (path >= ? AND path < ?)",
+                (root_s, lo, hi))}
+        children: Dict[str, List[str]] = {}
+        for path, (parent, _) in known.items():
+            if parent is not None:
+                children.setdefault(parent, []).append(path)
+
+        if only is None:
+            stack: List[Tuple[str, Optional[str]]] = [(root_s, None)]
+        else:
+            stack = [(d, None if d == root_s else os.path.dirname(d))
+                     for d in dict.fromkeys(only) if d == root_s or d.startswith(lo)]
+        forced = {d for d, _ in stack} if only is not None else set()
+
+        seen = set()
+        dir_rows: List[Tuple[str, Optional[str], int]] = []
+        listed: Dict[str, Dict[str, Tuple[int, int]]] = {}  # pasta relistada -> nome -> (tamanho, mtime)
+        while stack:
+            if should_stop():
+                log.info("[INDEX] varredura interrompida")
+                return None
+            d, parent = stack.pop()
+            try:
+                st = os.stat(d)
+            except OSError:
+                continue  # sumiu: sai do índice junto com as não vistas
+            seen.add(d)
+            old = known.get(d)
+            if not full and d not in forced and old is not None and old[1] == st.st_mtime_ns:
+                stack.extend((c, d) for c in children.get(d, ()))
+                continue
+            found: Dict[str, Tuple[int, int]] = {}
+            try:
+                with os.scandir(d) as it:
+                    for entry in it:
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                stack.append((entry.path, d))
+                            elif entry.name.lower().endswith(ARCHIVE_EXTS) and entry.is_file():
+                                est = entry.stat()
+                                found[entry.name] = (est.st_size, est.st_mtime_ns)
+                        except OSError:
+                            continue
+            except OSError as e:
+                log.warning(f"[INDEX] não consegui listar {d}: {e}")
+                stack.extend((c, d) for c in children.get(d, ()))
+                continue
+            listed[d] = found
+            dir_rows.append((d, parent, st.st_mtime_ns))
+
+        if only is None:
+            gone = [p for p in known if p not in seen]
+        else:
+            # só some o que estava abaixo das pastas pedidas
+            under = tuple(d + os.sep for d in forced)
+            gone = [p for p in known if p not in seen and (p in forced or p.startswith(under))]
+        diff: Dict[str, List[str]] = {
+            "added": [], "removed": [], "changed": [],
+            "dirs_added": [d for d, _, _ in dir_rows if d not in known],
+            "dirs_removed": gone,
+        }
+        upserts = []
+        with self._lock:
+            conn = self._db()
+            for d, found in listed.items():
+                stored = {name: (size, mtime) for name, size, mtime in conn.execute(
+                    "SELECT name, size, mtime_ns FROM files WHERE dir=?", (d,))}
+                resolved = None
+                for name, (size, mtime) in found.items():
+                    old = stored.get(name)
+                    if old == (size, mtime):
+                        continue
+                    if resolved is None:
+                        resolved = os.path.realpath(d)
+                    path = os.path.join(d, name)
+                    upserts.append((path, d, name, size, mtime,
+                                    fingerprint_of(os.path.join(resolved, name), mtime, size), fold_name(name)))
+                    diff["changed" if old is not None else "added"].append(path)
+                diff["removed"].extend(os.path.join(d, name) for name in stored if name not in found)
+            for d in gone:
+                diff["removed"].extend(r[0] for r in conn.execute("SELECT path FROM files WHERE dir=?", (d,)))
+            with conn:
+                conn.executemany(
+                    "INSERT INTO files(path, dir, name, size, mtime_ns, fingerprint, pages, folded) "
+                    "VALUES(?, ?, ?, ?, ?, ?, NULL, ?) "
+                    "ON CONFLICT(path) DO UPDATE SET size=excluded.size, mtime_ns=excluded.mtime_ns, "
+                    "fingerprint=excluded.fingerprint, pages=NULL",
+                    upserts)
+                conn.executemany("DELETE FROM files WHERE path=?", [(p,) for p in diff["removed"]])
+                conn.executemany(
+                    "INSERT INTO dirs(path, parent, mtime_ns) VALUES(?, ?, ?) "
+                    "ON CONFLICT(path) DO UPDATE SET parent=excluded.parent, mtime_ns=excluded.mtime_ns",
+                    dir_rows)
+                conn.executemany("DELETE FROM dirs WHERE path=?", [(p,) for p in gone])
+        log.info(f"[INDEX] {root_s}: {len(seen)} pastas, {len(listed)} relistadas, "
+                 f"+{len(diff['added'])} -{len(diff['removed'])} ~{len(diff['changed'])}")
+        return diff
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+LIBRARY_INDEX = LibraryIndex(LIBRARY_DB)
+
+
+class LibraryScanThread(QThread):
+    """Revarre a biblioteca (ou só as pastas em 'only') fora da GUI; 'updated' traz o diff."""
+
+    updated = pyqtSignal(dict)
+    failed = pyqtSignal(str)
+
+    def __init__(self, library_dir: Path, full: bool = False, only: Optional[List[str]] = None):
+        super().__init__()
+        self.library_dir = library_dir
+        self.full = full
+        self.only = only
+        self._stop = False
+
+    def stop(self) -> None:
+        self._stop = True
+
+    def run(self):
+        try:
+            diff = LIBRARY_INDEX.rescan(self.library_dir, self.full, self.only, lambda: self._stop)
+            if diff is not None:
+                self.updated.emit(diff)
+        except Exception as e:
+            log.error(f"[INDEX] falha varrendo {self.library_dir}: {e}")
+            self.failed.emit(str(e))
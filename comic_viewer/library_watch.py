@@ -0,0 +1,140 @@
+import logging
+import os
+import subprocess
+import time
+from pathlib import Path
+from typing import Iterable, List, Optional, Set
+
+from PyQt5.QtCore import QFileSystemWatcher, QObject, QTimer, pyqtSignal
+
+from .config import LIBRARY_POLL_INTERVAL_MS, LIBRARY_WATCH_DEBOUNCE_MS, LIBRARY_WATCH_MAX_DELAY_MS
+
+log = logging.getLogger("library_watch")
+
+# sistemas de arquivos em que eventos do kernel não chegam (ou só chegam de mudanças locais)
+NETWORK_FS = {
+    "nfs", "nfs4", "cifs", "smbfs", "smb3", "afpfs", "webdav", "davfs",
+    "9p", "fuse.sshfs", "sshfs", "fuse.rclone", "fuse.s3fs", "fuse.gvfsd-fuse",
+}
+
+
+def _mounts() -> List[tuple]:
+    """(ponto de montagem, tipo) de cada montagem; /proc/mounts no Linux, 'mount' no macOS."""
+    mounts = []
+    try:
+        with open("/proc/mounts", "r", encoding="utf-8") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 3:
+                    mounts.append((parts[1].replace("\\040", " "), parts[2]))
+        return mounts
+    except OSError:
+        pass
+    try:
+        out = subprocess.run(["mount"], capture_output=True, text=True, timeout=5).stdout
+    except (OSError, subprocess.SubprocessError):
+        return mounts
+    for line in out.splitlines():
+        # //user@host/share on /Volumes/x (smbfs, nodev, nosuid, mounted by user)
+        if " on " not in line or "(" not in line:
+            continue
+        point = line.split(" on ", 1)[1].rsplit(" (", 1)[0]
+        fstype = line.rsplit("(", 1)[1].split(",", 1)[0].strip(" )")
+        mounts.append((point, fstype))
+    return mounts
+
+
+def is_network_path(path: Path) -> bool:
+    """True se 'path' está numa montagem de rede (vale a montagem mais específica)."""
+    real = os.path.realpath(str(path))
+    best, best_type = "", ""
+    for point, fstype in _mounts():
+        if (real == point or real.startswith(point.rstrip("/") + "/")) and len(point) > len(best):
+            best, best_type = point, fstype
+    return best_type in NETWORK_FS
+
+
+class LibraryWatcher(QObject):
+    """
+    Observa as pastas da biblioteca. Localmente usa o QFileSystemWatcher (inotify,
+    FSEvents/kqueue) nas pastas do índice; as pastas avisadas ficam juntas num conjunto
+    e saem num único 'dirs_changed' depois de 'LIBRARY_WATCH_DEBOUNCE_MS' sem eventos
+    (ou no máximo 'LIBRARY_WATCH_MAX_DELAY_MS' após o primeiro, para uma sync longa não
+    segurar tudo). Em montagem de rede, ou se o sistema recusar observar as pastas
+    (limite de watches), cai para 'poll_due' a cada 'LIBRARY_POLL_INTERVAL_MS'.
+    """
+
+    dirs_changed = pyqtSignal(list)  # pastas com entradas novas, removidas ou renomeadas
+    poll_due = pyqtSignal()          # hora de revarrer (modo polling)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._fs: Optional[QFileSystemWatcher] = None
+        self._pending: Set[str] = set()
+        self._first_event = 0.0
+        self._debounce = QTimer(self)
+        self._debounce.setSingleShot(True)
+        self._debounce.setInterval(LIBRARY_WATCH_DEBOUNCE_MS)
+        self._debounce.timeout.connect(self._flush)
+        self._poll = QTimer(self)
+        self._poll.setInterval(LIBRARY_POLL_INTERVAL_MS)
+        self._poll.timeout.connect(self.poll_due.emit)
+        self.polling = False
+
+    def watch(self, root: Path, dirs: Iterable[str]) -> None:
+        """Troca o que é observado pela biblioteca em 'root' (pastas já conhecidas do índice)."""
+        self.stop()
+        if is_network_path(root):
+            log.info(f"[WATCH] {root} está numa montagem de rede; usando polling")
+            self._start_polling()
+            return
+        self._fs = QFileSystemWatcher(self)
+        self._fs.directoryChanged.connect(self._dir_changed)
+        self.add_dirs(list(dirs) or [str(root)])
+
+    def add_dirs(self, dirs: List[str]) -> None:
+        if self._fs is None or not dirs:
+            return
+        failed = self._fs.addPaths(dirs)
+        if failed:
+            log.warning(f"[WATCH] {len(failed)} pastas não puderam ser observadas; usando polling também")
+            self._start_polling()
+
+    def remove_dirs(self, dirs: List[str]) -> None:
+        if self._fs is not None and dirs:
+            watched = set(self._fs.directories())
+            gone = [d for d in dirs if d in watched]
+            if gone:
+                self._fs.removePaths(gone)
+
+    def stop(self) -> None:
+        self._debounce.stop()
+        self._poll.stop()
+        self._pending.clear()
+        self.polling = False
+        if self._fs is not None:
+            self._fs.directoryChanged.disconnect(self._dir_changed)
+            self._fs.deleteLater()
+            self._fs = None
+
+    def _start_polling(self) -> None:
+        self.polling = True
+        self._poll.start()
+
+    def _dir_changed(self, path: str) -> None:
+        if not self._pending:
+            self._first_event = time.monotonic()
+        self._pending.add(path)
+        waited_ms = (time.monotonic() - self._first_event) * 1000
+        if waited_ms >= LIBRARY_WATCH_MAX_DELAY_MS:
+            self._flush()
+        else:
+            self._debounce.start()  # reinicia a contagem a cada evento
+
+    def _flush(self) -> None:
+        self._debounce.stop()
+        if not self._pending:
+            return
+        dirs, self._pending = sorted(self._pending), set()
+        log.debug(f"[WATCH] {len(dirs)} pastas mudaram")
+        self.dirs_changed.emit(dirs)
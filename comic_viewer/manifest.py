@@ -0,0 +1,155 @@
+import json
+import logging
+import os
+import time
+import zipfile
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+from .config import APP_SUPPORT
+from .extractor import CBRExtractor
+from .utils import archive_fingerprint
+
+log = logging.getLogger("manifest")
+
+MANIFEST_DIR = APP_SUPPORT / "manifests"
+MANIFEST_VERSION = 1
+# manifestos mais novos que isso ficam no gc: o arquivo pode ainda não ter entrado no índice
+MANIFEST_GC_GRACE = 24 * 3600
+
+IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".webp", ".bmp"}
+
+
+def page_sort_key(name: str) -> str:
+    # mesma ordem de CBRExtractor.list_images: pelo nome do arquivo, sem caixa
+    return Path(name).name.lower()
+
+
+def _is_page(name: str) -> bool:
+    return Path(name).suffix.lower() in IMAGE_EXTS
+
+
+def _manifest_file(archive: Path) -> Path:
+    return MANIFEST_DIR / f"{archive_fingerprint(archive)}.json"
+
+
+def load_manifest(archive: Path) -> Optional[Dict]:
+    """
+    Manifesto salvo para o arquivo (mesmo fingerprint), ou None.
+    Formato: {"version", "kind": "zip"|"rar", "reader" (só rar), "pages": [{"name", "index", "offset",
+    "size", "csize", "method", "encrypted", "width", "height"}, ...]} já na ordem de leitura.
+    """
+    try:
+        path = _manifest_file(archive)
+        if not path.exists():
+            return None
+        data = json.loads(path.read_text(encoding="utf-8"))
+        if data.get("version") != MANIFEST_VERSION:
+            return None
+        # os índices das entradas só valem para o leitor que listou o arquivo
+        if data.get("kind") == "rar" and data.get("reader") != CBRExtractor.reader_name():
+            return None
+        return data
+    except Exception as e:
+        log.debug(f"[MANIFEST] ilegível para {archive.name}: {e}")
+        return None
+
+
+def save_manifest(archive: Path, manifest: Dict) -> None:
+    try:
+        MANIFEST_DIR.mkdir(parents=True, exist_ok=True)
+        path = _manifest_file(archive)
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")  # vários processos podem salvar
+        tmp.write_text(json.dumps(manifest, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, path)
+    except Exception as e:
+        log.debug(f"[MANIFEST] falha ao salvar para {archive.name}: {e}")
+
+
+def _zip_pages(zf: zipfile.ZipFile) -> List[Dict]:
+    pages = [
+        {
+            "name": info.filename,
+            "index": None,
+            "offset": info.header_offset,
+            "size": info.file_size,
+            "csize": info.compress_size,
+            "method": info.compress_type,
+            "encrypted": bool(info.flag_bits & 0x1),
+            "width": None,
+            "height": None,
+        }
+        for info in zf.infolist()
+        if not info.is_dir() and _is_page(info.filename)
+    ]
+    pages.sort(key=lambda p: page_sort_key(p["name"]))
+    return pages
+
+
+def _rar_pages(archive: Path) -> List[Dict]:
+    pages = [
+        {
+            "name": e["name"],
+            "index": e["index"],
+            "offset": e.get("offset"),
+            "size": e["size"],
+            "csize": e.get("csize"),
+            "method": None,
+            "encrypted": False,
+            "width": None,
+            "height": None,
+        }
+        for e in CBRExtractor.list_entries(archive)
+        if _is_page(e["name"])
+    ]
+    pages.sort(key=lambda p: page_sort_key(p["name"]))
+    return pages
+
+
+def archive_manifest(archive: Path) -> Dict:
+    """Manifesto do arquivo: lido do disco ou montado (uma única listagem) e salvo."""
+    manifest = load_manifest(archive)
+    if manifest is not None:
+        return manifest
+    if zipfile.is_zipfile(archive):
+        with zipfile.ZipFile(archive, "r") as zf:
+            manifest = {"version": MANIFEST_VERSION, "kind": "zip", "pages": _zip_pages(zf)}
+    else:
+        manifest = {"version": MANIFEST_VERSION, "kind": "rar", "reader": CBRExtractor.reader_name(),
+                    "pages": _rar_pages(archive)}
+    save_manifest(archive, manifest)
+    log.debug(f"[MANIFEST] criado para {archive.name}: {len(manifest['pages'])} páginas")
+    return manifest
+
+
+def update_dimensions(archive: Path, manifest: Dict, sizes: Dict[int, Tuple[int, int]]) -> None:
+    """Registra (largura, altura) das páginas já decodificadas, se houver algo novo."""
+    pages = manifest.get("pages", [])
+    changed = False
+    for i, (w, h) in sizes.items():
+        if 0 <= i < len(pages) and (pages[i].get("width"), pages[i].get("height")) != (w, h):
+            pages[i]["width"], pages[i]["height"] = w, h
+            changed = True
+    if changed:
+        save_manifest(archive, manifest)
+
+
+def gc_manifests(live: Set[str]) -> None:
+    """
+    Apaga os manifestos cujo fingerprint não está em 'live' (arquivo apagado, movido
+    ou alterado: o fingerprint muda junto). Sobras .tmp de gravações interrompidas também saem.
+    """
+    if not live or not MANIFEST_DIR.exists():
+        return  # índice ainda vazio (primeira varredura): não dá para saber o que é órfão
+    cutoff = time.time() - MANIFEST_GC_GRACE
+    removed = 0
+    for path in MANIFEST_DIR.iterdir():
+        try:
+            if path.name.split(".", 1)[0] in live or path.stat().st_mtime > cutoff:
+                continue
+            path.unlink()
+            removed += 1
+        except OSError:
+            pass
+    if removed:
+        log.info(f"[MANIFEST] gc: {removed} manifestos órfãos")
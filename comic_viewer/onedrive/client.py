@@ -1,17 +1,33 @@
-from typing import Optional, Dict, List
+import logging
+from pathlib import Path
+from typing import Optional, Dict, List, Tuple
 import requests
 import msal
 from PyQt5.QtWidgets import QWidget, QMessageBox
-from ..config import CLIENT_ID, SCOPES, AUTHORITIES, MSAL_CACHE_FILE
+from ..config import CLIENT_ID, SCOPES, AUTHORITIES, MSAL_CACHE_FILE, GRAPH_BASE
+from ..downloads import ProgressFn, stream_to_file
+from ..http_pool import ConnectionStats, pooled_session
 from ..state import save_state
 from .auth import TokenCache, try_authorities
 
+log = logging.getLogger("onedrive")
+
+# campos pedidos na listagem e no /delta
+ITEM_FIELDS = "id,name,folder,file,size,deleted,parentReference"
+
+
+class DeltaExpired(RuntimeError):
+    """O Graph recusou o deltaLink guardado (410): é preciso enumerar tudo de novo."""
+
 class OneDriveClient:
     def __init__(self, state: dict):
         self.state = state
         self.cache = TokenCache(MSAL_CACHE_FILE)
         auth = self.state["onedrive"].get("authority") or AUTHORITIES[0]
         self.app = msal.PublicClientApplication(client_id=CLIENT_ID, authority=auth, token_cache=self.cache.cache)
+        # uma sessão para todas as chamadas ao Graph: conexões ficam abertas entre elas
+        self.http_stats = ConnectionStats()
+        self.http = pooled_session(self.http_stats)
 
     def _reinit(self, authority: str):
         self.state["onedrive"]["authority"] = authority
@@ -36,6 +52,9 @@ class OneDriveClient:
             return self.app
         return try_authorities(parent, mk_app, self.state)
 
+    def connection_stats(self) -> Dict[str, int]:
+        return self.http_stats.snapshot()
+
     def sign_out(self):
         for acc in self.app.get_accounts():
             self.app.remove_account(acc)
@@ -46,8 +65,8 @@ class OneDriveClient:
 
     def get_profile_label(self, token: Dict) -> str:
         try:
-            r = requests.get("https://graph.microsoft.com/v1.0/me?$select=displayName,mail,userPrincipalName",
-                             headers=self._auth_headers(token), timeout=15)
+            r = self.http.get(f"{GRAPH_BASE}/me?$select=displayName,mail,userPrincipalName",
+                              headers=self._auth_headers(token), timeout=15)
             if r.ok:
                 me = r.json()
                 mail = me.get("mail") or me.get("userPrincipalName") or "conta Microsoft"
@@ -57,14 +76,43 @@ class OneDriveClient:
         return "Conectado"
 
     # navegação
+    def _pages(self, token: Dict, url: str):
+        """Páginas (JSON) de uma coleção do Graph, seguindo @odata.nextLink até o fim."""
+        while url:
+            resp = self.http.get(url, headers=self._auth_headers(token), timeout=30)
+            if resp.status_code == 410:
+                raise DeltaExpired(f"Cursor do OneDrive expirou: {resp.text[:200]}")
+            resp.raise_for_status()
+            body = resp.json()
+            yield body
+            url = body.get("@odata.nextLink")
+
     def list_children(self, token: Dict, folder_id: Optional[str]) -> List[Dict]:
         if folder_id:
-            url = f"https://graph.microsoft.com/v1.0/me/drive/items/{folder_id}/children?$select=id,name,folder,size"
+            url = f"{GRAPH_BASE}/me/drive/items/{folder_id}/children?$select={ITEM_FIELDS}"
         else:
-            url = "https://graph.microsoft.com/v1.0/me/drive/root/children?$select=id,name,folder,size"
-        resp = requests.get(url, headers=self._auth_headers(token), timeout=30)
-        resp.raise_for_status()
-        return resp.json().get("value", [])
+            url = f"{GRAPH_BASE}/me/drive/root/children?$select={ITEM_FIELDS}"
+        items: List[Dict] = []
+        for page in self._pages(token, url):
+            items.extend(page.get("value", []))
+        return items
+
+    def delta(self, token: Dict, folder_id: str, link: Optional[str] = None) -> Tuple[List[Dict], str]:
+        """
+        Itens de 'folder_id' (e subpastas) que mudaram desde 'link', ou todos se
+        'link' for None, e o novo deltaLink. Itens apagados vêm com 'deleted'.
+        Levanta DeltaExpired se o Graph pedir uma nova enumeração completa.
+        """
+        url = link or f"{GRAPH_BASE}/me/drive/items/{folder_id}/delta?$select={ITEM_FIELDS}"
+        items: List[Dict] = []
+        new_link = None
+        for page in self._pages(token, url):
+            items.extend(page.get("value", []))
+            new_link = page.get("@odata.deltaLink") or new_link
+        if not new_link:
+            raise RuntimeError("O OneDrive não devolveu um deltaLink.")
+        log.info(f"[ONEDRIVE] delta: {len(items)} itens {'alterados' if link else 'na pasta'}")
+        return items, new_link
 
     def iter_cbr_files(self, token: Dict, folder_id: str, recursive: bool = True):
         stack = [folder_id]
@@ -78,8 +126,13 @@ class OneDriveClient:
                     if name.endswith(".cbr") or name.endswith(".cbz"):
                         yield item
 
-    def download_file(self, token: Dict, item_id: str) -> bytes:
-        url = f"https://graph.microsoft.com/v1.0/me/drive/items/{item_id}/content"
-        r = requests.get(url, headers=self._auth_headers(token), timeout=180, allow_redirects=True)
-        r.raise_for_status()
-        return r.content
+    def download_file(self, token: Dict, item_id: str, dest: Path, size: Optional[int] = None,
+                      progress: Optional[ProgressFn] = None) -> Path:
+        """Baixa o item direto para 'dest' (via .part, retomando com Range se interrompido)."""
+        url = f"{GRAPH_BASE}/me/drive/items/{item_id}/content"
+
+        def get(extra: Dict[str, str]) -> requests.Response:
+            # o /content redireciona para uma URL pré-autenticada; o Range vai junto no redirect
+            return self.http.get(url, headers={**self._auth_headers(token), **extra},
+                                 timeout=(15, 120), allow_redirects=True, stream=True)
+        return stream_to_file(get, dest, size, progress)
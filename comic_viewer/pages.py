@@ -0,0 +1,413 @@
+import logging
+import struct
+import threading
+import zipfile
+import zlib
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from .extract_cache import EXTRACT_CACHE
+from .extractor import CBRExtractor
+from .manifest import archive_manifest, load_manifest, update_dimensions
+
+log = logging.getLogger("pages")
+
+
+class PageProvider:
+    """
+    Fonte de páginas de um arquivo de quadrinhos.
+    O leitor só conhece esta interface: quantas páginas existem e os bytes
+    de uma página, lidos apenas quando ela é pedida.
+    """
+
+    def __init__(self, archive_path: Path, manifest: Optional[Dict] = None):
+        self.archive_path = archive_path
+        self.manifest = manifest
+        self.names: List[str] = []
+        # chamado (de qualquer thread) quando uma página fica disponível
+        self.on_page_ready: Optional[Callable[[int], None]] = None
+
+    def open(self) -> None:
+        raise NotImplementedError
+
+    def is_ready(self, index: int) -> bool:
+        """True se read_page(index) responde sem esperar por extração."""
+        return True
+
+    def request(self, index: int) -> None:
+        """Pede que a página seja preparada com prioridade (não bloqueia)."""
+        pass
+
+    def page_count(self) -> int:
+        return len(self.names)
+
+    def page_name(self, index: int) -> str:
+        return self.names[index]
+
+    def page_dimensions(self) -> Dict[int, Tuple[int, int]]:
+        """(largura, altura) das páginas já conhecidas pelo manifesto."""
+        if not self.manifest:
+            return {}
+        return {i: (p["width"], p["height"]) for i, p in enumerate(self.manifest["pages"])
+                if p.get("width") and p.get("height")}
+
+    def save_dimensions(self, sizes: Dict[int, Tuple[int, int]]) -> None:
+        if self.manifest:
+            update_dimensions(self.archive_path, self.manifest, sizes)
+
+    def read_page(self, index: int) -> bytes:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class ZipPageProvider(PageProvider):
+    """
+    Lê as páginas direto do .cbz, sem extrair nada para o disco.
+    Com o manifesto, cada página é lida pelo offset do cabeçalho local, sem
+    reler o diretório central; zipfile fica só como fallback.
+    """
+
+    def __init__(self, archive_path: Path, manifest: Optional[Dict] = None):
+        super().__init__(archive_path, manifest)
+        self._pages: List[Dict] = []
+        self._f = None
+        self._zf: Optional[zipfile.ZipFile] = None
+        self._lock = threading.Lock()
+
+    def open(self) -> None:
+        if self.manifest is None:
+            self.manifest = archive_manifest(self.archive_path)
+        self._pages = self.manifest["pages"]
+        self.names = [p["name"] for p in self._pages]
+        self._f = open(self.archive_path, "rb")
+        log.debug(f"[ZIP] {self.archive_path.name}: {len(self.names)} páginas")
+
+    def _read_member(self, page: Dict) -> Optional[bytes]:
+        if page.get("encrypted") or page.get("method") not in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED):
+            return None
+        self._f.seek(page["offset"])
+        header = self._f.read(30)
+        if len(header) < 30 or header[:4] != b"PK\x03\x04":
+            return None
+        name_len, extra_len = struct.unpack("<HH", header[26:30])
+        self._f.seek(page["offset"] + 30 + name_len + extra_len)
+        raw = self._f.read(page["csize"])
+        data = raw if page["method"] == zipfile.ZIP_STORED else zlib.decompress(raw, -15)
+        return data if len(data) == page["size"] else None
+
+    def read_page(self, index: int) -> bytes:
+        if self._f is None:
+            raise RuntimeError("Arquivo não está aberto.")
+        page = self._pages[index]
+        with self._lock:
+            try:
+                data = self._read_member(page)
+            except (OSError, zlib.error):
+                data = None
+            if data is not None:
+                return data
+            if self._zf is None:
+                self._zf = zipfile.ZipFile(self.archive_path, "r")
+            return self._zf.read(page["name"])
+
+    def close(self) -> None:
+        with self._lock:
+            if self._zf is not None:
+                self._zf.close()
+                self._zf = None
+            if self._f is not None:
+                self._f.close()
+                self._f = None
+
+
+class ExtractedPageProvider(PageProvider):
+    """Extrai o arquivo inteiro (via cache) e serve as páginas a partir da pasta."""
+
+    def __init__(self, archive_path: Path):
+        super().__init__(archive_path)
+        self._paths: List[Path] = []
+        self.out_dir: Optional[Path] = None
+
+    def open(self) -> None:
+        self.out_dir = EXTRACT_CACHE.acquire(self.archive_path)
+        try:
+            CBRExtractor.extract(self.archive_path, self.out_dir)
+        except Exception:
+            EXTRACT_CACHE.release(self.out_dir)
+            self.out_dir = None
+            raise
+        self._paths = CBRExtractor.list_images(self.out_dir)
+        self.names = [p.relative_to(self.out_dir).as_posix() for p in self._paths]
+
+    def read_page(self, index: int) -> bytes:
+        return self._paths[index].read_bytes()
+
+    def close(self) -> None:
+        if self.out_dir is not None:
+            EXTRACT_CACHE.release(self.out_dir)
+            self.out_dir = None
+
+
+class RarPageProvider(PageProvider):
+    """
+    Extração sob demanda para .cbr (e demais formatos do leitor registrado em archives).
+    Lista as entradas uma vez (depois, pelo manifesto), extrai primeiro a página pedida e
+    preenche o resto numa thread de fundo, numa única passada pelo arquivo (num RAR
+    sólido, extrair em lotes descomprimiria o começo de novo a cada lote). Páginas
+    pedidas fora de ordem durante a passada são lidas sozinhas, direto para a memória.
+    A pasta vem do EXTRACT_CACHE: páginas já extraídas antes são reaproveitadas
+    e duas janelas do mesmo arquivo compartilham a mesma extração.
+    """
+
+    def __init__(self, archive_path: Path, manifest: Optional[Dict] = None):
+        super().__init__(archive_path, manifest)
+        self.out_dir: Optional[Path] = None
+        self._entries: List[Dict] = []
+        self._ready: Set[int] = set()
+        self._failed: Set[int] = set()
+        self._paths: Dict[int, Path] = {}
+        self._wanted: List[int] = []
+        self._jumped: Dict[int, bytes] = {}  # lidas fora de ordem, até a passada chegar nelas
+        self._jumping: Set[int] = set()
+        self._streaming = False
+        self._extract_lock = threading.Lock()  # trocado pelo lock da pasta no cache
+        self._cond = threading.Condition()
+        self._stop = False
+        self._fill_done = False
+        self._thread: Optional[threading.Thread] = None
+
+    def open(self) -> None:
+        if self.manifest is None:
+            self.manifest = archive_manifest(self.archive_path)
+        entries = self.manifest["pages"]
+        self._entries = entries
+        self.names = [e["name"] for e in entries]
+        self.out_dir = EXTRACT_CACHE.acquire(self.archive_path)
+        self._extract_lock = EXTRACT_CACHE.lock_for(self.out_dir)
+        with self._extract_lock:
+            for i in range(len(entries)):
+                path = self._existing(i)
+                if path is not None:
+                    self._ready.add(i)
+                    self._paths[i] = path
+        log.debug(f"[RAR] {self.archive_path.name}: {len(entries)} páginas, {len(self._ready)} já no cache")
+        self._thread = threading.Thread(target=self._fill, name="rar-pages", daemon=True)
+        self._thread.start()
+
+    def is_ready(self, index: int) -> bool:
+        with self._cond:
+            return index in self._ready or index in self._jumped
+
+    def request(self, index: int) -> None:
+        with self._cond:
+            if index in self._ready or index in self._jumped:
+                return
+            if not self._streaming:
+                if index not in self._wanted:
+                    self._wanted.append(index)
+                self._cond.notify_all()
+                return
+            if index in self._jumping:
+                return
+            self._jumping.add(index)
+        threading.Thread(target=self._jump, args=(index,), name="rar-jump", daemon=True).start()
+
+    def read_page(self, index: int) -> bytes:
+        with self._cond:
+            path = self._paths.get(index)
+            data = self._jumped.get(index)
+        if path is not None:
+            return path.read_bytes()
+        if data is None:
+            data = self._jump(index)
+        if data is None:
+            raise RuntimeError(f"Página não extraída: {self.names[index]}")
+        return data
+
+    def close(self) -> None:
+        with self._cond:
+            self._stop = True
+            self._cond.notify_all()
+            # se a thread de fundo ainda estiver extraindo, ela mesma libera a pasta ao sair
+            release = self._fill_done
+        if release:
+            self._release()
+
+    def _release(self) -> None:
+        if self.out_dir is not None:
+            EXTRACT_CACHE.release(self.out_dir)
+
+    # ---------- extração ----------
+    def _existing(self, i: int) -> Optional[Path]:
+        """Página já presente e completa na pasta (extraída antes, por esta ou outra janela)."""
+        entry = self._entries[i]
+        path = self.out_dir / entry["name"]
+        try:
+            if path.is_file() and (not entry["size"] or path.stat().st_size == entry["size"]):
+                return path
+        except OSError:
+            pass
+        return None
+
+    def _locate(self, name: str) -> Optional[Path]:
+        direct = self.out_dir / name
+        if direct.is_file():
+            return direct
+        # o unar às vezes normaliza nomes; procura pelo basename
+        matches = list(self.out_dir.rglob(Path(name).name))
+        return matches[0] if matches else None
+
+    def _land(self, i: int, path: Path) -> None:
+        with self._cond:
+            self._ready.add(i)
+            self._paths[i] = path
+            shown = self._jumped.pop(i, None) is not None  # já avisada pela leitura avulsa
+        if self.on_page_ready and not shown:
+            self.on_page_ready(i)
+
+    def _extract(self, indexes: List[int]) -> None:
+        """Extração avulsa (página pedida antes da passada começar)."""
+        with self._extract_lock:
+            with self._cond:
+                todo = [i for i in indexes if i not in self._ready]
+            landed = []
+            for i in list(todo):
+                path = self._existing(i)
+                if path is not None:
+                    landed.append((i, path))
+                    todo.remove(i)
+            if todo:
+                CBRExtractor.extract_entries(self.archive_path, self.out_dir,
+                                             [self._entries[i] for i in todo])
+            for i in todo:
+                path = self._locate(self._entries[i]["name"])
+                if path is not None:
+                    landed.append((i, path))
+            with self._cond:
+                self._forget(indexes, failed=[i for i in todo if i not in {j for j, _ in landed}])
+        for i, path in landed:
+            self._land(i, path)
+
+    def _stream(self, indexes: List[int]) -> None:
+        """Todas as páginas em 'indexes' numa única passada, cada uma avisada ao chegar."""
+        index_of = {self._entries[i]["name"]: i for i in indexes}
+        missing: List[int] = []
+
+        def landed(entry: Dict) -> None:
+            i = index_of.get(entry["name"])
+            if i is None:
+                return
+            path = self._existing(i)
+            if path is None:
+                missing.append(i)  # nome normalizado pelo unar: resolvido no fim
+            else:
+                self._land(i, path)
+
+        with self._extract_lock:
+            CBRExtractor.extract_stream(self.archive_path, self.out_dir,
+                                        [self._entries[i] for i in indexes], landed, lambda: self._stop)
+            if missing:
+                by_name: Dict[str, Path] = {}
+                for p in self.out_dir.rglob("*"):
+                    if p.is_file():
+                        by_name.setdefault(p.name, p)
+                for i in missing:
+                    path = by_name.get(Path(self._entries[i]["name"]).name)
+                    if path is not None:
+                        self._land(i, path)
+        with self._cond:
+            if not self._stop:
+                self._failed.update(i for i in indexes if i not in self._ready)
+
+    def _jump(self, index: int) -> Optional[bytes]:
+        """Página fora de ordem durante a passada: lida sozinha, sem esperar a passada chegar."""
+        try:
+            data = CBRExtractor.read_entry(self.archive_path, self._entries[index])
+        except Exception as e:
+            log.warning(f"[RAR] falha lendo {self.names[index]} de {self.archive_path.name}: {e}")
+            with self._cond:
+                self._jumping.discard(index)
+            return None
+        with self._cond:
+            self._jumping.discard(index)
+            notify = index not in self._ready
+            if notify:
+                self._jumped[index] = data
+        if notify and self.on_page_ready:
+            self.on_page_ready(index)
+        return data
+
+    def _forget(self, indexes: List[int], failed: List[int]) -> None:
+        # chamado com self._cond adquirido
+        self._failed.update(failed)
+        self._wanted = [i for i in self._wanted if i not in indexes]
+
+    def _fill(self) -> None:
+        try:
+            self._fill_loop()
+        finally:
+            with self._cond:
+                self._fill_done = True
+                self._streaming = False
+                release = self._stop
+            if release:
+                self._release()
+
+    def _fill_loop(self) -> None:
+        # pedidos que chegaram antes da passada (em geral, a página de abertura)
+        while True:
+            with self._cond:
+                if self._stop:
+                    return
+                if not self._wanted:
+                    break
+                target = self._wanted[-1]
+            try:
+                self._extract([target])
+            except Exception as e:
+                log.error(f"[RAR] falha extraindo a página {target} de {self.archive_path.name}: {e}")
+                with self._cond:
+                    # não insiste em páginas que falharam; read_page tenta de novo sob demanda
+                    self._forget([target], failed=[target])
+        with self._cond:
+            if self._stop:
+                return
+            remaining = [i for i in range(len(self._entries)) if i not in self._ready and i not in self._failed]
+            self._streaming = bool(remaining)
+            # quem esperava na fila passa a ser atendido fora de ordem
+            wanted, self._wanted = self._wanted, []
+        for i in wanted:
+            self.request(i)
+        if remaining:
+            try:
+                self._stream(remaining)
+            except Exception as e:
+                log.error(f"[RAR] falha extraindo {self.archive_path.name}: {e}")
+                with self._cond:
+                    self._failed.update(i for i in remaining if i not in self._ready)
+        with self._cond:
+            self._streaming = False
+            complete = len(self._ready) == len(self._entries)
+        if complete:
+            log.debug(f"[RAR] {self.archive_path.name}: todas as páginas extraídas")
+            EXTRACT_CACHE.mark_complete(self.out_dir)
+
+
+def open_page_provider(archive_path: Path) -> PageProvider:
+    """
+    Escolhe o provider pelo conteúdo (muitos .cbr são, na verdade, zips).
+    Com manifesto salvo, abrir não lista o arquivo de novo.
+    """
+    manifest = load_manifest(archive_path)
+    if manifest is None and not zipfile.is_zipfile(archive_path) and not CBRExtractor.can_list():
+        provider: PageProvider = ExtractedPageProvider(archive_path)
+    else:
+        manifest = manifest or archive_manifest(archive_path)
+        if manifest["kind"] == "zip":
+            provider = ZipPageProvider(archive_path, manifest)
+        else:
+            provider = RarPageProvider(archive_path, manifest)
+    provider.open()
+    return provider
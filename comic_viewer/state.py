@@ -1,9 +1,26 @@
+import atexit
 import json
-from pathlib import Path
-from typing import Any, Dict
-from .config import APP_SUPPORT, DEFAULT_LIBRARY
+import logging
+import sqlite3
+import threading
+import time
+from collections.abc import MutableMapping
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+from .config import APP_SUPPORT, DEFAULT_LIBRARY, EXTRACT_CACHE_MAX_BYTES, HELPER_WORKERS, STATE_DB, SYNC_WORKERS, THUMB_STORE_MAX_BYTES, THUMB_WORKERS
 
 STATE_FILE = APP_SUPPORT / "state.json"
+PROGRESS_KEY = "last_page_by_file"
+
+log = logging.getLogger("state")
+
+# save_state só marca o estado como sujo; a escrita é agrupada e feita em segundo plano
+FLUSH_DELAY = 1.0
+_lock = threading.Lock()
+_db_lock = threading.Lock()
+_pending: Optional[Dict[str, Any]] = None
+_timer: Optional[threading.Timer] = None
+_conn: Optional[sqlite3.Connection] = None
+_persisted: Dict[str, str] = {}  # chave -> JSON já gravado (só regrava o que mudou)
 
 def _default_onedrive_section():
     return {
@@ -12,6 +29,9 @@ def _default_onedrive_section():
         "include_subfolders": True,
         "account_label": None,
         "authority": None,
+        # cursor do /delta: vale só para a mesma biblioteca/pasta/recursão (delta_scope)
+        "delta_link": None,
+        "delta_scope": None,
     }
 
 def _default_gdrive_section():
@@ -20,6 +40,9 @@ def _default_gdrive_section():
         "folder_path": None,
         "include_subfolders": True,
         "account_label": None,
+        # cursor do changes.list: vale só para a mesma biblioteca/pasta/recursão (changes_scope)
+        "changes_token": None,
+        "changes_scope": None,
     }
 
 def default_state() -> Dict[str, Any]:
@@ -30,17 +53,139 @@ def default_state() -> Dict[str, Any]:
         "gdrive": _default_gdrive_section(),
         "ui_view_mode": "list",
         "ui_thumb_size": 160,
+        "extract_cache_max_mb": EXTRACT_CACHE_MAX_BYTES // (1024 * 1024),
+        "helper_workers": HELPER_WORKERS,
+        "thumb_workers": THUMB_WORKERS,
+        "thumb_cache_max_mb": THUMB_STORE_MAX_BYTES // (1024 * 1024),
+        "sync_workers": SYNC_WORKERS,
     }
 
+# ---------- SQLite ----------
+def _db() -> sqlite3.Connection:
+    global _conn
+    if _conn is None:
+        STATE_DB.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(STATE_DB), check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        conn.execute("CREATE TABLE IF NOT EXISTS progress ("
+                     "path TEXT PRIMARY KEY, page INTEGER NOT NULL, updated_at REAL NOT NULL)")
+        conn.commit()
+        _conn = conn
+    return _conn
+
+def _upsert_settings(conn: sqlite3.Connection, rows: Dict[str, str]) -> None:
+    conn.executemany(
+        "INSERT INTO settings(key, value) VALUES(?, ?) "
+        "ON CONFLICT(key) DO UPDATE SET value=excluded.value",
+        list(rows.items()))
+
+def _upsert_progress(conn: sqlite3.Connection, rows: Dict[str, int]) -> None:
+    now = time.time()
+    conn.executemany(
+        "INSERT INTO progress(path, page, updated_at) VALUES(?, ?, ?) "
+        "ON CONFLICT(path) DO UPDATE SET page=excluded.page, updated_at=excluded.updated_at",
+        [(path, int(page), now) for path, page in rows.items()])
+
+def _migrate_json(conn: sqlite3.Connection) -> None:
+    """Importa o state.json antigo uma única vez (banco vazio) e o renomeia."""
+    if not STATE_FILE.exists() or conn.execute("SELECT 1 FROM settings LIMIT 1").fetchone():
+        return
+    try:
+        with open(STATE_FILE, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except Exception as e:
+        log.error(f"[STATE] state.json ilegível, ignorando migração: {e}")
+        return
+    progress = data.pop(PROGRESS_KEY, None) or {}
+    with conn:
+        _upsert_settings(conn, {k: json.dumps(v, ensure_ascii=False) for k, v in data.items()})
+        _upsert_progress(conn, progress)
+    STATE_FILE.replace(STATE_FILE.with_name(STATE_FILE.name + ".migrated"))
+    log.info(f"[STATE] migrado state.json -> {STATE_DB.name} ({len(progress)} progressos)")
+
+
+class ReadingProgress(MutableMapping):
+    """
+    last_page_by_file apoiado no SQLite: cada leitura consulta só a chave pedida e
+    as alterações ficam pendentes até o próximo flush (um upsert por arquivo alterado).
+    """
+
+    def __init__(self):
+        self._dirty: Dict[str, int] = {}
+        self._deleted: Set[str] = set()
+        self._lock = threading.Lock()
+
+    def __getitem__(self, path: str) -> int:
+        with self._lock:
+            if path in self._dirty:
+                return self._dirty[path]
+            if path in self._deleted:
+                raise KeyError(path)
+        with _db_lock:
+            row = _db().execute("SELECT page FROM progress WHERE path=?", (path,)).fetchone()
+        if row is None:
+            raise KeyError(path)
+        return row[0]
+
+    def __setitem__(self, path: str, page: int) -> None:
+        with self._lock:
+            self._dirty[path] = int(page)
+            self._deleted.discard(path)
+
+    def __delitem__(self, path: str) -> None:
+        self[path]  # KeyError se não existir
+        with self._lock:
+            self._dirty.pop(path, None)
+            self._deleted.add(path)
+
+    def _keys(self) -> List[str]:
+        with _db_lock:
+            rows = _db().execute("SELECT path FROM progress").fetchall()
+        with self._lock:
+            keys = {r[0] for r in rows} | set(self._dirty)
+            return [k for k in keys if k not in self._deleted]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._keys())
+
+    def __len__(self) -> int:
+        return len(self._keys())
+
+    def take_changes(self) -> Tuple[Dict[str, int], Set[str]]:
+        with self._lock:
+            dirty, deleted = self._dirty, self._deleted
+            self._dirty, self._deleted = {}, set()
+        return dirty, deleted
+
+    def restore_changes(self, pages: Dict[str, int], deleted: Set[str]) -> None:
+        """Devolve alterações de um flush que falhou, sem passar por cima das feitas depois."""
+        with self._lock:
+            for path, page in pages.items():
+                if path not in self._dirty and path not in self._deleted:
+                    self._dirty[path] = page
+            for path in deleted:
+                if path not in self._dirty:
+                    self._deleted.add(path)
+
+
 def load_state() -> Dict[str, Any]:
     base = default_state()
-    if STATE_FILE.exists():
-        try:
-            with open(STATE_FILE, "r", encoding="utf-8") as f:
-                data = json.load(f)
-            base.update(data)
-        except Exception:
-            pass
+    try:
+        with _db_lock:
+            conn = _db()
+            _migrate_json(conn)
+            rows = conn.execute("SELECT key, value FROM settings").fetchall()
+        for key, value in rows:
+            try:
+                base[key] = json.loads(value)
+            except ValueError:
+                pass
+            _persisted[key] = value
+    except Exception as e:
+        log.error(f"[STATE] falha ao abrir {STATE_DB}: {e}")
+    base[PROGRESS_KEY] = ReadingProgress()
     # garante seções
     od = base.setdefault("onedrive", _default_onedrive_section())
     for k, v in _default_onedrive_section().items():
@@ -51,6 +196,55 @@ def load_state() -> Dict[str, Any]:
     return base
 
 def save_state(state: Dict[str, Any]) -> None:
-    STATE_FILE.parent.mkdir(parents=True, exist_ok=True)
-    with open(STATE_FILE, "w", encoding="utf-8") as f:
-        json.dump(state, f, indent=2, ensure_ascii=False)
+    """Agenda a gravação do estado; várias chamadas seguidas viram uma única escrita."""
+    global _pending, _timer
+    with _lock:
+        _pending = state
+        if _timer is None:
+            _timer = threading.Timer(FLUSH_DELAY, flush_state)
+            _timer.daemon = True
+            _timer.start()
+
+def flush_state() -> None:
+    """Grava agora o estado pendente (chamado pelo timer e no encerramento)."""
+    global _pending, _timer
+    with _lock:
+        state, _pending = _pending, None
+        if _timer is not None:
+            _timer.cancel()
+            _timer = None
+    if state is None:
+        return
+    try:
+        settings = {k: json.dumps(v, ensure_ascii=False) for k, v in state.items() if k != PROGRESS_KEY}
+    except RuntimeError:
+        # o dict mudou durante a serialização (GUI gravando); tenta de novo no próximo ciclo
+        save_state(state)
+        return
+    changed = {k: v for k, v in settings.items() if _persisted.get(k) != v}
+
+    progress = state.get(PROGRESS_KEY)
+    deleted: Set[str] = set()
+    if isinstance(progress, ReadingProgress):
+        pages, deleted = progress.take_changes()
+    else:
+        pages = dict(progress or {})
+
+    if not changed and not pages and not deleted:
+        return
+    try:
+        with _db_lock:
+            conn = _db()
+            with conn:
+                _upsert_settings(conn, changed)
+                _upsert_progress(conn, pages)
+                conn.executemany("DELETE FROM progress WHERE path=?", [(p,) for p in deleted])
+        _persisted.update(changed)
+    except Exception as e:
+        log.error(f"[STATE] falha ao gravar {STATE_DB}: {e}")
+        # as configurações voltam sozinhas (_persisted não mudou); o progresso precisa ser devolvido
+        if isinstance(progress, ReadingProgress):
+            progress.restore_changes(pages, deleted)
+        save_state(state)
+
+atexit.register(flush_state)
@@ -1,42 +1,82 @@
-import time
+import logging
 from pathlib import Path
-from typing import Optional
-from PyQt5.QtCore import QThread, pyqtSignal
-from .onedrive.client import OneDriveClient
+from typing import Dict, Iterable, List, Optional, Tuple
+import requests
+from .config import SYNC_WORKERS
+from .downloads import ProgressFn
+from .onedrive.client import DeltaExpired, OneDriveClient
+from .state import save_state
+from .sync_engine import SyncEngine
 
-class OneDriveSyncThread(QThread):
-    progress = pyqtSignal(int, int, str)
-    finished_ok = pyqtSignal(int)
-    failed = pyqtSignal(str)
+log = logging.getLogger("sync")
 
-    def __init__(self, od: OneDriveClient, library_dir: Path, folder_id: str, recursive: bool):
-        super().__init__()
+class OneDriveSyncThread(SyncEngine):
+    """
+    Sincronização do OneDrive pelo /delta: a primeira vez enumera a pasta inteira
+    (em páginas grandes), as seguintes só pedem o que mudou desde o deltaLink
+    guardado em state["onedrive"]. O cursor só avança quando tudo foi baixado.
+    """
+
+    service = "OneDrive"
+
+    def __init__(self, od: OneDriveClient, library_dir: Path, folder_id: str, recursive: bool,
+                 workers: int = SYNC_WORKERS):
+        super().__init__(library_dir, workers)
         self.od = od
-        self.library_dir = library_dir
         self.folder_id = folder_id
         self.recursive = recursive
+        self.token: Optional[Dict] = None
+        self._cursor: Optional[Tuple[str, str]] = None  # (escopo, deltaLink) a gravar no fim
+
+    def authenticate(self) -> bool:
+        self.token = self.od.ensure_token(None)
+        return bool(self.token)
+
+    def _scope(self) -> str:
+        return f"{self.library_dir}|{self.folder_id}|{int(self.recursive)}"
 
-    def run(self):
-        token = self.od.ensure_token(None)
-        if not token:
-            self.failed.emit("Não autenticado no OneDrive."); return
+    def _wanted(self, item: Dict) -> bool:
+        if item.get("deleted") or item.get("folder") or "name" not in item:
+            return False
+        if not item["name"].lower().endswith((".cbr", ".cbz")):
+            return False
+        return self.recursive or (item.get("parentReference") or {}).get("id") == self.folder_id
+
+    def list_items(self) -> Iterable[Dict]:
+        section = self.od.state["onedrive"]
+        scope = self._scope()
+        link = section.get("delta_link") if section.get("delta_scope") == scope else None
         try:
-            items = list(self.od.iter_cbr_files(token, self.folder_id, self.recursive))
-            total = len(items); done = 0; downloaded = 0
-            existing = {p.name: p.stat().st_size for p in self.library_dir.glob("**/*") if p.suffix.lower() in (".cbr", ".cbz")}
-            for it in items:
-                done += 1
-                name = it["name"]; size = int(it.get("size", 0))
-                dest = self.library_dir / name
-                self.progress.emit(done, total, f"{done}/{total} verificando {name}")
-                if dest.exists() and dest.stat().st_size == size and name in existing:
-                    continue
-                self.progress.emit(done, total, f"{done}/{total} baixando {name}")
-                data = self.od.download_file(token, it["id"])
-                dest.parent.mkdir(parents=True, exist_ok=True)
-                with open(dest, "wb") as f: f.write(data)
-                downloaded += 1
-                time.sleep(0.02)
-            self.finished_ok.emit(downloaded)
-        except Exception as e:
-            self.failed.emit(str(e))
+            try:
+                items, new_link = self.od.delta(self.token, self.folder_id, link)
+            except DeltaExpired:
+                log.info("[SYNC] cursor do OneDrive expirou; enumerando a pasta de novo")
+                items, new_link = self.od.delta(self.token, self.folder_id, None)
+        except requests.HTTPError as e:
+            # contas corporativas só aceitam /delta na raiz do drive: volta a percorrer as pastas
+            status = e.response.status_code if e.response is not None else None
+            if status not in (400, 403, 404, 501) or link:
+                raise
+            log.info(f"[SYNC] /delta indisponível nesta pasta ({status}); percorrendo as pastas")
+            self._cursor = None
+            return list(self.od.iter_cbr_files(self.token, self.folder_id, self.recursive))
+        self._cursor = (scope, new_link)
+        # o mesmo item pode aparecer mais de uma vez no delta: vale a última versão
+        latest = {it["id"]: it for it in items}
+        files: List[Dict] = [it for it in latest.values() if self._wanted(it)]
+        return files
+
+    def connection_stats(self) -> Optional[Dict[str, int]]:
+        return self.od.connection_stats()
+
+    def commit(self) -> None:
+        if self._cursor is None:
+            return
+        section = self.od.state["onedrive"]
+        section["delta_scope"], section["delta_link"] = self._cursor
+        save_state(self.od.state)
+
+    def download(self, item: Dict, dest: Path, progress: ProgressFn) -> None:
+        # sync longa: o MSAL devolve o token do cache ou renova se ele venceu no meio
+        token = self.od._get_token_silent() or self.token
+        self.od.download_file(token, item["id"], dest, int(item.get("size") or 0) or None, progress)
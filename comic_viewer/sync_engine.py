@@ -0,0 +1,223 @@
+import email.utils
+import logging
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, TypeVar
+
+import requests
+from PyQt5.QtCore import QThread, pyqtSignal
+
+from .config import SYNC_BACKOFF_BASE, SYNC_BACKOFF_MAX, SYNC_MAX_ATTEMPTS, SYNC_WORKERS
+from .downloads import DownloadCancelled, ProgressFn
+from .http_pool import describe
+
+log = logging.getLogger("sync")
+
+T = TypeVar("T")
+
+# respostas que valem nova tentativa (limite de taxa e falhas passageiras do servidor)
+RETRY_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+def _status_and_headers(exc: BaseException):
+    """(status, headers) de um erro HTTP do requests ou do googleapiclient; (None, {}) se não for HTTP."""
+    resp = getattr(exc, "response", None)  # requests.HTTPError
+    if resp is not None and hasattr(resp, "status_code"):
+        return resp.status_code, resp.headers
+    resp = getattr(exc, "resp", None)      # googleapiclient.errors.HttpError
+    if resp is not None and hasattr(resp, "status"):
+        return int(resp.status), resp
+    return None, {}
+
+
+def retry_after(headers) -> Optional[float]:
+    """Segundos pedidos pelo servidor em Retry-After (número ou data HTTP)."""
+    value = headers.get("Retry-After") or headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+def retry_delay(exc: BaseException, attempt: int) -> Optional[float]:
+    """
+    Quanto esperar antes da tentativa 'attempt + 1', ou None se o erro não for
+    passageiro. Retry-After manda quando vem; senão, espera exponencial com jitter.
+    """
+    status, headers = _status_and_headers(exc)
+    if status is not None:
+        if status not in RETRY_STATUS:
+            return None
+        asked = retry_after(headers)
+        if asked is not None:
+            return min(asked, SYNC_BACKOFF_MAX)
+    elif not isinstance(exc, (requests.ConnectionError, requests.Timeout,
+                              requests.exceptions.ChunkedEncodingError, ConnectionError, TimeoutError)):
+        return None
+    backoff = min(SYNC_BACKOFF_MAX, SYNC_BACKOFF_BASE * (2 ** attempt))
+    return random.uniform(backoff / 2, backoff)
+
+
+class SyncEngine(QThread):
+    """
+    Base das sincronizações com a nuvem: lista os arquivos remotos (list_items),
+    descarta os que já estão na biblioteca e baixa o resto em até 'workers'
+    transferências simultâneas (download), cada uma com novas tentativas.
+    'cancel()' para tudo entre um bloco e outro; os .part ficam para a próxima vez.
+    """
+
+    progress = pyqtSignal(int, int, str)      # arquivos concluídos, total, mensagem
+    file_progress = pyqtSignal(str, int, int)  # nome, bytes, total (0 se desconhecido)
+    bytes_progress = pyqtSignal(int, int)      # bytes de todos os downloads, total
+    finished_ok = pyqtSignal(int)              # arquivos novos
+    cancelled = pyqtSignal(int)                # arquivos novos até o cancelamento
+    failed = pyqtSignal(str)
+
+    service = "nuvem"
+
+    def __init__(self, library_dir: Path, workers: int = SYNC_WORKERS):
+        super().__init__()
+        self.library_dir = library_dir
+        self.workers = max(1, int(workers))
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+        self._bytes: Dict[str, int] = {}
+
+    # ---------- a implementar ----------
+    def authenticate(self) -> bool:
+        raise NotImplementedError
+
+    def list_items(self) -> Iterable[Dict]:
+        """Itens remotos com 'id', 'name' e 'size'."""
+        raise NotImplementedError
+
+    def download(self, item: Dict, dest: Path, progress: ProgressFn) -> None:
+        raise NotImplementedError
+
+    def connection_stats(self) -> Optional[Dict[str, int]]:
+        """Conexões abertas/reaproveitadas pelo cliente (diagnóstico, vai para o log no fim)."""
+        return None
+
+    def commit(self) -> None:
+        """Chamado só quando todos os downloads deram certo (ex.: gravar o cursor de mudanças)."""
+
+    def is_current(self, item: Dict, dest: Path) -> bool:
+        size = int(item.get("size") or 0)
+        return dest.exists() and dest.stat().st_size == size
+
+    # ---------- controle ----------
+    def cancel(self) -> None:
+        self._cancel.set()
+
+    def is_cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    def with_retry(self, fn: Callable[[], T], what: str) -> T:
+        """Chama 'fn' até dar certo, esperando entre as tentativas (a espera também é cancelável)."""
+        attempt = 0
+        while True:
+            if self._cancel.is_set():
+                raise DownloadCancelled(what)
+            try:
+                return fn()
+            except DownloadCancelled:
+                raise
+            except Exception as e:
+                attempt += 1
+                delay = retry_delay(e, attempt - 1) if attempt < SYNC_MAX_ATTEMPTS else None
+                if delay is None:
+                    raise
+                log.warning(f"[SYNC] {what}: {e}; tentativa {attempt + 1} em {delay:.1f}s")
+                if self._cancel.wait(delay):
+                    raise DownloadCancelled(what)
+
+    # ---------- execução ----------
+    def run(self):
+        try:
+            if not self.authenticate():
+                self.failed.emit(f"Não autenticado no {self.service}."); return
+            items = self.with_retry(lambda: list(self.list_items()), "listagem")
+            pending: List[tuple] = []
+            seen = set()
+            for it in items:
+                dest = self.library_dir / it["name"]
+                if dest.name in seen:
+                    # mesmo nome em duas pastas remotas: ambos iriam para o mesmo arquivo
+                    log.info(f"[SYNC] {it['name']} repetido na nuvem; mantendo o primeiro")
+                    continue
+                seen.add(dest.name)
+                if not self.is_current(it, dest):
+                    pending.append((it, dest))
+            self._transfer_all(pending, len(items))
+        except DownloadCancelled:
+            self.cancelled.emit(0)
+        except Exception as e:
+            log.error(f"[SYNC] {self.service}: {e}")
+            self.failed.emit(str(e))
+        finally:
+            stats = self.connection_stats()
+            if stats:
+                log.info(f"[HTTP] {self.service}: {describe(stats)}")
+
+    def _transfer_all(self, pending: List[tuple], listed: int) -> None:
+        total = len(pending)
+        total_bytes = sum(int(it.get("size") or 0) for it, _ in pending)
+        if not total:
+            self.progress.emit(listed, listed, "Nada novo para baixar.")
+            self.commit()
+            self.finished_ok.emit(0); return
+        self.progress.emit(0, total, f"0/{total} baixando…")
+
+        def one(it: Dict, dest: Path) -> None:
+            name = it["name"]
+
+            def progress(done: int, size: int) -> None:
+                if self._cancel.is_set():
+                    raise DownloadCancelled(name)
+                with self._lock:
+                    self._bytes[name] = done
+                    all_done = sum(self._bytes.values())
+                self.file_progress.emit(name, done, size)
+                self.bytes_progress.emit(all_done, total_bytes)
+
+            self.with_retry(lambda: self.download(it, dest, progress), name)
+
+        done = 0
+        errors: List[str] = []
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="sync") as pool:
+            futures = {pool.submit(one, it, dest): it["name"] for it, dest in pending}
+            while futures:
+                finished, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for fut in finished:
+                    name = futures.pop(fut)
+                    try:
+                        fut.result()
+                    except DownloadCancelled:
+                        continue
+                    except Exception as e:
+                        log.error(f"[SYNC] {name}: {e}")
+                        errors.append(f"{name}: {e}")
+                        continue
+                    done += 1
+                    self.progress.emit(done, total, f"{done}/{total} concluído {name}")
+                if self._cancel.is_set():
+                    for fut in futures:
+                        fut.cancel()  # os que nem começaram
+        if self._cancel.is_set():
+            self.cancelled.emit(done)
+        elif errors:
+            more = f" (+{len(errors) - 1})" if len(errors) > 1 else ""
+            self.failed.emit(f"{done} de {total} baixados; falhou {errors[0]}{more}")
+        else:
+            self.commit()
+            self.finished_ok.emit(done)
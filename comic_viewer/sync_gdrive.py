@@ -1,39 +1,94 @@
+import logging
 from pathlib import Path
-from typing import Optional
-from PyQt5.QtCore import QThread, pyqtSignal
-from .gdrive.client import GDriveClient
+from typing import Dict, Iterable, List, Optional, Tuple
+from .config import SYNC_WORKERS
+from .downloads import ProgressFn
+from .gdrive.client import FOLDER_MIME, ChangesExpired, GDriveClient
+from .state import save_state
+from .sync_engine import SyncEngine
 
-class GDriveSyncThread(QThread):
-    progress = pyqtSignal(int, int, str)
-    finished_ok = pyqtSignal(int)
-    failed = pyqtSignal(str)
+log = logging.getLogger("sync")
 
-    def __init__(self, gd: GDriveClient, library_dir: Path, folder_id: str, recursive: bool):
-        super().__init__()
+class GDriveSyncThread(SyncEngine):
+    """
+    Sincronização do Google Drive: a primeira vez percorre a pasta inteira e guarda
+    um cursor (changes.getStartPageToken) em state["gdrive"]; as seguintes só leem
+    o changes.list desde esse cursor e ficam com o que caiu abaixo da pasta escolhida.
+    Se o cursor expirar, volta a percorrer tudo. O cursor só avança quando tudo foi baixado.
+    """
+
+    service = "Google Drive"
+
+    def __init__(self, gd: GDriveClient, library_dir: Path, folder_id: str, recursive: bool,
+                 workers: int = SYNC_WORKERS):
+        super().__init__(library_dir, workers)
         self.gd = gd
-        self.library_dir = library_dir
         self.folder_id = folder_id
         self.recursive = recursive
+        self._cursor: Optional[Tuple[str, str]] = None  # (escopo, pageToken) a gravar no fim
+
+    def authenticate(self) -> bool:
+        return bool(self.gd.ensure_creds(None))
+
+    def _scope(self) -> str:
+        return f"{self.library_dir}|{self.folder_id or 'root'}|{int(self.recursive)}"
+
+    def list_items(self) -> Iterable[Dict]:
+        section = self.gd.state["gdrive"]
+        scope = self._scope()
+        token = section.get("changes_token") if section.get("changes_scope") == scope else None
+        if token:
+            try:
+                changes, new_token = self.gd.changes(token)
+            except ChangesExpired as e:
+                log.info(f"[SYNC] {e}; percorrendo a pasta de novo")
+            else:
+                items = self._changed_files(changes)
+                self._cursor = (scope, new_token)
+                return items
+        # o cursor vem antes da varredura: o que mudar durante ela aparece na próxima
+        new_token = self.gd.start_page_token()
+        items = list(self.gd.iter_cbr_files(self.folder_id or "root", self.recursive))
+        self._cursor = (scope, new_token)
+        return items
+
+    def _changed_files(self, changes: List[Dict]) -> List[Dict]:
+        latest: Dict[str, Dict] = {}
+        for ch in changes:
+            f = ch.get("file")
+            if ch.get("removed") or not f or f.get("trashed"):
+                latest.pop(ch.get("fileId"), None)
+                continue
+            latest[f["id"]] = f
+        if not latest:
+            return []
+        inside = self.gd.folder_checker(self.folder_id or "root", self.recursive)
+        files: List[Dict] = []
+        for f in latest.values():
+            if not inside(f.get("parents")):
+                continue
+            if f.get("mimeType") == FOLDER_MIME:
+                # pasta movida para dentro da árvore: o conteúdo dela não aparece no feed
+                if self.recursive:
+                    files.extend(self.gd.iter_cbr_files(f["id"], True))
+            elif f["name"].lower().endswith((".cbr", ".cbz")):
+                files.append(f)
+        return files
+
+    def connection_stats(self) -> Optional[Dict[str, int]]:
+        return self.gd.connection_stats()
+
+    def commit(self) -> None:
+        if self._cursor is None:
+            return
+        section = self.gd.state["gdrive"]
+        section["changes_scope"], section["changes_token"] = self._cursor
+        save_state(self.gd.state)
+
+    def is_current(self, item: Dict, dest: Path) -> bool:
+        # arquivos do Google (sem tamanho) não têm como ser comparados: basta existir
+        size = int(item.get("size") or 0)
+        return dest.exists() and (size == 0 or dest.stat().st_size == size)
 
-    def run(self):
-        if not self.gd.ensure_creds(None):
-            self.failed.emit("Não autenticado no Google Drive."); return
-        try:
-            items = list(self.gd.iter_cbr_files(self.folder_id or "root", self.recursive))
-            total = len(items); done = 0; downloaded = 0
-            existing = {p.name: p.stat().st_size for p in self.library_dir.glob("**/*") if p.suffix.lower() in (".cbr", ".cbz")}
-            for it in items:
-                done += 1
-                name = it["name"]; size = int(it.get("size") or 0)
-                dest = self.library_dir / name
-                self.progress.emit(done, total, f"{done}/{total} verificando {name}")
-                if dest.exists() and (size == 0 or dest.stat().st_size == size):
-                    continue
-                self.progress.emit(done, total, f"{done}/{total} baixando {name}")
-                data = self.gd.download_file(it["id"])
-                dest.parent.mkdir(parents=True, exist_ok=True)
-                with open(dest, "wb") as f: f.write(data)
-                downloaded += 1
-            self.finished_ok.emit(downloaded)
-        except Exception as e:
-            self.failed.emit(str(e))
+    def download(self, item: Dict, dest: Path, progress: ProgressFn) -> None:
+        self.gd.download_file(item["id"], dest, int(item.get("size") or 0) or None, progress)
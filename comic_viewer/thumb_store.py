@@ -0,0 +1,312 @@
+import logging
+import mmap
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+from .config import THUMBS_DIR, THUMB_STORE_MAX_BYTES
+from .utils import archive_fingerprint
+
+log = logging.getLogger("thumb_store")
+
+# cada capa fica guardada nestes tamanhos (caixa quadrada); qualquer tamanho pedido sai
+# do nível igual ou maior mais próximo, reduzido na hora, sem reabrir o arquivo
+THUMB_LEVELS = (128, 256, 512)
+
+PACK_FILE = "thumbs.pack"
+INDEX_FILE = "index.db"
+
+
+def pack_name(generation: int) -> str:
+    """Arquivo de dados da geração 'generation' (cada compactação cria uma nova; a 0 é o nome antigo)."""
+    return PACK_FILE if generation == 0 else f"thumbs.{generation}.pack"
+
+
+def levels_for(size: int) -> List[int]:
+    """Níveis que servem para 'size', do menor ao maior (tamanhos acima do maior viram um nível próprio)."""
+    levels = [lv for lv in THUMB_LEVELS if lv >= size]
+    return levels or [size]
+
+
+class ThumbnailStore:
+    """
+    Miniaturas empacotadas: um arquivo de dados só de acréscimo ('thumbs.pack', lido por
+    mmap) e um índice SQLite (fingerprint, nível) -> (offset, tamanho). O índice inteiro é
+    carregado numa consulta ao abrir; depois, ler uma capa é só fatiar o mmap.
+    Só o processo principal escreve (os workers devolvem as imagens já codificadas).
+    Acima da cota, ou com muito espaço morto, o pacote é compactado numa thread à parte
+    (a cópia roda fora do lock; leituras e gravações continuam); o gc tira as capas de
+    arquivos que sumiram ou mudaram.
+    A compactação grava um pacote de geração nova (fsync) e troca, numa transação só,
+    as linhas do índice e o nome do pacote na tabela 'meta': numa queda, o índice
+    sempre aponta para o pacote em que os offsets foram calculados.
+    """
+
+    def __init__(self, root: Path, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.RLock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._index: Dict[Tuple[str, int], Tuple[int, int]] = {}
+        self._paths: Dict[str, str] = {}
+        self._used: Dict[str, float] = {}
+        self._touched: Set[str] = set()
+        self._pack = None
+        self._map: Optional[mmap.mmap] = None
+        self._size = 0
+        self._generation = 0
+        self._compacting = False
+
+    # ---------- abertura ----------
+    def _open(self) -> None:
+        if self._conn is not None:
+            return
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.root / INDEX_FILE), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS thumbs ("
+            "fid TEXT NOT NULL, level INTEGER NOT NULL, offset INTEGER NOT NULL, "
+            "length INTEGER NOT NULL, path TEXT NOT NULL, used_at REAL NOT NULL, "
+            "PRIMARY KEY (fid, level))"
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'generation'").fetchone()
+        self._generation = row[0] if row else 0
+        current = pack_name(self._generation)
+        # sobras de uma compactação interrompida (antes ou depois da troca no índice)
+        for stray in self.root.glob("thumbs*.pack*"):
+            if stray.name != current:
+                try: stray.unlink()
+                except OSError: pass
+        self._pack = open(self.root / current, "ab+")
+        self._size = self._pack.seek(0, os.SEEK_END)
+        for fid, level, offset, length, path, used_at in self._conn.execute("SELECT * FROM thumbs"):
+            if offset + length > self._size:
+                continue  # pacote truncado (queda no meio de uma escrita)
+            self._index[(fid, level)] = (offset, length)
+            self._paths[fid] = path
+            self._used[fid] = max(used_at, self._used.get(fid, 0.0))
+        log.debug(f"[STORE] {len(self._paths)} capas no índice, pacote com {self._size} bytes")
+
+    def _remap(self) -> None:
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._size:
+            self._pack.flush()
+            self._map = mmap.mmap(self._pack.fileno(), self._size, access=mmap.ACCESS_READ)
+
+    # ---------- leitura ----------
+    def has(self, fid: str, size: int) -> bool:
+        with self._lock:
+            self._open()
+            return any((fid, lv) in self._index for lv in levels_for(size))
+
+    def get(self, fid: str, size: int) -> Optional[bytes]:
+        """Bytes codificados do menor nível que serve para 'size', ou None."""
+        with self._lock:
+            self._open()
+            for level in levels_for(size):
+                loc = self._index.get((fid, level))
+                if loc is None:
+                    continue
+                offset, length = loc
+                if self._map is None or offset + length > len(self._map):
+                    self._remap()
+                self._used[fid] = time.time()
+                self._touched.add(fid)
+                return self._map[offset:offset + length]
+        return None
+
+    # ---------- escrita (só no processo principal) ----------
+    def put(self, fid: str, archive: Path, levels: Dict[int, bytes]) -> None:
+        with self._lock:
+            self._open()
+            now = time.time()
+            rows = []
+            for level, data in levels.items():
+                offset = self._size
+                self._pack.write(data)
+                self._size += len(data)
+                self._index[(fid, level)] = (offset, len(data))
+                rows.append((fid, level, offset, len(data), str(archive), now))
+            self._pack.flush()
+            self._paths[fid] = str(archive)
+            self._used[fid] = now
+            self._conn.executemany("INSERT OR REPLACE INTO thumbs VALUES (?, ?, ?, ?, ?, ?)", rows)
+            self._conn.commit()
+            over = self._size > self.max_bytes and not self._compacting
+        if over:
+            # quem grava é o caminho de resultados das miniaturas: não reescreve o pacote aqui
+            threading.Thread(target=self.compact, name="thumb-store-compact", daemon=True).start()
+
+    def flush(self) -> None:
+        """Grava os 'usado em' pendentes (ordem do LRU na compactação)."""
+        with self._lock:
+            if self._conn is None or not self._touched:
+                return
+            rows = [(self._used[fid], fid) for fid in self._touched if fid in self._used]
+            self._touched.clear()
+            self._conn.executemany("UPDATE thumbs SET used_at = ? WHERE fid = ?", rows)
+            self._conn.commit()
+
+    # ---------- manutenção ----------
+    def _live_bytes(self) -> int:
+        return sum(length for _, length in self._index.values())
+
+    def _drop(self, fids: Set[str]) -> None:
+        for key in [k for k in self._index if k[0] in fids]:
+            del self._index[key]
+        for fid in fids:
+            self._paths.pop(fid, None)
+            self._used.pop(fid, None)
+            self._touched.discard(fid)
+
+    def compact(self) -> None:
+        """
+        Reescreve o pacote só com as capas vivas; acima da cota, larga as menos usadas
+        até ficar em 80% dela. A cópia é feita fora do lock, de um mmap próprio; no fim,
+        já com o lock, entram as capas gravadas nesse meio tempo e os arquivos são trocados.
+        """
+        with self._lock:
+            if self._compacting:
+                return
+            self._compacting = True
+        try:
+            self._compact()
+        except Exception as e:
+            log.error(f"[STORE] falha compactando: {e}")
+        finally:
+            with self._lock:
+                self._compacting = False
+
+    def _compact(self) -> None:
+        with self._lock:
+            self._open()
+            self.flush()
+            live = self._live_bytes()
+            if live > self.max_bytes:
+                per_fid: Dict[str, int] = {}
+                for (fid, _), (_, length) in self._index.items():
+                    per_fid[fid] = per_fid.get(fid, 0) + length
+                dropped: Set[str] = set()
+                for fid in sorted(per_fid, key=lambda f: self._used.get(f, 0.0)):
+                    if live <= self.max_bytes * 0.8:
+                        break
+                    live -= per_fid[fid]
+                    dropped.add(fid)
+                self._drop(dropped)
+                log.info(f"[STORE] cota: {len(dropped)} capas descartadas")
+            self._pack.flush()
+            snapshot = dict(self._index)
+            src = mmap.mmap(self._pack.fileno(), self._size, access=mmap.ACCESS_READ) if self._size else None
+
+        generation = self._generation + 1
+        new_path = self.root / pack_name(generation)
+        copied: Dict[Tuple[str, int], Tuple[int, int]] = {}  # chave -> (posição nova, tamanho)
+        moved: Dict[Tuple[str, int], Tuple[int, int]] = {}   # chave -> posição antiga copiada
+        out = open(new_path, "wb")
+        try:
+            pos = 0
+            for key, (offset, length) in sorted(snapshot.items(), key=lambda kv: kv[1][0]):
+                out.write(src[offset:offset + length])
+                copied[key] = (pos, length)
+                moved[key] = (offset, length)
+                pos += length
+        finally:
+            if src is not None:
+                src.close()
+
+        with self._lock:
+            if self._conn is None:  # fechado durante a cópia (saída do programa)
+                out.close()
+                new_path.unlink(missing_ok=True)
+                return
+            try:
+                # o que foi gravado (ou regravado) durante a cópia vem do pacote atual
+                if self._map is None or len(self._map) < self._size:
+                    self._remap()
+                new_index: Dict[Tuple[str, int], Tuple[int, int]] = {}
+                for key, loc in self._index.items():
+                    if moved.get(key) == loc:
+                        new_index[key] = copied[key]
+                    else:
+                        offset, length = loc
+                        out.write(self._map[offset:offset + length])
+                        new_index[key] = (pos, length)
+                        pos += length
+                out.flush()
+                os.fsync(out.fileno())  # os dados no disco antes do índice que aponta para eles
+            finally:
+                out.close()
+            try:
+                with self._conn:
+                    self._conn.execute("DELETE FROM thumbs")
+                    self._conn.executemany(
+                        "INSERT INTO thumbs VALUES (?, ?, ?, ?, ?, ?)",
+                        [(fid, level, offset, length, self._paths[fid], self._used.get(fid, 0.0))
+                         for (fid, level), (offset, length) in new_index.items()],
+                    )
+                    self._conn.execute("INSERT OR REPLACE INTO meta VALUES ('generation', ?)", (generation,))
+            except sqlite3.Error:
+                new_path.unlink(missing_ok=True)  # o índice continua no pacote antigo
+                raise
+            # só depois do commit o pacote novo passa a valer
+            if self._map is not None:
+                self._map.close()
+                self._map = None
+            self._pack.close()
+            old_path = self.root / pack_name(self._generation)
+            self._pack = open(new_path, "ab+")
+            self._generation = generation
+            old_size, self._size = self._size, pos
+            self._index = new_index
+            try: old_path.unlink()
+            except OSError: pass
+            log.info(f"[STORE] compactado: {old_size} -> {self._size} bytes (geração {generation})")
+
+    def gc(self) -> None:
+        """Remove capas de arquivos que não existem mais (ou mudaram) e compacta se valer a pena."""
+        with self._lock:
+            self._open()
+            paths = dict(self._paths)
+        stale: Set[str] = set()
+        for fid, path in paths.items():  # stat fora do lock: a GUI continua lendo
+            p = Path(path)
+            try:
+                if not p.exists() or archive_fingerprint(p) != fid:
+                    stale.add(fid)
+            except OSError:
+                stale.add(fid)
+        # PNGs soltos do formato antigo
+        for old in self.root.glob("*.png"):
+            try: old.unlink()
+            except OSError: pass
+        with self._lock:
+            if stale:
+                self._drop(stale)
+                log.info(f"[STORE] gc: {len(stale)} capas órfãs")
+                with self._conn:
+                    self._conn.executemany("DELETE FROM thumbs WHERE fid = ?", [(f,) for f in stale])
+            worth = self._size and (self._size > self.max_bytes or self._live_bytes() < self._size * 0.75)
+        if worth:
+            self.compact()  # o gc já roda numa thread própria
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is None:
+                return
+            self.flush()
+            if self._map is not None:
+                self._map.close()
+                self._map = None
+            self._pack.close()
+            self._conn.close()
+            self._conn = None
+
+
+THUMB_STORE = ThumbnailStore(THUMBS_DIR, THUMB_STORE_MAX_BYTES)
@@ -1,200 +1,154 @@
-import hashlib
-import json
 import logging
-import subprocess
 from pathlib import Path
-from typing import Optional, Tuple, List
+from typing import Dict, Optional, Tuple
 
-from PyQt5.QtGui import QImage, QPixmap
-from .config import APP_SUPPORT
-from .utils import detect_unar, detect_lsar
-import zipfile
+from PyQt5.QtCore import QBuffer, QIODevice, QSize, Qt
+from PyQt5.QtGui import QImage, QImageWriter
+from .extractor import CBRExtractor
+from .imaging import decode_scaled
+from .manifest import archive_manifest
+from .pages import ZipPageProvider
+from .thumb_store import THUMB_LEVELS
 
 log = logging.getLogger("thumbs")
 
-THUMBS_DIR = APP_SUPPORT / "thumbnails"
-THUMBS_DIR.mkdir(parents=True, exist_ok=True)
+THUMB_FORMAT = "WEBP" if b"webp" in [bytes(f) for f in QImageWriter.supportedImageFormats()] else "JPEG"
 
-UNAR_PATH = detect_unar()
-LSAR_PATH = detect_lsar()
-
-IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".webp", ".bmp"}
-
-def _archive_fingerprint(archive: Path) -> str:
-    st = archive.stat()
-    raw = f"{archive.resolve()}|{st.st_mtime_ns}|{st.st_size}".encode("utf-8")
-    return hashlib.sha1(raw).hexdigest()
+# ---------- capa (primeira página do manifesto) ----------
+def _first_page(archive: Path) -> Tuple[Optional[Dict], Optional[Dict]]:
+    try:
+        manifest = archive_manifest(archive)
+    except Exception as e:
+        log.error(f"[THUMB] falha listando {archive.name}: {e}")
+        return None, None
+    if not manifest["pages"]:
+        log.debug(f"[THUMB] sem imagens: {archive.name}")
+        return manifest, None
+    log.debug(f"[THUMB] primeira imagem: {manifest['pages'][0]['name']}")
+    return manifest, manifest["pages"][0]
 
 # ---------- CBZ ----------
-def _cbz_first_image_bytes(archive: Path) -> Optional[bytes]:
+def _cbz_first_image_bytes(archive: Path, manifest: Dict) -> Optional[bytes]:
+    provider = ZipPageProvider(archive, manifest)
     try:
-        with zipfile.ZipFile(archive, "r") as zf:
-            names: List[str] = [n for n in zf.namelist() if Path(n).suffix.lower() in IMAGE_EXTS]
-            names.sort(key=lambda s: s.lower())
-            if not names:
-                log.debug(f"[CBZ] sem imagens: {archive.name}")
-                return None
-            first = names[0]
-            log.debug(f"[CBZ] primeira imagem: {first}")
-            with zf.open(first, "r") as f:
-                return f.read()
+        provider.open()
+        return provider.read_page(0)
     except Exception as e:
         log.exception(f"[CBZ] erro lendo {archive.name}: {e}")
         return None
+    finally:
+        provider.close()
 
 # ---------- CBR ----------
-def _cbr_first_image_name_with_lsar(archive: Path) -> Optional[str]:
-    if not LSAR_PATH:
-        log.warning("[CBR] lsar não disponível")
-        return None
+def _cbr_first_image_bytes(archive: Path, first: Dict) -> Optional[bytes]:
+    """Lê só a capa do CBR pelo leitor registrado (libarchive em processo ou unar)."""
     try:
-        proc = subprocess.run(
-            [LSAR_PATH, "-json", str(archive)],
-            stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True
-        )
-        data = json.loads(proc.stdout.decode("utf-8", errors="ignore"))
-        items = data.get("lsarContents") or data.get("files") or []
-        candidates = []
-        for it in items:
-            name = it.get("XADFileName") or it.get("Name") or it.get("name")
-            if name and Path(name).suffix.lower() in IMAGE_EXTS:
-                candidates.append(name)
-        candidates.sort(key=lambda s: s.lower())
-        if not candidates:
-            log.debug(f"[CBR] sem imagens listáveis em: {archive.name}")
-            return None
-        log.debug(f"[CBR] primeira imagem: {candidates[0]}")
-        return candidates[0]
-    except subprocess.CalledProcessError as e:
-        log.error(f"[CBR] lsar falhou ({archive.name}): {e.stderr.decode('utf-8', 'ignore')}")
-        return None
-    except Exception as e:
-        log.exception(f"[CBR] erro listando {archive.name}: {e}")
-        return None
-
-def _cbr_extract_single_file_bytes(archive: Path, inner_name: str) -> Optional[bytes]:
-    """
-    Extrai só um arquivo do CBR usando unar.
-    - Usa '-no-directory' para evitar pasta com nome do .rar.
-    - Se o 'leaf' não for encontrado (normalização/renomeações),
-      faz fallback: pega a PRIMEIRA imagem encontrada no tmp, recursivamente.
-    """
-    if not UNAR_PATH:
-        log.warning("[CBR] unar não disponível")
-        return None
-
-    tmpdir = THUMBS_DIR / "_tmp"
-    tmpdir.mkdir(parents=True, exist_ok=True)
-    # limpa sobras antigas
-    for p in tmpdir.glob("*"):
-        try:
-            if p.is_file():
-                p.unlink()
-            elif p.is_dir():
-                for f in p.glob("**/*"):
-                    try: f.unlink()
-                    except Exception: pass
-                try: p.rmdir()
-                except Exception: pass
-        except Exception:
-            pass
-
-    try:
-        cmd = [
-            UNAR_PATH,
-            "-quiet",
-            "-force-overwrite",
-            "-no-directory",
-            "-output-directory", str(tmpdir),
-            str(archive),
-            inner_name,
-        ]
-        proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        if proc.returncode != 0:
-            log.error(f"[CBR] unar falhou ({archive.name}) rc={proc.returncode}: {proc.stderr.decode('utf-8','ignore')}")
-            return None
-
-        # 1) Tenta pelo basename exato
-        leaf = Path(inner_name).name
-        direct = tmpdir / leaf
-        if direct.exists() and direct.is_file():
-            log.debug(f"[CBR] extraído (direto): {direct}")
-            return direct.read_bytes()
-
-        # 2) Procura recursivamente pelo basename
-        matches = list(tmpdir.rglob(leaf))
-        if matches:
-            log.debug(f"[CBR] extraído (rglob): {matches[0]}")
-            return matches[0].read_bytes()
-
-        # 3) Fallback final: pegue QUALQUER imagem extraída e use a primeira (ordenada)
-        images = [p for p in tmpdir.rglob("*") if p.is_file() and p.suffix.lower() in IMAGE_EXTS]
-        images.sort(key=lambda p: p.as_posix().lower())
-        if images:
-            log.debug(f"[CBR] fallback: usando primeira imagem encontrada: {images[0]}")
-            return images[0].read_bytes()
-
-        log.error(f"[CBR] unar não produziu '{leaf}' nem qualquer imagem em {tmpdir}")
-        return None
-
+        return CBRExtractor.read_entry(archive, first)
     except Exception as e:
-        log.exception(f"[CBR] erro extrair {inner_name} de {archive.name}: {e}")
+        log.error(f"[CBR] erro extraindo {first['name']} de {archive.name}: {e}")
         return None
 
 # ---------- imagem ----------
 def _qimage_from_bytes(data: bytes, target_size: Tuple[int, int]) -> Optional[QImage]:
-    img = QImage()
-    ok = img.loadFromData(data)
-    if not ok or img.isNull():
+    w, h = target_size
+    # o reader já decodifica reduzido (DCT no JPEG); capas pequenas ainda são ampliadas abaixo
+    img, _ = decode_scaled(data, QSize(w, h))
+    if img.isNull():
         log.debug("[IMG] falha ao carregar QImage a partir dos bytes")
         return None
-    w, h = target_size
-    return img.scaled(w, h, 1, 1)  # Qt.KeepAspectRatio=1, Qt.SmoothTransformation=1
-
-def make_thumbnail(archive: Path, size: int = 256) -> Optional[QPixmap]:
-    fid = _archive_fingerprint(archive)
-    cache_file = THUMBS_DIR / f"{fid}.png"
-
-    # Cache
-    if cache_file.exists():
-        pix = QPixmap(str(cache_file))
-        if not pix.isNull():
-            log.debug(f"[CACHE] hit para {archive.name}")
-            return pix
-        else:
-            log.debug(f"[CACHE] corrompido (apagando): {cache_file}")
-            try: cache_file.unlink()
-            except Exception: pass
-
+    if img.width() == w or img.height() == h:
+        return img
+    return img.scaled(w, h, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+
+# ---------- pirâmide ----------
+def _fit(img: QImage, size: int) -> QImage:
+    if img.width() <= size and img.height() <= size:
+        return img
+    return img.scaled(size, size, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+
+def _encode(img: QImage) -> bytes:
+    """WebP quando o Qt tem o plugin; senão JPEG. Capas não precisam de PNG sem perdas."""
+    buf = QBuffer()
+    buf.open(QIODevice.WriteOnly)
+    img.save(buf, THUMB_FORMAT, 82)
+    return bytes(buf.data())
+
+def _decode(data: bytes, size: int) -> Optional[QImage]:
+    img = QImage.fromData(data)
+    return None if img.isNull() else _fit(img, size)
+
+def render_levels(archive: Path, size: int) -> Tuple[Optional[QImage], Dict[int, bytes]]:
+    """
+    Gera a capa a partir do arquivo: decodifica uma vez no maior nível necessário e
+    codifica a pirâmide toda. Retorna (imagem em 'size', {nível: bytes codificados}).
+    """
     ext = archive.suffix.lower()
     data: Optional[bytes] = None
 
     log.info(f"[THUMB] gerando para {archive.name} ({ext})")
 
-    if ext == ".cbz":
-        data = _cbz_first_image_bytes(archive)
-    elif ext == ".cbr":
-        inner = _cbr_first_image_name_with_lsar(archive)
-        if inner:
-            data = _cbr_extract_single_file_bytes(archive, inner)
-    else:
+    if ext not in (".cbz", ".cbr"):
         log.warning(f"[THUMB] extensão não suportada: {ext}")
-        return None
+        return None, {}
+
+    # o manifesto é o mesmo do leitor: a listagem acontece uma única vez por arquivo
+    manifest, first = _first_page(archive)
+    if first is not None:
+        if manifest["kind"] == "zip":
+            data = _cbz_first_image_bytes(archive, manifest)
+        else:
+            data = _cbr_first_image_bytes(archive, first)
 
     if not data:
         log.warning(f"[THUMB] não foi possível obter bytes de imagem para {archive.name}")
-        return None
+        return None, {}
 
-    qimg = _qimage_from_bytes(data, (size, size))
+    top_level = max(THUMB_LEVELS[-1], size)
+    qimg = _qimage_from_bytes(data, (top_level, top_level))
     if not qimg:
         log.warning(f"[THUMB] QImage inválida para {archive.name}")
-        return None
-
-    # salva e retorna
-    ok = qimg.save(str(cache_file), "PNG")
-    if not ok:
-        log.warning(f"[THUMB] falhou ao salvar cache em {cache_file}")
-    else:
-        log.debug(f"[CACHE] salvo em {cache_file}")
-
-    return QPixmap.fromImage(qimg)
+        return None, {}
+
+    # do maior para o menor: cada nível sai do anterior, não da capa original
+    levels: Dict[int, bytes] = {}
+    img = qimg
+    for level in sorted({top_level, *(lv for lv in THUMB_LEVELS if lv < top_level)}, reverse=True):
+        img = _fit(img, level)
+        levels[level] = _encode(img)
+    return _fit(qimg, size), levels
+
+# ---------- job do motor de miniaturas (roda num processo à parte) ----------
+RawImage = Tuple[int, int, int, bytes]  # largura, altura, bytes por linha, pixels ARGB32
+
+def _raw(img: QImage) -> Optional[RawImage]:
+    img = img.convertToFormat(QImage.Format_ARGB32)
+    if img.isNull():
+        return None  # tamanho zero ou imagem inválida: constBits() seria None
+    ptr = img.constBits()
+    ptr.setsize(img.sizeInBytes())
+    return img.width(), img.height(), img.bytesPerLine(), bytes(ptr)
+
+def render_thumbnail(archive: str, size: int, cached: Optional[bytes] = None,
+                     want_image: bool = True) -> Tuple[Optional[RawImage], Dict[int, bytes]]:
+    """
+    Miniatura em 'size' como buffer cru (a GUI monta QImage/QIcon a partir dele).
+    'cached' são os bytes já guardados no pacote, quando houver; sem eles, a capa é gerada
+    e os níveis codificados voltam junto para o processo principal gravar.
+    Com want_image=False (lote de fundo) só os níveis voltam.
+    """
+    try:
+        if cached:
+            img = _decode(cached, size)
+            if img is not None:
+                return (_raw(img) if want_image else None), {}
+            log.debug(f"[THUMB] capa do pacote ilegível, gerando de novo: {archive}")
+        img, levels = render_levels(Path(archive), size)
+    except Exception:
+        log.exception(f"[THUMB] erro gerando miniatura para {archive}")
+        return None, {}
+    return (_raw(img) if img is not None and want_image else None), levels
+
+def image_from_raw(raw: RawImage) -> QImage:
+    w, h, bpl, data = raw
+    # copy(): a QImage não pode depender do buffer Python depois do retorno
+    return QImage(data, w, h, bpl, QImage.Format_ARGB32).copy()
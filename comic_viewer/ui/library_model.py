@@ -0,0 +1,351 @@
+import bisect
+import logging
+import os
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from PyQt5.QtCore import QAbstractListModel, QAbstractProxyModel, QModelIndex, Qt, QTimer, pyqtSignal
+from PyQt5.QtGui import QIcon, QPixmap
+
+from ..thumbnails import RawImage, image_from_raw
+from ..utils import fold_name
+from .page_cache import ImageLRU
+
+log = logging.getLogger("library")
+
+
+class LibraryModel(QAbstractListModel):
+    """
+    Lista da biblioteca sobre registros compactos (listas paralelas de caminho, nome e
+    nome normalizado para a busca, mais o índice caminho -> linha); nenhum objeto por item.
+    Ícones são preguiçosos: só a linha que a view desenha pede a miniatura
+    ('thumbnail_wanted', agrupado num timer) e os pixmaps prontos ficam num LRU por bytes.
+    As miniaturas que chegam viram um único dataChanged por rodada.
+    Mudanças vindas do watcher entram por 'apply_changes' como inserções/remoções de
+    linhas (a view mantém rolagem e seleção); um lote muito espalhado vira um reset.
+    """
+
+    MAX_ROW_RUNS = 32  # acima disso, um reset sai mais barato que tantos blocos
+
+    thumbnail_wanted = pyqtSignal(list)  # [caminho, ...] na ordem em que foram desenhados
+
+    def __init__(self, icon_cache_bytes: int, parent=None):
+        super().__init__(parent)
+        self._paths: List[str] = []
+        self._names: List[str] = []
+        self._folded: List[str] = []
+        self._row_of: Dict[str, int] = {}
+        self.icons = ImageLRU(icon_cache_bytes)
+        self.thumbs_enabled = False
+        self._placeholder = QIcon.fromTheme("text-x-generic")
+        self._requested: Set[str] = set()
+        self._failed: Set[str] = set()  # capas que não saíram: placeholder até o arquivo mudar
+        self._want: List[str] = []
+        self._want_timer = QTimer(self)
+        self._want_timer.setSingleShot(True)
+        self._want_timer.setInterval(0)
+        self._want_timer.timeout.connect(self._flush_wanted)
+        self._dirty: Set[int] = set()
+        self._dirty_timer = QTimer(self)
+        self._dirty_timer.setSingleShot(True)
+        self._dirty_timer.setInterval(30)
+        self._dirty_timer.timeout.connect(self._flush_dirty)
+
+    # ---------- dados ----------
+    def set_files(self, files: List[str], folded: Optional[List[str]] = None) -> None:
+        """'folded' (fold_name de cada nome, mesma ordem) vem pronto do índice; sem ele, é calculado."""
+        self.beginResetModel()
+        self._paths = list(files)
+        self._names = [os.path.basename(p) for p in self._paths]
+        self._folded = list(folded) if folded is not None else [fold_name(n) for n in self._names]
+        self._row_of = {p: i for i, p in enumerate(self._paths)}
+        self._requested.clear()
+        self._failed.clear()
+        self._dirty.clear()
+        self.endResetModel()
+
+    def apply_changes(self, added: List[str], removed: List[str]) -> None:
+        """Tira 'removed' e insere 'added' na posição da ordem por nome."""
+        self._failed.difference_update(added)
+        self._failed.difference_update(removed)
+        gone = sorted({self._row_of[p] for p in removed if p in self._row_of})
+        new = sorted({p for p in added if p not in self._row_of}, key=lambda p: os.path.basename(p).lower())
+        if not gone and not new:
+            return
+        for p in removed:
+            self.icons.discard(p)
+            self._requested.discard(p)
+        runs = _runs(gone)
+        if len(runs) + len(new) > self.MAX_ROW_RUNS:
+            keep = set(removed)
+            folded_of = {p: f for p, f in zip(self._paths, self._folded) if p not in keep}
+            files = list(folded_of) + new
+            files.sort(key=lambda p: os.path.basename(p).lower())
+            self.set_files(files, [folded_of.get(p) or fold_name(os.path.basename(p)) for p in files])
+            return
+        self._dirty.clear()
+        for first, last in reversed(runs):
+            self.beginRemoveRows(QModelIndex(), first, last)
+            del self._paths[first:last + 1]
+            del self._names[first:last + 1]
+            del self._folded[first:last + 1]
+            self.endRemoveRows()
+        # inserções de trás para frente: as posições já calculadas não se deslocam
+        slots = []
+        for p in new:
+            name = os.path.basename(p)
+            slots.append((bisect.bisect_right(self._names, name.lower(), key=str.lower), p, name))
+        i = len(slots)
+        while i > 0:
+            j = i - 1
+            while j > 0 and slots[j - 1][0] == slots[i - 1][0]:
+                j -= 1
+            pos = slots[j][0]
+            block = slots[j:i]
+            self.beginInsertRows(QModelIndex(), pos, pos + len(block) - 1)
+            self._paths[pos:pos] = [p for _, p, _ in block]
+            self._names[pos:pos] = [n for _, _, n in block]
+            self._folded[pos:pos] = [fold_name(n) for _, _, n in block]
+            self.endInsertRows()
+            i = j
+        self._row_of = {p: i for i, p in enumerate(self._paths)}
+
+    def refresh_icons(self, paths: List[str]) -> None:
+        """Esquece as miniaturas destes arquivos (mudaram no disco); a view pede de novo."""
+        for p in paths:
+            self.icons.discard(p)
+            self._requested.discard(p)
+            self._failed.discard(p)
+            row = self._row_of.get(p)
+            if row is not None:
+                self._dirty.add(row)
+        if self._dirty and not self._dirty_timer.isActive():
+            self._dirty_timer.start()
+
+    def names(self) -> List[str]:
+        return self._names
+
+    def paths(self) -> List[str]:
+        return self._paths
+
+    def folded(self) -> List[str]:
+        return self._folded
+
+    def path_at(self, row: int) -> Path:
+        return Path(self._paths[row])
+
+    def path_str(self, row: int) -> str:
+        return self._paths[row]
+
+    def row_of(self, path: str) -> Optional[int]:
+        return self._row_of.get(path)
+
+    def set_thumbs_enabled(self, enabled: bool) -> None:
+        """No modo grade os ícones são miniaturas; na lista, o ícone genérico."""
+        self.thumbs_enabled = enabled
+        self._placeholder = QIcon.fromTheme("image-x-generic" if enabled else "text-x-generic")
+        self._requested.clear()
+        if self._paths:
+            self.dataChanged.emit(self.index(0), self.index(len(self._paths) - 1), [Qt.DecorationRole])
+
+    def reset_thumbnails(self) -> None:
+        """Esquece ícones, pedidos e falhas (ex.: o tamanho das miniaturas mudou)."""
+        self.icons.clear()
+        self._failed.clear()
+        self.set_thumbs_enabled(self.thumbs_enabled)
+
+    def rowCount(self, parent=QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self._paths)
+
+    def data(self, index: QModelIndex, role: int = Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row = index.row()
+        if role == Qt.DisplayRole:
+            return self._names[row]
+        if role in (Qt.ToolTipRole, Qt.UserRole):
+            return self._paths[row]
+        if role == Qt.DecorationRole:
+            if not self.thumbs_enabled:
+                return self._placeholder
+            path = self._paths[row]
+            pix = self.icons.get(path)
+            if pix is not None:
+                return QIcon(pix)
+            if path not in self._requested and path not in self._failed:
+                self._requested.add(path)
+                self._want.append(path)
+                self._want_timer.start()
+            return self._placeholder
+        return None
+
+    # ---------- miniaturas ----------
+    def _flush_wanted(self) -> None:
+        want, self._want = self._want, []
+        if want:
+            self.thumbnail_wanted.emit(want)
+
+    def set_thumbnail(self, path: str, raw: Optional[RawImage]) -> None:
+        self._requested.discard(path)
+        row = self._row_of.get(path)
+        if row is None:
+            return
+        if raw is None:
+            # sem isso a próxima pintura pediria a mesma capa de novo, sem fim
+            self._failed.add(path)
+            return
+        if not self.thumbs_enabled:
+            return
+        self.icons.put(path, QPixmap.fromImage(image_from_raw(raw)))
+        self._dirty.add(row)
+        if not self._dirty_timer.isActive():
+            self._dirty_timer.start()
+
+    def _flush_dirty(self) -> None:
+        if not self._dirty:
+            return
+        first, last = min(self._dirty), max(self._dirty)
+        self._dirty.clear()
+        self.dataChanged.emit(self.index(first), self.index(last), [Qt.DecorationRole])
+
+
+def substring_rows(query: str, folded: List[str], candidates: Optional[List[int]]) -> List[int]:
+    """Casamento por substring, varrendo as candidatas (ou todas)."""
+    if candidates is None:
+        return [i for i, name in enumerate(folded) if query in name]
+    return [i for i in candidates if query in folded[i]]
+
+
+def _runs(rows: List[int]) -> List[Tuple[int, int]]:
+    """Linhas ordenadas -> blocos contíguos (primeira, última)."""
+    runs: List[Tuple[int, int]] = []
+    for r in rows:
+        if runs and runs[-1][1] == r - 1:
+            runs[-1] = (runs[-1][0], r)
+        else:
+            runs.append((r, r))
+    return runs
+
+
+class LibraryFilter(QAbstractProxyModel):
+    """
+    Filtro da lista: 'rows' são as linhas do LibraryModel que passam, em ordem.
+    O casamento é feito direto sobre os nomes normalizados do modelo (sem chamar data()
+    linha a linha, como faria um QSortFilterProxyModel); 'matcher' pode ser trocado
+    (ver SearchIndex). Quando a consulta nova contém a anterior, só as linhas que já
+    passavam são candidatas.
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.rows: List[int] = []
+        self._query = ""
+        self._removing = (0, 0)
+        # matcher(consulta normalizada, nomes normalizados, linhas candidatas ou None) -> linhas
+        self.matcher: Callable[[str, List[str], Optional[List[int]]], List[int]] = substring_rows
+
+    def setSourceModel(self, model: LibraryModel) -> None:
+        super().setSourceModel(model)
+        model.modelReset.connect(self._rebuild)
+        model.dataChanged.connect(self._source_changed)
+        model.rowsAboutToBeRemoved.connect(self._source_removing)
+        model.rowsRemoved.connect(self._source_removed)
+        model.rowsInserted.connect(self._source_inserted)
+        self._rebuild()
+
+    def set_query(self, query: str) -> None:
+        query = fold_name(query.strip())
+        if query == self._query:
+            return
+        # a consulta só cresceu: quem não casava antes também não casa agora
+        narrowing = bool(self._query) and self._query in query and len(self.rows) < self.sourceModel().rowCount()
+        self._query = query
+        self._rebuild(self.rows if narrowing else None)
+
+    def _rebuild(self, candidates: Optional[List[int]] = None) -> None:
+        self.beginResetModel()
+        folded = self.sourceModel().folded() if self.sourceModel() else []
+        self.rows = self.matcher(self._query, folded, candidates) if self._query else list(range(len(folded)))
+        self.endResetModel()
+
+    def _source_changed(self, top: QModelIndex, bottom: QModelIndex, roles=()) -> None:
+        if not self.rows:
+            return
+        if bottom.row() - top.row() + 1 >= len(self.rows):
+            first, last = 0, len(self.rows) - 1
+        else:
+            # 'rows' é crescente: o bloco da origem vira um bloco contíguo aqui
+            first = bisect.bisect_left(self.rows, top.row())
+            last = bisect.bisect_right(self.rows, bottom.row()) - 1
+            if first > last:
+                return
+        self.dataChanged.emit(self.index(first), self.index(last), roles)
+
+    def _source_removing(self, parent: QModelIndex, first: int, last: int) -> None:
+        lo = bisect.bisect_left(self.rows, first)
+        hi = bisect.bisect_right(self.rows, last)
+        self._removing = (lo, hi)
+        if lo < hi:
+            self.beginRemoveRows(QModelIndex(), lo, hi - 1)
+
+    def _source_removed(self, parent: QModelIndex, first: int, last: int) -> None:
+        lo, hi = self._removing
+        n = last - first + 1
+        self.rows[lo:] = [r - n for r in self.rows[hi:]]
+        if lo < hi:
+            self.endRemoveRows()
+
+    def _source_inserted(self, parent: QModelIndex, first: int, last: int) -> None:
+        n = last - first + 1
+        pos = bisect.bisect_left(self.rows, first)
+        if self._query:
+            block = self.sourceModel().folded()[first:last + 1]
+            new = [first + i for i in substring_rows(self._query, block, None)]
+        else:
+            new = list(range(first, last + 1))
+        if new:
+            self.beginInsertRows(QModelIndex(), pos, pos + len(new) - 1)
+        self.rows[pos:] = new + [r + n for r in self.rows[pos:]]
+        if new:
+            self.endInsertRows()
+
+    def visible(self, paths: List[str]) -> List[str]:
+        """Os caminhos da lista que passam no filtro atual."""
+        model = self.sourceModel()
+        return [p for p in paths if self._proxy_row(model.row_of(p)) is not None]
+
+    def _proxy_row(self, source_row: Optional[int]) -> Optional[int]:
+        if source_row is None:
+            return None
+        i = bisect.bisect_left(self.rows, source_row)
+        return i if i < len(self.rows) and self.rows[i] == source_row else None
+
+    def paths(self) -> List[str]:
+        paths = self.sourceModel().paths()
+        if len(self.rows) == len(paths):
+            return list(paths)
+        return [paths[r] for r in self.rows]
+
+    # ---------- QAbstractProxyModel ----------
+    def rowCount(self, parent=QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()) -> int:
+        return 0 if parent.isValid() else 1
+
+    def index(self, row: int, column: int = 0, parent=QModelIndex()) -> QModelIndex:
+        if parent.isValid() or not (0 <= row < len(self.rows)) or column != 0:
+            return QModelIndex()
+        return self.createIndex(row, column)
+
+    def parent(self, index=QModelIndex()) -> QModelIndex:
+        return QModelIndex()
+
+    def mapToSource(self, proxy: QModelIndex) -> QModelIndex:
+        if not proxy.isValid() or proxy.row() >= len(self.rows):
+            return QModelIndex()
+        return self.sourceModel().index(self.rows[proxy.row()])
+
+    def mapFromSource(self, source: QModelIndex) -> QModelIndex:
+        row = self._proxy_row(source.row()) if source.isValid() else None
+        return QModelIndex() if row is None else self.createIndex(row, 0)
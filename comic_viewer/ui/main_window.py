@@ -1,61 +1,40 @@
-import os
 import logging
+import threading
 from pathlib import Path
-from typing import List
+from typing import List, Optional
 
-from PyQt5.QtCore import Qt, QTimer, QThread, pyqtSignal, QSize
+from PyQt5.QtCore import Qt, QTimer, QSize
 from PyQt5.QtGui import QIcon
 from PyQt5.QtWidgets import (
-    QMainWindow, QWidget, QVBoxLayout, QLabel, QSplitter, QLineEdit, QListWidget,
-    QListWidgetItem, QAction, QToolBar, QFileDialog, QMessageBox, QDialog,
+    QMainWindow, QWidget, QVBoxLayout, QLabel, QSplitter, QLineEdit, QListView,
+    QAction, QToolBar, QFileDialog, QMessageBox, QDialog,
     QDialogButtonBox, QProgressBar, QFrame, QHBoxLayout, QToolButton, QMenu
 )
 
-from ..config import APP_NAME, DEFAULT_LIBRARY
+from ..config import APP_NAME, DEFAULT_LIBRARY, LIBRARY_ICON_CACHE_BYTES, SEARCH_DEBOUNCE_MS, SYNC_WORKERS, THUMB_WORKERS
 from ..state import load_state, save_state
 from ..onedrive.client import OneDriveClient
 from ..onedrive.dialogs import OneDriveFolderPicker
 from ..ui.reader_window import ReaderWindow
 from ..sync import OneDriveSyncThread
-from ..thumbnails import make_thumbnail
+from .library_model import LibraryFilter, LibraryModel
+from .search_index import SearchIndex
+from .thumb_engine import ThumbnailEngine
+from ..extract_cache import EXTRACT_CACHE
+from ..helper_pool import HELPER_POOL
+from ..library_index import LIBRARY_INDEX, LibraryScanThread
+from ..library_watch import LibraryWatcher
+from ..manifest import gc_manifests
+from ..thumb_store import THUMB_STORE
 
 from ..gdrive.client import GDriveClient
 from ..gdrive.dialogs import GDriveFolderPicker
 from ..sync_gdrive import GDriveSyncThread
+from ..sync_engine import SyncEngine
 
 log = logging.getLogger("main")
 
 
-# -------------------- Worker de thumbnails --------------------
-
-class ThumbnailWorker(QThread):
-    produced = pyqtSignal(str, QIcon)  # (filepath, icon)
-    progress = pyqtSignal(int, int)    # done, total
-
-    def __init__(self, files: List[Path], size: int):
-        super().__init__()
-        self.files = files
-        self.size = size
-
-    def run(self):
-        total = len(self.files)
-        log.info(f"[Worker] iniciando geração de thumbnails: {total} itens, size={self.size}")
-        done = 0
-        for p in self.files:
-            try:
-                pix = make_thumbnail(p, size=self.size)
-                if pix and not pix.isNull():
-                    icon = QIcon(pix)
-                    self.produced.emit(str(p), icon)
-                else:
-                    log.warning(f"[Worker] thumbnail vazia para {p.name}")
-            except Exception:
-                log.exception(f"[Worker] erro gerando thumbnail para {p}")
-            done += 1
-            self.progress.emit(done, total)
-        log.info("[Worker] finalizado")
-
-
 # -------------------- Janela Principal --------------------
 
 class MainWindow(QMainWindow):
@@ -75,6 +54,15 @@ class MainWindow(QMainWindow):
         self.view_mode = self.state.get("ui_view_mode", "list")
         self.thumb_size = int(self.state.get("ui_thumb_size", 160))
 
+        # cota do cache de extrações; a limpeza inicial roda fora da GUI
+        EXTRACT_CACHE.max_bytes = int(self.state.get("extract_cache_max_mb", EXTRACT_CACHE.max_bytes // (1024 * 1024))) * 1024 * 1024
+        threading.Thread(target=EXTRACT_CACHE.trim, name="extract-cache-trim", daemon=True).start()
+        # cota das miniaturas empacotadas; o gc (capas e manifestos de arquivos que sumiram) também roda fora da GUI
+        THUMB_STORE.max_bytes = int(self.state.get("thumb_cache_max_mb", THUMB_STORE.max_bytes // (1024 * 1024))) * 1024 * 1024
+        threading.Thread(target=self._gc_caches, name="thumb-store-gc", daemon=True).start()
+        # quantos lsar/unar podem rodar ao mesmo tempo
+        HELPER_POOL.max_workers = int(self.state.get("helper_workers", HELPER_POOL.max_workers))
+
         # Layout base
         splitter = QSplitter()
         left = QWidget(); right = QWidget()
@@ -89,8 +77,19 @@ class MainWindow(QMainWindow):
 
         # ---- Esquerda (busca + lista)
         self.search_edit = QLineEdit(); self.search_edit.setPlaceholderText("Buscar por nome…")
-        self.list_widget = QListWidget()
-        self.list_widget.itemDoubleClicked.connect(self.open_selected)
+        # lista virtualizada: modelo com os arquivos + filtro; a view só desenha o que aparece
+        self.library = LibraryModel(LIBRARY_ICON_CACHE_BYTES, self)
+        self.library_filter = LibraryFilter(self)
+        self.library_filter.setSourceModel(self.library)
+        # busca por trigramas sobre os nomes normalizados (sem acento, casefold)
+        self.search_index = SearchIndex(self.library, self)
+        self.library_filter.matcher = self.search_index.match
+        self.list_widget = QListView()
+        self.list_widget.setModel(self.library_filter)
+        self.list_widget.setEditTriggers(QListView.NoEditTriggers)
+        self.list_widget.setLayoutMode(QListView.Batched)
+        self.list_widget.setBatchSize(500)
+        self.list_widget.doubleClicked.connect(self.open_selected)
         left_layout.addWidget(self.search_edit)
         left_layout.addWidget(self.list_widget, 1)
 
@@ -130,7 +129,7 @@ class MainWindow(QMainWindow):
 
         # Ações básicas
         act_refresh = QAction("Atualizar", self);
-        act_refresh.triggered.connect(self.refresh_list)
+        act_refresh.triggered.connect(lambda: self.refresh_list(full=True))
         act_change_dir = QAction("Alterar pasta...", self);
         act_change_dir.triggered.connect(self.change_library_dir)
         act_open = QAction("Abrir selecionado", self);
@@ -198,13 +197,29 @@ class MainWindow(QMainWindow):
         gd_btn.setMenu(gd_menu)
         tb.addWidget(gd_btn)
 
-        self.search_edit.textChanged.connect(self.apply_filter)
+        # a busca espera uma pausa na digitação antes de filtrar
+        self._search_timer = QTimer(self)
+        self._search_timer.setSingleShot(True)
+        self._search_timer.setInterval(SEARCH_DEBOUNCE_MS)
+        self._search_timer.timeout.connect(self.apply_filter)
+        self.search_edit.textChanged.connect(self._search_timer.start)
 
         # Dados
-        self.all_files: List[Path] = []
-        self.thumb_worker: ThumbnailWorker = None  # type: ignore
-
-        self.refresh_list()
+        self._scan: Optional[LibraryScanThread] = None
+        self._scan_pending: Optional[dict] = None  # pedido de varredura feito durante outra
+        self._syncs: List[SyncEngine] = []  # sincronizações ainda rodando (mesmo com o diálogo fechado)
+        # mudanças no disco chegam em lote pelo watcher (ou pelo polling em montagem de rede)
+        self.watcher = LibraryWatcher(self)
+        self.watcher.dirs_changed.connect(self.refresh_dirs)
+        self.watcher.poll_due.connect(self.refresh_list)
+        # miniaturas: pool de processos ('thumb_workers' no estado)
+        self.thumbs = ThumbnailEngine(int(self.state.get("thumb_workers", THUMB_WORKERS)), self)
+        self.thumbs.produced.connect(self.library.set_thumbnail)
+        self.thumbs.progress.connect(lambda d, t: log.debug(f"[UI] progresso thumbs: {d}/{t}"))
+        # o que a view desenha pede a miniatura na hora, na frente do lote de fundo
+        self.library.thumbnail_wanted.connect(lambda paths: self.thumbs.request(paths, self.thumb_size))
+
+        self.load_library()
         self._update_right_panel()
         self.resize(1200, 720)
 
@@ -254,78 +269,115 @@ class MainWindow(QMainWindow):
         save_state(self.state)
 
         if mode == "grid":
-            self.list_widget.setViewMode(QListWidget.IconMode)
+            self.list_widget.setViewMode(QListView.IconMode)
             self.list_widget.setIconSize(QSize(self.thumb_size, self.thumb_size))
-            self.list_widget.setResizeMode(QListWidget.Adjust)
+            self.list_widget.setResizeMode(QListView.Adjust)
             self.list_widget.setGridSize(QSize(self.thumb_size + 32, self.thumb_size + 48))
             self.list_widget.setSpacing(10)
             self.list_widget.setAlternatingRowColors(False)
-            self.list_widget.setUniformItemSizes(False)
+            # tamanho uniforme: o layout não consulta o ícone de cada item (nem pede miniaturas)
+            self.list_widget.setUniformItemSizes(True)
+            self.list_widget.setWordWrap(True)
             self.list_widget.setStyleSheet("")
         else:
-            self.list_widget.setViewMode(QListWidget.ListMode)
+            self.list_widget.setViewMode(QListView.ListMode)
+            self.list_widget.setGridSize(QSize())
             self.list_widget.setIconSize(QSize(28, 28))
             self.list_widget.setSpacing(1)
             self.list_widget.setAlternatingRowColors(True)
             self.list_widget.setUniformItemSizes(True)
             self.list_widget.setStyleSheet("""
-                QListWidget::item { padding: 4px 6px; }
-                QListWidget::item:selected { background: rgba(100,150,255,0.25); }
+                QListView::item { padding: 4px 6px; }
+                QListView::item:selected { background: rgba(100,150,255,0.25); }
             """)
 
         self.act_list.setChecked(mode == "list")
         self.act_grid.setChecked(mode == "grid")
+        self.library.set_thumbs_enabled(mode == "grid")
         self.apply_filter()
 
     # -------- Biblioteca --------
-    def refresh_list(self):
-        self.all_files = self._find_archives(self.library_dir)
-        log.info(f"[UI] total de arquivos encontrados: {len(self.all_files)}")
+    @staticmethod
+    def _gc_caches():
+        """Thread de limpeza na abertura: capas e manifestos de arquivos que não existem mais."""
+        try:
+            THUMB_STORE.gc()
+            gc_manifests(LIBRARY_INDEX.fingerprints())
+        except Exception as e:
+            log.error(f"[UI] falha na limpeza dos caches: {e}")
+
+    def load_library(self):
+        """Mostra na hora o que o índice já conhece, passa a observar as pastas e revarre em segundo plano."""
+        self.library.set_files(*LIBRARY_INDEX.files(self.library_dir))
+        log.info(f"[UI] total de arquivos na biblioteca: {self.library.rowCount()}")
         self.set_view_mode(self.view_mode)
+        self.watcher.watch(self.library_dir, LIBRARY_INDEX.dirs(self.library_dir))
+        self.refresh_list()
+
+    def refresh_list(self, full: bool = False):
+        """Revarre a biblioteca fora da GUI (só as pastas que mudaram, salvo 'full')."""
+        self._request_scan(full=full)
+
+    def refresh_dirs(self, dirs: List[str]):
+        """Relista só as pastas avisadas pelo watcher."""
+        self._request_scan(only=dirs)
+
+    def _request_scan(self, full: bool = False, only: Optional[List[str]] = None):
+        if self._scan is not None:
+            # uma varredura por vez; os pedidos que chegam no meio viram uma só depois
+            pending = self._scan_pending or {"full": False, "only": set()}
+            pending["full"] = pending["full"] or full
+            if only is None:
+                pending["only"] = None
+            elif pending["only"] is not None:
+                pending["only"].update(only)
+            self._scan_pending = pending
+            return
+        th = LibraryScanThread(self.library_dir, full, only)
+        th.updated.connect(lambda diff, root=self.library_dir: self._library_scanned(root, diff))
+        th.finished.connect(self._scan_finished)
+        self._scan = th
+        th.start()
 
-    def _find_archives(self, base_dir: Path) -> List[Path]:
-        exts = {".cbr", ".cbz"}
-        files: List[Path] = []
-        for root, _, names in os.walk(base_dir):
-            for f in names:
-                p = Path(root) / f
-                if p.suffix.lower() in exts:
-                    files.append(p)
-        files.sort(key=lambda p: p.name.lower())
-        return files
+    def _scan_finished(self):
+        self._scan = None
+        if self._scan_pending is not None:
+            pending, self._scan_pending = self._scan_pending, None
+            only = pending["only"]
+            self._request_scan(pending["full"], None if only is None else sorted(only))
+
+    def _library_scanned(self, root: Path, diff: dict):
+        if root != self.library_dir:
+            return  # a pasta mudou no meio da varredura
+        self.watcher.remove_dirs(diff["dirs_removed"])
+        self.watcher.add_dirs(diff["dirs_added"])
+        if not (diff["added"] or diff["removed"] or diff["changed"]):
+            return
+        current = self.list_widget.currentIndex().data(Qt.UserRole)
+        self.library.apply_changes(diff["added"], diff["removed"])
+        self.library.refresh_icons(diff["changed"])
+        log.info(f"[UI] biblioteca: +{len(diff['added'])} -{len(diff['removed'])} "
+                 f"~{len(diff['changed'])} (total {self.library.rowCount()})")
+        if current and not self.list_widget.currentIndex().isValid():
+            # um lote grande vira reset do modelo: devolve a seleção
+            row = self.library.row_of(current)
+            idx = self.library_filter.mapFromSource(self.library.index(row)) if row is not None else None
+            if idx is not None and idx.isValid():
+                self.list_widget.setCurrentIndex(idx)
+                self.list_widget.scrollTo(idx)
+        if self.view_mode == "grid":
+            # capas novas entram no lote de fundo sem recomeçá-lo
+            self.thumbs.extend(self.library_filter.visible(diff["added"] + diff["changed"]))
 
     def apply_filter(self):
-        q = self.search_edit.text().strip().lower()
-        self.list_widget.clear()
-        visible_files: List[Path] = []
-        for p in self.all_files:
-            if not q or q in p.name.lower():
-                it = QListWidgetItem(p.name)
-                it.setToolTip(str(p))
-                it.setData(Qt.UserRole, str(p))
-                if self.view_mode == "grid":
-                    it.setIcon(QIcon.fromTheme("image-x-generic"))
-                else:
-                    it.setIcon(QIcon.fromTheme("text-x-generic"))
-                self.list_widget.addItem(it)
-                visible_files.append(p)
-        log.info(f"[UI] itens visíveis: {len(visible_files)} (modo={self.view_mode})")
-        if self.view_mode == "grid" and visible_files:
-            if getattr(self, "thumb_worker", None) and self.thumb_worker.isRunning():
-                log.info("[UI] cancelando worker anterior")
-                self.thumb_worker.terminate()
-            self.thumb_worker = ThumbnailWorker(visible_files, size=self.thumb_size)
-            self.thumb_worker.produced.connect(self._apply_thumbnail)
-            self.thumb_worker.progress.connect(lambda d, t: log.debug(f"[UI] progresso thumbs: {d}/{t}"))
-            self.thumb_worker.start()
-
-    def _apply_thumbnail(self, filepath: str, icon: QIcon):
-        for i in range(self.list_widget.count()):
-            it = self.list_widget.item(i)
-            if it.data(Qt.UserRole) == filepath:
-                it.setIcon(icon)
-                log.debug(f"[UI] thumbnail aplicada: {Path(filepath).name}")
-                break
+        self.library_filter.set_query(self.search_edit.text())
+        visible = self.library_filter.rowCount()
+        log.info(f"[UI] itens visíveis: {visible} (modo={self.view_mode})")
+        if self.view_mode == "grid" and visible:
+            # lote de fundo: garante as capas no pacote; as da tela chegam por 'thumbnail_wanted'
+            self.thumbs.submit(self.library_filter.paths(), size=self.thumb_size)
+        else:
+            self.thumbs.cancel()
 
     def change_library_dir(self):
         path = QFileDialog.getExistingDirectory(self, "Escolher pasta da biblioteca", str(self.library_dir))
@@ -334,12 +386,12 @@ class MainWindow(QMainWindow):
             self.state["library_dir"] = str(self.library_dir)
             save_state(self.state)
             self._update_right_panel()
-            self.refresh_list()
+            self.load_library()
 
     def open_selected(self):
-        it = self.list_widget.currentItem()
-        if not it: return
-        file_path = Path(it.data(Qt.UserRole))
+        idx = self.list_widget.currentIndex()
+        if not idx.isValid(): return
+        file_path = Path(idx.data(Qt.UserRole))
         if not file_path.exists():
             QMessageBox.warning(self, "Aviso", "Arquivo não encontrado.")
             self.refresh_list(); return
@@ -370,18 +422,9 @@ class MainWindow(QMainWindow):
         if not folder_id:
             QMessageBox.information(self, "OneDrive", "Escolha uma pasta primeiro."); return
         recursive = bool(od.get("include_subfolders", True))
-        dlg = QDialog(self); dlg.setWindowTitle("Sincronizando OneDrive…"); dlg.resize(420,150)
-        v = QVBoxLayout(dlg)
-        v.addWidget(QLabel("Baixando arquivos .cbr/.cbz…"))
-        bar = QProgressBar(); bar.setRange(0,100); v.addWidget(bar)
-        status = QLabel(); status.setWordWrap(True); v.addWidget(status)
-        btns = QDialogButtonBox(QDialogButtonBox.Cancel); v.addWidget(btns)
-        btns.rejected.connect(dlg.reject)
-        th = OneDriveSyncThread(self.od, self.library_dir, folder_id, recursive)
-        th.progress.connect(lambda d,t,msg: (status.setText(msg), bar.setValue(int(d*100/t)) if t else None))
-        th.finished_ok.connect(lambda n: (status.setText(f"Concluído. Novos: {n}"), bar.setValue(100), self.refresh_list()))
-        th.failed.connect(lambda e: status.setText(f"Erro: {e}"))
-        th.start(); dlg.exec_(); th.wait(50); self.refresh_list()
+        th = OneDriveSyncThread(self.od, self.library_dir, folder_id, recursive,
+                                int(self.state.get("sync_workers", SYNC_WORKERS)))
+        self._run_sync("Sincronizando OneDrive…", th)
 
     def logout_onedrive(self):
         self.od.sign_out()
@@ -419,20 +462,85 @@ class MainWindow(QMainWindow):
         if not self.gd.ensure_creds(self):
             QMessageBox.information(self, "Google Drive", "Conecte sua conta primeiro."); return
 
-        dlg = QDialog(self); dlg.setWindowTitle("Sincronizando Google Drive…"); dlg.resize(420,150)
+        th = GDriveSyncThread(self.gd, self.library_dir, folder_id, recursive,
+                              int(self.state.get("sync_workers", SYNC_WORKERS)))
+        self._run_sync("Sincronizando Google Drive…", th)
+
+    def _run_sync(self, title: str, th: SyncEngine):
+        """
+        Diálogo de progresso de uma sincronização: barra pelo total de bytes (ou de
+        arquivos, se a nuvem não informar tamanhos) e uma linha por download em curso.
+        Cancelar pede para a thread parar; ela termina sozinha e a lista é atualizada.
+        """
+        dlg = QDialog(self); dlg.setWindowTitle(title); dlg.resize(420,150)
         v = QVBoxLayout(dlg)
         v.addWidget(QLabel("Baixando arquivos .cbr/.cbz…"))
-        bar = QProgressBar(); bar.setRange(0, 100); v.addWidget(bar)
+        bar = QProgressBar(); bar.setRange(0,100); v.addWidget(bar)
         status = QLabel(); status.setWordWrap(True); v.addWidget(status)
+        files = QLabel(); files.setWordWrap(True); v.addWidget(files)
         btns = QDialogButtonBox(QDialogButtonBox.Cancel); v.addWidget(btns)
-        btns.rejected.connect(dlg.reject)
-
-        th = GDriveSyncThread(self.gd, self.library_dir, folder_id, recursive)
-        th.progress.connect(lambda d,t,msg: (status.setText(msg), bar.setValue(int(d*100/t)) if t else None))
-        th.finished_ok.connect(lambda n: (status.setText(f"Concluído. Novos: {n}"), bar.setValue(100), self.refresh_list()))
-        th.failed.connect(lambda e: status.setText(f"Erro: {e}"))
+        active = {}  # nome -> (bytes, total) dos downloads em curso
+        by_bytes = [False]
+        running = [True]  # a thread é apagada ao terminar: depois disso não se fala mais com ela
+
+        def on_file(name, done, total):
+            if total and done >= total:
+                active.pop(name, None)
+            else:
+                active[name] = (done, total)
+            files.setText("\n".join(
+                f"{n}: {d * 100 // t}%" if t else f"{n}: {d // (1024 * 1024)} MB" for n, (d, t) in active.items()))
+
+        def on_bytes(done, total):
+            if total:
+                by_bytes[0] = True
+                bar.setValue(int(done * 100 / total))
+
+        def on_progress(d, t, msg):
+            status.setText(msg)
+            if t and not by_bytes[0]:
+                bar.setValue(int(d * 100 / t))
+
+        def on_end(text):
+            active.clear(); files.clear()
+            status.setText(text)
+            btns.setStandardButtons(QDialogButtonBox.Close)
+
+        def on_cancel():
+            if running[0]:
+                th.cancel()
+                status.setText("Cancelando… (os downloads parciais continuam na próxima sincronização)")
+                btns.setEnabled(False)
+            else:
+                dlg.reject()
+
+        def on_thread_done():
+            running[0] = False
+            btns.setEnabled(True)
+            if th in self._syncs:
+                self._syncs.remove(th)
+            th.deleteLater()
+            self.refresh_list()
 
-        th.start()
-        dlg.exec_()
-        th.wait(50)
-        self.refresh_list()
+        btns.rejected.connect(on_cancel)
+        dlg.finished.connect(lambda _: running[0] and th.cancel())  # fechou pelo X/Esc: não deixa baixando escondido
+        th.progress.connect(on_progress)
+        th.file_progress.connect(on_file)
+        th.bytes_progress.connect(on_bytes)
+        th.finished_ok.connect(lambda n: (on_end(f"Concluído. Novos: {n}"), bar.setValue(100)))
+        th.cancelled.connect(lambda n: on_end(f"Cancelado. Novos: {n}"))
+        th.failed.connect(lambda e: on_end(f"Erro: {e}"))
+        th.finished.connect(on_thread_done)
+        self._syncs.append(th)
+        th.start(); dlg.exec_()
+
+    def closeEvent(self, e):
+        self.watcher.stop()
+        for th in list(self._syncs):
+            th.cancel()
+            th.wait(5000)
+        if self._scan is not None:
+            self._scan.stop()
+            self._scan.wait(2000)
+        self.thumbs.shutdown()
+        super().closeEvent(e)
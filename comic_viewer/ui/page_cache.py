@@ -0,0 +1,172 @@
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Hashable, List, Optional, Tuple
+
+from PyQt5.QtCore import QSize, QThread, Qt
+from PyQt5.QtGui import QImage, QPixmap
+
+from ..imaging import decode_scaled, image_size
+from ..pages import PageProvider
+
+log = logging.getLogger("page_cache")
+
+# páginas escaladas acima disso são desenhadas em tiles decodificados sob demanda
+# (PageView); a página inteira nunca é decodificada nem entra no ImageLRU
+TILED_MIN_PIXELS = 8_000_000
+
+
+def _cost(obj) -> int:
+    if isinstance(obj, QPixmap):
+        return obj.width() * obj.height() * max(1, obj.depth() // 8)
+    return obj.sizeInBytes()
+
+
+class ImageLRU:
+    """LRU de QImage/QPixmap, limitada pelo total de bytes (thread-safe)."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._items: OrderedDict = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable):
+        with self._lock:
+            img = self._items.get(key)
+            if img is not None:
+                self._items.move_to_end(key)
+            return img
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._items
+
+    def put(self, key: Hashable, img) -> None:
+        size = _cost(img)
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._bytes -= _cost(old)
+            self._items[key] = img
+            self._bytes += size
+            # sempre mantém ao menos o item recém-inserido
+            while self._bytes > self.max_bytes and len(self._items) > 1:
+                _, evicted = self._items.popitem(last=False)
+                self._bytes -= _cost(evicted)
+
+    def discard(self, key: Hashable) -> None:
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._bytes -= _cost(old)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+            self._bytes = 0
+
+
+def page_target(orig: QSize, zoom: int, avail: QSize) -> QSize:
+    """Tamanho final da página: encaixada na área visível (zoom 100) ou original * zoom%."""
+    if zoom != 100:
+        return QSize(max(1, int(orig.width() * zoom / 100.0)), max(1, int(orig.height() * zoom / 100.0)))
+    return orig.scaled(avail, Qt.KeepAspectRatio)
+
+
+def is_tiled(target: QSize) -> bool:
+    return target.width() * target.height() > TILED_MIN_PIXELS
+
+
+def decode_page(provider: PageProvider, index: int, zoom: int, avail: QSize,
+                sizes: Dict[int, QSize]) -> Tuple[QImage, QSize]:
+    """
+    Decodifica a página já no tamanho em que será mostrada (nunca maior que o original).
+    Guarda o tamanho original em 'sizes' e retorna (imagem, tamanho final).
+    """
+    data = provider.read_page(index)
+    orig = image_size(data)
+    if orig.isValid():
+        sizes[index] = orig
+    target = page_target(orig, zoom, avail) if orig.isValid() else avail
+    img, _ = decode_scaled(data, target)
+    return img, target
+
+
+class PagePrefetcher(QThread):
+    """
+    Decodifica em segundo plano as páginas em volta da atual e guarda no ImageLRU,
+    com chave (página, largura, altura) no tamanho em que serão mostradas.
+    Prioriza o sentido de leitura: AHEAD páginas à frente, BEHIND para trás.
+    Páginas que vão ser mostradas em tiles ficam de fora (os tiles saem da página comprimida).
+    """
+
+    AHEAD = 4
+    BEHIND = 1
+
+    def __init__(self, provider: PageProvider, cache: ImageLRU, sizes: Dict[int, QSize], parent=None):
+        super().__init__(parent)
+        self.provider = provider
+        self.cache = cache
+        self.sizes = sizes
+        self._queue: List[int] = []
+        self._view = (100, QSize(800, 600))  # (zoom, área visível)
+        self._cond = threading.Condition()
+        self._stop = False
+
+    def schedule(self, center: int, direction: int, zoom: int, avail: QSize) -> None:
+        total = self.provider.page_count()
+        step = 1 if direction >= 0 else -1
+        targets: List[int] = []
+        for k in range(1, max(self.AHEAD, self.BEHIND) + 1):
+            if k <= self.AHEAD:
+                targets.append(center + step * k)
+            if k <= self.BEHIND:
+                targets.append(center - step * k)
+        with self._cond:
+            self._queue = [i for i in targets if 0 <= i < total]
+            self._view = (zoom, QSize(avail))
+            self._cond.notify_all()
+
+    def stop(self) -> None:
+        with self._cond:
+            self._stop = True
+            self._queue = []
+            self._cond.notify_all()
+
+    def run(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._stop:
+                    self._cond.wait()
+                if self._stop:
+                    return
+                index = self._queue.pop(0)
+                zoom, avail = self._view
+            # páginas ainda não extraídas ficam para o próximo schedule (page_ready)
+            if not self.provider.is_ready(index):
+                continue
+            orig = self.sizes.get(index)
+            if orig is None and zoom > 100:
+                # zoom alto: o cabeçalho diz antes se a página vai em tiles
+                try:
+                    orig = image_size(self.provider.read_page(index))
+                except Exception as e:
+                    log.debug(f"[PREFETCH] falha na página {index}: {e}")
+                    continue
+                if orig.isValid():
+                    self.sizes[index] = orig
+                else:
+                    orig = None
+            if orig is not None:
+                target = page_target(orig, zoom, avail)
+                if is_tiled(target) or (index, target.width(), target.height()) in self.cache:
+                    continue
+            try:
+                img, target = decode_page(self.provider, index, zoom, avail, self.sizes)
+            except Exception as e:
+                log.debug(f"[PREFETCH] falha na página {index}: {e}")
+                continue
+            if img.isNull():
+                continue
+            self.cache.put((index, target.width(), target.height()), img)
@@ -0,0 +1,161 @@
+from typing import Hashable, Optional
+
+from PyQt5.QtCore import QPoint, QRect, QRectF, QSize, Qt
+from PyQt5.QtGui import QColor, QPainter, QPixmap
+from PyQt5.QtWidgets import QAbstractScrollArea
+
+from ..imaging import decode_region
+from .page_cache import ImageLRU
+
+
+class PageView(QAbstractScrollArea):
+    """
+    Área de exibição da página com rolagem.
+    Páginas pequenas são desenhadas como um único pixmap; páginas grandes (zoom alto)
+    são desenhadas em tiles: a view guarda só os bytes comprimidos da página, e cada
+    tile que cruza a área visível é decodificado sozinho (recorte + escala no reader).
+    Os tiles ficam num LRU próprio, então a memória da página fica limitada a ele.
+    """
+
+    TILE = 512
+    BACKGROUND = QColor("#111")
+
+    def __init__(self, tile_cache_bytes: int, parent=None):
+        super().__init__(parent)
+        self.setFocusPolicy(Qt.NoFocus)  # as setas ficam com o ReaderWindow
+        self.setFrameShape(QAbstractScrollArea.NoFrame)
+        self.tiles = ImageLRU(tile_cache_bytes)
+        self._text = ""
+        self._pix: Optional[QPixmap] = None
+        self._data: Optional[bytes] = None  # página comprimida (modo tiles)
+        self._orig = QSize()
+        self._size = QSize()
+        self._key: Hashable = None
+        self._drag_from: Optional[QPoint] = None
+
+    # ---------- conteúdo ----------
+    def show_text(self, text: str) -> None:
+        self._text = text
+        self._pix = None
+        self._data = None
+        self._set_content_size(QSize())
+
+    def show_pixmap(self, pix: QPixmap) -> None:
+        self._text = ""
+        self._pix = pix
+        self._data = None
+        self._set_content_size(pix.size())
+
+    def show_tiled(self, data: bytes, orig: QSize, size: QSize, key: Hashable) -> None:
+        """
+        Mostra a página 'data' (tamanho original 'orig') escalada para 'size', em tiles;
+        'key' identifica a página+zoom no cache.
+        """
+        self._text = ""
+        self._pix = None
+        self._data = data
+        self._orig = QSize(orig)
+        self._key = key
+        self._set_content_size(size)
+
+    def reset_scroll(self) -> None:
+        self.horizontalScrollBar().setValue(0)
+        self.verticalScrollBar().setValue(0)
+
+    def avail_size(self) -> QSize:
+        return self.viewport().size()
+
+    def _set_content_size(self, size: QSize) -> None:
+        # mantém a posição relativa da rolagem quando o tamanho muda (zoom)
+        hbar, vbar = self.horizontalScrollBar(), self.verticalScrollBar()
+        fx = hbar.value() / hbar.maximum() if hbar.maximum() else 0.0
+        fy = vbar.value() / vbar.maximum() if vbar.maximum() else 0.0
+        self._size = QSize(size)
+        self._update_scrollbars()
+        hbar.setValue(int(fx * hbar.maximum()))
+        vbar.setValue(int(fy * vbar.maximum()))
+        self.viewport().update()
+
+    def _update_scrollbars(self) -> None:
+        vp = self.viewport().size()
+        for bar, content, page in ((self.horizontalScrollBar(), self._size.width(), vp.width()),
+                                   (self.verticalScrollBar(), self._size.height(), vp.height())):
+            bar.setRange(0, max(0, content - page))
+            bar.setPageStep(page)
+            bar.setSingleStep(max(20, page // 10))
+
+    # ---------- desenho ----------
+    def _origin(self) -> QPoint:
+        vp = self.viewport().size()
+        w, h = self._size.width(), self._size.height()
+        x = -self.horizontalScrollBar().value() if w > vp.width() else (vp.width() - w) // 2
+        y = -self.verticalScrollBar().value() if h > vp.height() else (vp.height() - h) // 2
+        return QPoint(x, y)
+
+    def _tile(self, tx: int, ty: int) -> QPixmap:
+        key = (self._key, tx, ty)
+        pix = self.tiles.get(key)
+        if pix is not None:
+            return pix
+        t = self.TILE
+        rect = QRect(tx * t, ty * t, t, t) & QRect(QPoint(0, 0), self._size)
+        sx = self._orig.width() / self._size.width()
+        sy = self._orig.height() / self._size.height()
+        src_rect = QRectF(rect.x() * sx, rect.y() * sy, rect.width() * sx, rect.height() * sy).toAlignedRect()
+        src_rect &= QRect(QPoint(0, 0), self._orig)
+        piece = decode_region(self._data, src_rect, rect.size())
+        if piece.isNull():
+            piece = QPixmap(rect.size())
+            piece.fill(self.BACKGROUND)
+            return piece  # não guarda: tenta de novo no próximo desenho
+        pix = QPixmap.fromImage(piece)
+        self.tiles.put(key, pix)
+        return pix
+
+    def paintEvent(self, e):
+        p = QPainter(self.viewport())
+        p.fillRect(self.viewport().rect(), self.BACKGROUND)
+        if self._text:
+            p.setPen(QColor("#ddd"))
+            p.drawText(self.viewport().rect(), Qt.AlignCenter, self._text)
+            return
+        origin = self._origin()
+        if self._pix is not None:
+            p.drawPixmap(origin, self._pix)
+            return
+        if self._data is None or self._size.isEmpty():
+            return
+        # só os tiles que cruzam a área visível
+        visible = QRect(-origin.x(), -origin.y(), self.viewport().width(), self.viewport().height())
+        visible &= QRect(QPoint(0, 0), self._size)
+        t = self.TILE
+        for ty in range(visible.top() // t, visible.bottom() // t + 1):
+            for tx in range(visible.left() // t, visible.right() // t + 1):
+                p.drawPixmap(origin + QPoint(tx * t, ty * t), self._tile(tx, ty))
+
+    def resizeEvent(self, e):
+        super().resizeEvent(e)
+        self._update_scrollbars()
+
+    def scrollContentsBy(self, dx, dy):
+        self.viewport().update()
+
+    # ---------- arrastar para rolar ----------
+    def mousePressEvent(self, e):
+        if e.button() == Qt.LeftButton:
+            self._drag_from = e.pos()
+            self.viewport().setCursor(Qt.ClosedHandCursor)
+        super().mousePressEvent(e)
+
+    def mouseMoveEvent(self, e):
+        if self._drag_from is not None:
+            delta = e.pos() - self._drag_from
+            self._drag_from = e.pos()
+            self.horizontalScrollBar().setValue(self.horizontalScrollBar().value() - delta.x())
+            self.verticalScrollBar().setValue(self.verticalScrollBar().value() - delta.y())
+        super().mouseMoveEvent(e)
+
+    def mouseReleaseEvent(self, e):
+        self._drag_from = None
+        self.viewport().unsetCursor()
+        super().mouseReleaseEvent(e)
@@ -3,15 +3,22 @@ from PyQt5.QtWidgets import (
     QPushButton, QSlider, QMessageBox, QToolBar, QAction,
     QLineEdit, QInputDialog
 )
-from PyQt5.QtCore import Qt, QTimer
+from PyQt5.QtCore import Qt, QTimer, QSize, pyqtSignal
 from PyQt5.QtGui import QPixmap, QIcon, QIntValidator, QKeySequence
 from pathlib import Path
-from typing import List
-from ..extractor import CBRExtractor
+from typing import Dict, Optional
+from ..config import READER_IMAGE_CACHE_BYTES, READER_SCALED_CACHE_BYTES, READER_TILE_CACHE_BYTES
+from ..library_index import LIBRARY_INDEX
+from ..pages import PageProvider, open_page_provider
+from ..imaging import image_size
+from .page_cache import ImageLRU, PagePrefetcher, decode_page, is_tiled, page_target
+from .page_view import PageView
 from ..state import save_state
 
 
 class ReaderWindow(QMainWindow):
+    page_ready = pyqtSignal(int)  # emitido pela thread do provider; entregue na thread da GUI
+
     def __init__(self, file_path: Path, state: dict, parent=None):
         super().__init__(parent)
         self.setWindowTitle(f"CBRReaderPy — {file_path.name}")
@@ -19,12 +26,20 @@ class ReaderWindow(QMainWindow):
 
         self.file_path = file_path
         self.state = state
-        self.images_paths: List[Path] = []
+        self.provider: Optional[PageProvider] = None
+        self.total = 0
         self.current_index = 0  # 0-based
         self.zoom = 100
         self._is_fullscreen = False
+        self._pending_index = -1  # página aguardando extração
+        self._direction = 1  # sentido da última navegação (prefetch)
+        self.images = ImageLRU(READER_IMAGE_CACHE_BYTES)  # (página, largura, altura) -> QImage decodificada
+        self.page_sizes: Dict[int, QSize] = {}  # tamanho original de cada página já lida
+        self.scaled = ImageLRU(READER_SCALED_CACHE_BYTES)  # (página, zoom, largura, altura) -> QPixmap
+        self.prefetcher: Optional[PagePrefetcher] = None
 
         self.setFocusPolicy(Qt.StrongFocus)
+        self.page_ready.connect(self._on_page_ready)
 
         # --- UI ---
         central = QWidget(); self.setCentralWidget(central)
@@ -60,9 +75,7 @@ class ReaderWindow(QMainWindow):
         self.info_label = QLabel("Abrindo…")
         self.info_label.setAlignment(Qt.AlignCenter)
 
-        self.image_label = QLabel()
-        self.image_label.setAlignment(Qt.AlignCenter)
-        self.image_label.setStyleSheet("background-color: #111;")
+        self.page_view = PageView(READER_TILE_CACHE_BYTES)
 
         ctr = QHBoxLayout()
         self.prev_btn = QPushButton("◀︎"); self.next_btn = QPushButton("▶︎")
@@ -101,20 +114,33 @@ class ReaderWindow(QMainWindow):
         ctr.addWidget(self.zoom_label)
 
         v.addWidget(self.info_label)
-        v.addWidget(self.image_label, 1)
+        v.addWidget(self.page_view, 1)
         v.addLayout(ctr)
 
+        # resize e zoom são agrupados num único redesenho adiado
+        self._redraw_timer = QTimer(self)
+        self._redraw_timer.setSingleShot(True)
+        self._redraw_timer.setInterval(60)
+        self._redraw_timer.timeout.connect(self._redraw)
+
         QTimer.singleShot(10, self._open_and_show)
         self.resize(1000, 800)
 
     # ---------- abertura e render ----------
     def _open_and_show(self):
         try:
-            out_dir = CBRExtractor.extract(self.file_path)
-            self.images_paths = CBRExtractor.list_images(out_dir)
-            if not self.images_paths:
+            self.provider = open_page_provider(self.file_path)
+            self.provider.on_page_ready = self.page_ready.emit
+            # dimensões já conhecidas (manifesto) evitam ler o cabeçalho antes de achar no cache
+            for i, (w, h) in self.provider.page_dimensions().items():
+                self.page_sizes[i] = QSize(w, h)
+            self.prefetcher = PagePrefetcher(self.provider, self.images, self.page_sizes, self)
+            self.prefetcher.start()
+            total = self.provider.page_count()
+            if not total:
                 raise RuntimeError("Não encontrei imagens dentro do arquivo.")
-            total = len(self.images_paths)
+            self.total = total
+            LIBRARY_INDEX.set_pages(str(self.file_path), total)
 
             # configura limites dos controles
             self.page_slider.blockSignals(True)
@@ -135,46 +161,143 @@ class ReaderWindow(QMainWindow):
 
     def _render_page(self, index: int):
         """Renderiza a imagem do índice (0-based) e atualiza label + estado."""
+        if index != self.current_index:
+            self.page_view.reset_scroll()
         self.current_index = index
-        total = len(self.images_paths)
-        self.page_label.setText(f"{index+1}/{total}")
+        self.page_label.setText(f"{index+1}/{self.total}")
         # sincroniza o campo de entrada sem disparar retorno
         self.page_input.blockSignals(True)
         self.page_input.setText(str(index + 1))
         self.page_input.blockSignals(False)
 
-        img_path = self.images_paths[index]
-        pix = QPixmap(str(img_path))
-        if pix.isNull():
-            self.image_label.setText("Falha ao carregar a imagem.")
+        # páginas de .cbr chegam em segundo plano; pede prioridade e espera o sinal
+        self.provider.request(index)
+        if not self.provider.is_ready(index):
+            self._pending_index = index
+            self.page_view.show_text("Carregando página…")
             return
+        self._pending_index = -1
 
-        if self.zoom != 100:
-            w = int(pix.width() * (self.zoom/100.0))
-            h = int(pix.height() * (self.zoom/100.0))
-            pix = pix.scaled(w, h, Qt.KeepAspectRatio, Qt.SmoothTransformation)
-        else:
-            avail_w = max(400, self.image_label.width()-20)
-            avail_h = max(300, self.image_label.height()-20)
-            pix = pix.scaled(avail_w, avail_h, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+        self._show_page(index)
+
+        # persiste última página (estado guarda 1-based); só quando ela muda
+        pages = self.state.setdefault("last_page_by_file", {})
+        if pages.get(str(self.file_path)) != index + 1:
+            pages[str(self.file_path)] = index + 1
+            save_state(self.state)
 
-        self.image_label.setPixmap(pix)
+    def _avail(self) -> QSize:
+        vp = self.page_view.avail_size()
+        return QSize(max(400, vp.width()-20), max(300, vp.height()-20))
 
-        # persiste última página (estado guarda 1-based)
-        self.state.setdefault("last_page_by_file", {})[str(self.file_path)] = index + 1
-        save_state(self.state)
+    def _scaled_key(self, index: int):
+        if self.zoom != 100:
+            return (index, self.zoom, 0, 0)
+        avail = self._avail()
+        return (index, self.zoom, avail.width(), avail.height())
+
+    def _schedule_prefetch(self, index: int):
+        if self.prefetcher is not None:
+            self.prefetcher.schedule(index, self._direction, self.zoom, self._avail())
+
+    def _show_page(self, index: int):
+        """Mostra a página já escalada, usando os caches de páginas escaladas e decodificadas."""
+        key = self._scaled_key(index)
+        pix = self.scaled.get(key)
+        if pix is not None:
+            self.page_view.show_pixmap(pix)
+            self._schedule_prefetch(index)
+            return
+
+        # a decodificação já sai no tamanho de exibição (nunca maior que o original)
+        avail = self._avail()
+        img = None
+        data = None
+        orig = self.page_sizes.get(index)
+        if orig is None and self.zoom > 100:
+            # zoom alto sem tamanho conhecido: o cabeçalho diz se a página vai em tiles
+            try:
+                data = self.provider.read_page(index)
+            except Exception:
+                self.page_view.show_text("Falha ao carregar a imagem.")
+                return
+            orig = image_size(data)
+            if orig.isValid():
+                self.page_sizes[index] = orig
+            else:
+                orig = None
+        if orig is not None:
+            target = page_target(orig, self.zoom, avail)
+            if is_tiled(target):
+                # zoom alto: só os tiles visíveis são decodificados, direto da página comprimida
+                try:
+                    data = data if data is not None else self.provider.read_page(index)
+                except Exception:
+                    self.page_view.show_text("Falha ao carregar a imagem.")
+                    return
+                self._schedule_prefetch(index)
+                self.page_view.show_tiled(data, orig, target, (index, self.zoom))
+                return
+            img = self.images.get((index, target.width(), target.height()))
+        if img is None:
+            try:
+                img, target = decode_page(self.provider, index, self.zoom, avail, self.page_sizes)
+            except Exception:
+                img = None
+            if img is None or img.isNull():
+                self.page_view.show_text("Falha ao carregar a imagem.")
+                return
+            self.images.put((index, target.width(), target.height()), img)
+        self._schedule_prefetch(index)
+
+        if img.size() != target:
+            img = img.scaled(target, Qt.IgnoreAspectRatio, Qt.SmoothTransformation)
+        pix = QPixmap.fromImage(img)
+        self.scaled.put(key, pix)
+        self.page_view.show_pixmap(pix)
+
+    def _redraw(self):
+        if self.total and self._pending_index < 0:
+            self._show_page(self.current_index)
+
+    def _on_page_ready(self, index: int):
+        if not self.total:
+            return
+        if index == self._pending_index == self.current_index:
+            self._render_page(index)
+        else:
+            self._schedule_prefetch(self.current_index)
 
     def resizeEvent(self, e):
         super().resizeEvent(e)
-        if self.images_paths:
-            self._render_page(self.current_index)
+        if self.total:
+            self._redraw_timer.start()
+
+    def closeEvent(self, e):
+        if self.prefetcher is not None:
+            self.prefetcher.stop()
+            self.prefetcher.wait()
+            self.prefetcher = None
+        self._redraw_timer.stop()
+        self.images.clear()
+        self.scaled.clear()
+        self.page_view.tiles.clear()
+        if self.provider is not None:
+            self.provider.on_page_ready = None
+            self.provider.save_dimensions({i: (s.width(), s.height()) for i, s in self.page_sizes.items()})
+            self.provider.close()
+            self.provider = None
+            self.total = 0
+        super().closeEvent(e)
 
     # ---------- navegação centralizada ----------
     def _go_to_index(self, index: int):
         """Move para o índice desejado (0-based), sincronizando slider (1-based) sem efeitos colaterais."""
-        if not self.images_paths:
+        if not self.total:
             return
-        index = max(0, min(index, len(self.images_paths) - 1))
+        index = max(0, min(index, self.total - 1))
+        if index != self.current_index:
+            self._direction = 1 if index > self.current_index else -1
         # sincroniza slider sem disparar goto_page
         self.page_slider.blockSignals(True)
         self.page_slider.setValue(index + 1)  # slider é 1-based
@@ -184,29 +307,31 @@ class ReaderWindow(QMainWindow):
 
     # slider -> vai para página (1-based -> 0-based)
     def goto_page(self, val: int):
-        if not self.images_paths:
+        if not self.total:
             return
-        idx = max(0, min(val - 1, len(self.images_paths) - 1))
+        idx = max(0, min(val - 1, self.total - 1))
+        if idx != self.current_index:
+            self._direction = 1 if idx > self.current_index else -1
         self._render_page(idx)
 
     def prev_page(self):
-        if self.images_paths and self.current_index > 0:
+        if self.total and self.current_index > 0:
             self._go_to_index(self.current_index - 1)
 
     def next_page(self):
-        if self.images_paths and self.current_index < len(self.images_paths) - 1:
+        if self.total and self.current_index < self.total - 1:
             self._go_to_index(self.current_index + 1)
 
     def set_zoom(self, val: int):
         self.zoom = val
         self.zoom_label.setText(f"{val}%")
-        if self.images_paths:
-            self._render_page(self.current_index)
+        if self.total:
+            self._redraw_timer.start()
 
     # ---------- “Ir para página” ----------
     def _jump_to_input(self):
         """Enter no campo 'Ir…'."""
-        if not self.images_paths:
+        if not self.total:
             return
         txt = self.page_input.text().strip()
         if not txt:
@@ -215,15 +340,15 @@ class ReaderWindow(QMainWindow):
             page = int(txt)
         except ValueError:
             return
-        total = len(self.images_paths)
+        total = self.total
         page = max(1, min(page, total))
         self._go_to_index(page - 1)
 
     def _prompt_goto(self):
         """Diálogo rápido via atalho (Cmd+G / Ctrl+G)."""
-        if not self.images_paths:
+        if not self.total:
             return
-        total = len(self.images_paths)
+        total = self.total
         cur = self.current_index + 1
         page, ok = QInputDialog.getInt(self, "Ir para página", f"Digite um número de 1 a {total}:", cur, 1, total, 1)
         if ok:
@@ -239,7 +364,7 @@ class ReaderWindow(QMainWindow):
         if key == Qt.Key_Home:
             self._go_to_index(0); return
         if key == Qt.Key_End:
-            self._go_to_index(len(self.images_paths) - 1); return
+            self._go_to_index(self.total - 1); return
         if key in (Qt.Key_F11, Qt.Key_F):
             self.toggle_fullscreen(); return
         if key == Qt.Key_Escape and self._is_fullscreen:
@@ -0,0 +1,146 @@
+import logging
+import threading
+from array import array
+from typing import Dict, List, Optional, Set, Tuple
+
+from PyQt5.QtCore import QModelIndex, QObject
+
+from .library_model import LibraryModel, substring_rows
+
+log = logging.getLogger("search")
+
+
+def _grams(text: str) -> Set[str]:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class SearchIndex(QObject):
+    """
+    Índice de trigramas sobre os nomes normalizados do LibraryModel, usado como
+    'matcher' do LibraryFilter. Cada arquivo ganha um id estável (as linhas mudam com
+    inserções, os ids não); as listas de ids por trigrama ficam em arrays e crescem só
+    no fim. Remoções viram lápides; com muitas, o índice é refeito.
+    Montar 100k nomes leva alguns segundos: roda numa thread depois de cada reset do
+    modelo, e até ficar pronto a busca cai na varredura (como também acontece para
+    consultas curtas, candidatas poucas ou trigramas comuns demais).
+    """
+
+    # acima desta fração do total, percorrer a lista de ids sai mais caro que varrer
+    COMMON_GRAM = 0.125
+    # candidatas (consulta que só cresceu) até este tanto: varre direto
+    NARROW_SCAN_MAX = 20000
+
+    def __init__(self, model: LibraryModel, parent=None):
+        super().__init__(parent)
+        self.model = model
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._ready = False
+        self._pending: List[Tuple[str, str, Optional[str]]] = []  # mudanças durante a montagem
+        self._ids: Dict[str, int] = {}
+        self._paths: List[Optional[str]] = []
+        self._folded: List[str] = []
+        self._grams: Dict[str, array] = {}
+        self._dead = 0
+        model.modelReset.connect(self._rebuild)
+        model.rowsInserted.connect(self._rows_inserted)
+        model.rowsAboutToBeRemoved.connect(self._rows_removing)
+
+    # ---------- manutenção ----------
+    def _rebuild(self) -> None:
+        paths = list(self.model.paths())
+        folded = list(self.model.folded())
+        with self._lock:
+            self._generation += 1
+            generation = self._generation
+            self._ready = False
+            self._pending.clear()
+        threading.Thread(target=self._build, args=(generation, paths, folded),
+                         name="search-index", daemon=True).start()
+
+    def _build(self, generation: int, paths: List[str], folded: List[str]) -> None:
+        grams: Dict[str, array] = {}
+        for i, name in enumerate(folded):
+            for g in _grams(name):
+                ids = grams.get(g)
+                if ids is None:
+                    grams[g] = ids = array("I")
+                ids.append(i)
+        with self._lock:
+            if generation != self._generation:
+                return  # o modelo foi trocado de novo no meio
+            self._paths, self._folded, self._grams = list(paths), list(folded), grams
+            self._ids = {p: i for i, p in enumerate(paths)}
+            self._dead = 0
+            for op, path, name in self._pending:
+                self._apply(op, path, name)
+            self._pending.clear()
+            self._ready = True
+        log.debug(f"[SEARCH] índice pronto: {len(paths)} nomes, {len(grams)} trigramas")
+
+    def _apply(self, op: str, path: str, name: Optional[str]) -> None:
+        # chamado com o lock
+        if op == "del":
+            i = self._ids.pop(path, None)
+            if i is not None:
+                self._paths[i] = None
+                self._dead += 1
+            return
+        if path in self._ids:
+            return
+        i = len(self._paths)
+        self._ids[path] = i
+        self._paths.append(path)
+        self._folded.append(name)
+        for g in _grams(name):
+            ids = self._grams.get(g)
+            if ids is None:
+                self._grams[g] = ids = array("I")
+            ids.append(i)
+
+    def _change(self, ops: List[Tuple[str, str, Optional[str]]]) -> None:
+        with self._lock:
+            if not self._ready:
+                self._pending.extend(ops)
+                return
+            for op in ops:
+                self._apply(*op)
+            too_dead = self._dead > max(1000, len(self._paths) // 4)
+        if too_dead:
+            self._rebuild()
+
+    def _rows_inserted(self, parent: QModelIndex, first: int, last: int) -> None:
+        paths = self.model.paths()[first:last + 1]
+        folded = self.model.folded()[first:last + 1]
+        self._change([("add", p, f) for p, f in zip(paths, folded)])
+
+    def _rows_removing(self, parent: QModelIndex, first: int, last: int) -> None:
+        self._change([("del", p, None) for p in self.model.paths()[first:last + 1]])
+
+    # ---------- busca ----------
+    def match(self, query: str, folded: List[str], candidates: Optional[List[int]]) -> List[int]:
+        """Mesmo contrato de substring_rows; usa os trigramas quando compensa."""
+        if candidates is not None and len(candidates) <= self.NARROW_SCAN_MAX:
+            return substring_rows(query, folded, candidates)
+        rows = self._lookup(query) if len(query) >= 3 else None
+        if rows is None:
+            return substring_rows(query, folded, candidates)
+        if candidates is not None:
+            allowed = set(candidates)
+            rows = [r for r in rows if r in allowed]
+        return rows
+
+    def _lookup(self, query: str) -> Optional[List[int]]:
+        with self._lock:
+            if not self._ready:
+                return None
+            postings = [self._grams.get(g) for g in _grams(query)]
+            if any(ids is None for ids in postings):
+                return []  # algum trigrama não aparece em nome nenhum
+            ids = min(postings, key=len)
+            if len(ids) > len(self._paths) * self.COMMON_GRAM:
+                return None
+            paths, names = self._paths, self._folded
+            hits = [paths[i] for i in ids if paths[i] is not None and query in names[i]]
+        row_of = self.model.row_of
+        return sorted(r for r in map(row_of, hits) if r is not None)
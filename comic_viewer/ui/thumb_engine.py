@@ -0,0 +1,242 @@
+import logging
+import multiprocessing
+import threading
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Deque, Dict, Iterable, List, Optional, Set, Tuple
+
+from PyQt5.QtCore import QObject, pyqtSignal
+
+from ..helper_pool import HELPER_POOL
+from ..thumb_store import THUMB_STORE
+from ..thumbnails import render_thumbnail
+from ..utils import archive_fingerprint
+
+log = logging.getLogger("thumb_engine")
+
+
+def _init_worker() -> None:
+    # o processo já é o auxiliar: lsar/unar rodam direto aqui, sem pool aninhado
+    HELPER_POOL.inline = True
+
+
+def _check_size(size: int) -> None:
+    if size <= 0:
+        raise ValueError(f"Tamanho de miniatura inválido: {size}")
+
+
+class ThumbnailEngine(QObject):
+    """
+    Gera miniaturas num pool de processos (decodificar e reduzir ocupa CPU; com
+    processos, todos os núcleos trabalham). Cada resultado volta como buffer cru
+    (largura, altura, bytes por linha, pixels) pelo sinal 'produced', entregue na
+    thread da GUI, que monta o QIcon. Capas novas voltam também codificadas e são
+    gravadas no THUMB_STORE aqui, no processo principal.
+
+    A fila fica aqui, não no executor: uma thread alimentadora entrega no máximo
+    'IN_FLIGHT' jobs por worker de cada vez (o stat e a consulta ao pacote de cada item
+    saem da thread da GUI). Há duas filas: 'request' (o que a lista está desenhando
+    agora, o mais recente primeiro) devolve a imagem pelo sinal 'produced'; 'submit' é
+    o lote de fundo, que só garante a capa no pacote (itens já guardados nem viram job).
+    Cada chamada traz o tamanho: os pedidos da tela não dependem de já haver um lote.
+    Trocar o lote descarta a fila sem matar nada; jobs em andamento terminam.
+    Caminhos circulam como str: com 100k itens, criar Paths já pesa.
+    """
+
+    IN_FLIGHT = 2
+
+    produced = pyqtSignal(str, object)  # (filepath, RawImage ou None), só para pedidos de 'request'
+    progress = pyqtSignal(int, int)     # done, total do lote de fundo
+
+    def __init__(self, workers: int, parent=None):
+        super().__init__(parent)
+        self.workers = max(1, workers)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._futures: Set[Future] = set()
+        self._lock = threading.Lock()
+        self._wake = threading.Condition(self._lock)
+        self._feeder: Optional[threading.Thread] = None
+        self._closed = False
+        self._generation = 0
+        self._size = 0
+        # pedidos da tela (frente, caminho -> tamanho) e lote de fundo (ordem da lista)
+        self._front: Deque[str] = deque()
+        self._wanted: Dict[str, int] = {}
+        self._order: List[str] = []
+        self._pos = 0
+        self._queued: Set[str] = set()
+        # em andamento: caminho -> é pedido da tela?
+        self._inflight: Dict[str, bool] = {}
+        self._promote: Dict[str, int] = {}
+        self._done = 0
+        self._total = 0
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+            )
+            log.info(f"[ENGINE] pool de miniaturas com {self.workers} processos")
+        return self._executor
+
+    # ---------- filas ----------
+    def _kick(self) -> None:
+        # chamado com o lock
+        if self._feeder is None:
+            self._feeder = threading.Thread(target=self._feed, name="thumb-feeder", daemon=True)
+            self._feeder.start()
+        self._wake.notify()
+
+    def submit(self, files: List[str], size: int) -> None:
+        """Troca o lote de fundo (os itens que ainda não começaram são descartados)."""
+        _check_size(size)
+        with self._lock:
+            self._generation += 1
+            self._size = size
+            self._order = list(files)
+            self._pos = 0
+            self._queued = set(self._order)
+            self._done, self._total = 0, len(self._order)
+            self._kick()
+
+    def extend(self, files: List[str]) -> None:
+        """Acrescenta ao lote de fundo atual (arquivos que apareceram na biblioteca)."""
+        with self._lock:
+            files = [p for p in files if p not in self._queued]
+            if not files or not self._size:
+                return  # sem lote ainda: o primeiro 'submit' já inclui estes
+            self._order.extend(files)
+            self._queued.update(files)
+            self._total += len(files)
+            self._kick()
+
+    def request(self, paths: Iterable[str], size: int) -> None:
+        """Pede a imagem destes itens em 'size' na frente de tudo (os últimos pedidos primeiro)."""
+        _check_size(size)
+        with self._lock:
+            paths = [p for p in paths if self._wanted.get(p) != size]
+            for p in paths:
+                running = self._inflight.get(p)
+                if running is True:
+                    continue  # a imagem já está a caminho
+                if running is False:
+                    self._promote[p] = size  # já está sendo gerado pelo lote de fundo
+                else:
+                    self._wanted[p] = size
+            self._front.extendleft(reversed([p for p in paths if p in self._wanted]))
+            self._kick()
+
+    def cancel(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._order, self._pos = [], 0
+            self._queued.clear()
+            self._front.clear()
+            self._wanted.clear()
+            self._promote.clear()
+
+    def _has_work(self) -> bool:
+        return bool(self._front) or self._pos < len(self._order)
+
+    def _next(self) -> Optional[Tuple[str, bool, int]]:
+        # chamado com o lock: primeiro a tela, depois o lote de fundo
+        while self._front:
+            p = self._front.popleft()
+            size = self._wanted.pop(p, None)
+            if size is not None:
+                self._queued.discard(p)
+                return p, True, size
+        while self._pos < len(self._order):
+            p = self._order[self._pos]
+            self._pos += 1
+            if p in self._queued and p not in self._inflight:
+                self._queued.discard(p)
+                return p, False, self._size
+        return None
+
+    def _feed(self) -> None:
+        """Thread alimentadora: dorme até haver vaga no pool e item na fila."""
+        while True:
+            with self._lock:
+                while not self._closed and (len(self._futures) >= self.workers * self.IN_FLIGHT
+                                            or not self._has_work()):
+                    self._wake.wait()
+                if self._closed:
+                    return
+                item = self._next()
+                if item is None:
+                    continue
+                p, foreground, size = item
+                generation = self._generation
+                self._inflight[p] = foreground
+            try:
+                fid = archive_fingerprint(Path(p))
+                # capa já no pacote: o worker só decodifica e reduz (ou nem há job, no fundo)
+                cached = THUMB_STORE.get(fid, size)
+            except OSError:
+                fid, cached = None, None  # sumiu entre a listagem e agora
+            if fid is None or (cached is not None and not foreground):
+                with self._lock:
+                    self._inflight.pop(p, None)
+                    if not foreground and generation == self._generation:
+                        self._done += 1
+                if fid is None and foreground:
+                    self.produced.emit(p, None)
+                continue
+            with self._lock:
+                if self._closed:
+                    return
+                try:
+                    future = self._pool().submit(render_thumbnail, p, size, cached, foreground)
+                except BrokenProcessPool:
+                    log.warning("[ENGINE] pool quebrado; recriando")
+                    self._executor = None
+                    future = self._pool().submit(render_thumbnail, p, size, cached, foreground)
+                self._futures.add(future)
+            future.add_done_callback(
+                lambda f, p=p, fid=fid, fg=foreground, g=generation: self._finished(f, p, fid, fg, g))
+
+    def _finished(self, future: Future, path: str, fid: str, foreground: bool, generation: int) -> None:
+        # roda numa thread do executor; os sinais chegam à GUI por conexão enfileirada
+        with self._lock:
+            self._futures.discard(future)
+            self._inflight.pop(path, None)
+            self._wake.notify()
+        if future.cancelled():
+            return
+        try:
+            raw, levels = future.result()
+        except Exception as e:
+            log.error(f"[ENGINE] falha gerando miniatura para {Path(path).name}: {e}")
+            raw, levels = None, {}
+        if levels:
+            # só o processo principal escreve no pacote; vale mesmo para lotes já trocados
+            THUMB_STORE.put(fid, Path(path), levels)
+        if foreground:
+            self.produced.emit(path, raw)
+            return
+        with self._lock:
+            if path in self._promote:
+                # a tela pediu enquanto o fundo gerava: agora sai do pacote
+                self._wanted[path] = self._promote.pop(path)
+                self._front.appendleft(path)
+                self._wake.notify()
+            if generation != self._generation:
+                return
+            self._done += 1
+            done, total = self._done, self._total
+        self.progress.emit(done, total)
+
+    def shutdown(self) -> None:
+        self.cancel()
+        with self._lock:
+            self._closed = True
+            self._wake.notify_all()
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+        THUMB_STORE.flush()
@@ -1,4 +1,6 @@
+import hashlib
 import logging
+import unicodedata
 from pathlib import Path
 
 log = logging.getLogger("utils")
@@ -18,3 +20,20 @@ def detect_lsar() -> str:
             return c
     log.warning("lsar NÃO encontrado")
     return ""
+
+def archive_fingerprint(archive: Path) -> str:
+    """Identifica o conteúdo de um arquivo por (caminho, mtime, tamanho)."""
+    st = archive.stat()
+    return fingerprint_of(str(archive.resolve()), st.st_mtime_ns, st.st_size)
+
+def fingerprint_of(resolved_path: str, mtime_ns: int, size: int) -> str:
+    """Mesmo fingerprint de archive_fingerprint, a partir de um stat já feito (varreduras)."""
+    raw = f"{resolved_path}|{mtime_ns}|{size}".encode("utf-8")
+    return hashlib.sha1(raw).hexdigest()
+
+def fold_name(text: str) -> str:
+    """Forma de busca: sem acentos (NFKD sem marcas combinantes) e com casefold ('Ação' -> 'acao')."""
+    text = unicodedata.normalize("NFKD", text)
+    if not text.isascii():
+        text = "".join(c for c in text if not unicodedata.combining(c))
+    return text.casefold()